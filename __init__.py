@@ -16,14 +16,26 @@ bl_info = {
 
 
 
-import bpy
-from . import menu
+try:
+    import bpy
+except ImportError:
+    # not running inside blender, only bpy-free modules
+    # (e.g. shade_plan, dir_index) can be used
+    bpy = None
+
+if bpy is not None:
+    from . import menu
+    from . import handlers
 
 def register():
     menu.register()
+    handlers.register()
     
 def unregister():
+    handlers.unregister()
     menu.unregister()
+    from .prefetch import prefetcher
+    prefetcher.shutdown()
 
 if __name__ == "__main__":
     register()
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+    Behaviour checks of the bpy-free modules, run by `run.py` before the benchmarks.
+
+    Benchmarks only count calls, these pin down results: the examples in docstrings,
+    tie breaking of the matcher, round trips of what is saved to disk. Each check gets
+    `addonModule` (imports an addon module, with the fake bpy installed) and an empty folder.
+"""
+
+import os
+import json
+import traceback
+from pathlib import Path
+from typing import *
+
+CHECKS = {}
+def check(func):
+    CHECKS[func.__name__[len('check_'):]] = func
+    return func
+
+def touch(path: Path) -> Path:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'')
+    return path
+
+@check
+def check_recolor_folders(addonModule, root: Path):
+    parse = addonModule('recolor_index').parseMaterialFolder
+    # the docstring examples
+    assert parse('bloodhound_lgnd_v21_heroknight_rt01_body') == ('bloodhound_lgnd_v21_heroknight', 'rt01', 'body')
+    assert parse('bloodhound_lgnd_v21_heroknight_body') == ('bloodhound_lgnd_v21_heroknight', '', 'body')
+    assert parse('bloodhound_lgnd_v21_heroknight_rt01_body_colpass', {'colpass'}) is None
+    assert parse('body') is None
+
+@check
+def check_match_string(addonModule, root: Path):
+    matchString = addonModule('string_match').matchString
+    # ties go to the first target
+    assert matchString(['abc'], ['abd', 'abe']) == {'abc': 'abd'}
+    assert matchString(['abc'], ['abe', 'abd']) == {'abc': 'abe'}
+    assert matchString(['Body.001', 'body'], ['body', 'gear'], normalize=True) == {'Body.001': 'body', 'body': 'body'}
+    # closest pair first, the other one takes what's left
+    assert matchString(['body2', 'body'], ['body', 'bodz'], one_to_one=True) == {'body2': 'bodz', 'body': 'body'}
+    assert matchString(['body', 'body2', 'gear'], ['body', 'gear', 'helmet'], one_to_one=True) == \
+        {'body': 'body', 'body2': 'helmet', 'gear': 'gear'}
+    # more strings than targets, the rest share
+    assert matchString(['body', 'body2', 'body3'], ['body', 'gear'], one_to_one=True) == \
+        {'body': 'body', 'body2': 'gear', 'body3': 'body'}
+
+@check
+def check_dir_index(addonModule, root: Path):
+    dir_index = addonModule('dir_index')
+    assert dir_index.splitTextureName('bloodhound_lgnd_v20_ascension_body_albedoTexture.png') == \
+        ('bloodhound_lgnd_v20_ascension_body', 'albedoTexture')
+    assert dir_index.splitTextureName('0x53237a2cdd03344e.png') == ('', '0x53237a2cdd03344e')
+
+    image_dir = root / 'images'
+    for name in ['body_albedoTexture.png', 'body_aoTexture.png', 'body_aoTexture.tga', 'gear_albedoTexture.png']:
+        touch(image_dir / name)
+    index = dir_index.DirectoryIndex(root / 'index.json')
+    assert [p.name for p in index.getTextures(image_dir, 'body')] == \
+        ['body_albedoTexture.png', 'body_aoTexture.png', 'body_aoTexture.tga']
+    # a new file changes the folder's mtime, so it's scanned again
+    touch(image_dir / 'body_normalTexture.png')
+    stat = os.stat(image_dir)
+    os.utime(image_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert 'body_normalTexture.png' in [p.name for p in index.getTextures(image_dir, 'body')]
+    assert index.scan_count == 2
+
+    index.save()
+    index = dir_index.DirectoryIndex(root / 'index.json')
+    assert len(index.getTextures(image_dir, 'body')) == 4
+    assert index.scan_count == 0
+
+@check
+def check_shade_plan(addonModule, root: Path):
+    shade_plan = addonModule('shade_plan')
+    CoresNodeAdder = addonModule('node_adder').CoresNodeAdder
+    for name in ['body_albedoTexture.png', 'body_anisoSpecDirTexture.png', 'body_colpass.png', 'gear_albedoTexture.png']:
+        touch(root / name)
+    mat_plan = shade_plan.planMaterialFromTexture('body_mat', root / 'body_albedoTexture.png', 'CoresNodeAdder',
+                                                  CoresNodeAdder.roles.keys())
+    assert mat_plan.ok and mat_plan.mesh_name == 'body'
+    assert [(Path(t.path).name, t.supported) for t in mat_plan.textures] == \
+        [('body_albedoTexture.png', True), ('body_anisoSpecDirTexture.png', True), ('body_colpass.png', False)]
+    # ignored roles are supported (known), but never added
+    assert [t.role for t in mat_plan.plannedTextures(CoresNodeAdder, check_images=False)] == ['albedoTexture']
+
+    bad_plan = shade_plan.planMaterialFromTexture('bad_mat', root / 'noprefix.png', 'CoresNodeAdder', [])
+    assert not bad_plan.ok
+    plan = shade_plan.ShadingPlan([mat_plan, bad_plan])
+    loaded = shade_plan.ShadingPlan.fromJson(plan.toJson())
+    assert [p.toDict() for p in loaded] == [p.toDict() for p in plan]
+
+@check
+def check_farm_manifest(addonModule, root: Path):
+    Manifest = addonModule('farm').Manifest
+    fpath = root / 'work' / 'manifest.json'
+    manifest = Manifest(fpath)
+    manifest.add('a', 'blend', 'a.blend', 'out/a.blend', 'logs/a.log')
+    manifest.update('a', status='done', attempts=1)
+    # adding a known job again (resuming) keeps its state
+    manifest = Manifest(fpath)
+    manifest.add('a', 'blend', 'a.blend', 'out/a.blend', 'logs/a.log')
+    assert manifest.jobs['a']['status'] == 'done' and manifest.jobs['a']['attempts'] == 1
+    assert not fpath.with_suffix('.tmp').exists()
+
+    fpath.write_text(json.dumps({'version': Manifest.VERSION + 1, 'jobs': {}}), encoding='utf-8')
+    try:
+        Manifest(fpath)
+    except Exception:
+        pass
+    else:
+        raise AssertionError('manifest of another version was read')
+
+@check
+def check_batch_report(addonModule, root: Path):
+    BatchReport = addonModule('log').BatchReport
+    report = BatchReport('check')
+    # what the function returns, None if it raised
+    assert report.run('a', lambda: 'mat') == 'mat'
+    assert report.run('b', lambda: 1 / 0) is None
+    assert report.success_ls == ['a'] and [name for name, _ in report.failed_ls] == ['b']
+    assert not report.ok and report.summary() == 'check: 1 succeeded, 1 failed'
+
+def runChecks(addonModule, root: Path) -> List[str]:
+    """
+        Run every check, each in its own folder under `root`. Returns the failures.
+    """
+    failures = []
+    for name, func in CHECKS.items():
+        check_root = root / name
+        check_root.mkdir(parents=True)
+        try:
+            func(addonModule, check_root)
+        except Exception as e:
+            line = traceback.extract_tb(e.__traceback__)[-1].lineno
+            failures.append(f'{name} (checks.py:{line}): {type(e).__name__} {e}'.rstrip())
+    return failures
@@ -0,0 +1,743 @@
+"""
+    In-memory stand-in for `bpy`, just enough to run the shading pipeline outside blender.
+
+    It doesn't render or decode anything. Node trees, links and datablocks are plain
+    python objects, and every call that is expensive in real blender (`nodes.new`,
+    `links.new`, `images.load`, ...) is counted in `calls`, so benchmarks can check
+    both time and how much work is asked from blender.
+
+    Install with `install()` before importing the addon.
+"""
+
+import sys
+import types as _types
+from pathlib import Path
+from collections import Counter
+
+calls = Counter()
+
+# node groups inside the bundled asset .blend files, by file name
+LIBRARY_CATALOG = {
+    'Apex Shader.blend': ['Cores Apex Shader  1.3', 'Pathfinder Emote UV Transform Node'],
+    'Apex_Shader_Plus1.blend': ['Apex Shader+'],
+    'SG_Shader.blend': ['S/G-Blender'],
+}
+
+NODE_TYPES = {
+    'ShaderNodeTexImage': 'TEX_IMAGE',
+    'ShaderNodeGroup': 'GROUP',
+    'ShaderNodeOutputMaterial': 'OUTPUT_MATERIAL',
+    'ShaderNodeBsdfTransparent': 'BSDF_TRANSPARENT',
+    'ShaderNodeMixShader': 'MIX_SHADER',
+    'ShaderNodeMixRGB': 'MIX_RGB',
+    'ShaderNodeTexCoord': 'TEX_COORD',
+    'ShaderNodeValue': 'VALUE',
+    'ShaderNodeSeparateRGB': 'SEPRGB',
+    'ShaderNodeSeparateColor': 'SEPARATE_COLOR',
+}
+
+NODE_OUTPUTS = {
+    'TEX_IMAGE': ['Color', 'Alpha'],
+    'MIX_RGB': ['Color'],
+}
+
+# ---
+
+class IDPropertyMixin:
+    """ Custom properties (`id["key"]`), like blender ID / node """
+    def __getitem__(self, key):
+        return self._props()[key]
+
+    def __setitem__(self, key, value):
+        self._props()[key] = value
+
+    def __delitem__(self, key):
+        del self._props()[key]
+
+    def __contains__(self, key):
+        return key in self._props()
+
+    def get(self, key, default=None):
+        return self._props().get(key, default)
+
+    def keys(self):
+        return self._props().keys()
+
+    def _props(self):
+        if '_id_props' not in self.__dict__:
+            self.__dict__['_id_props'] = {}
+        return self.__dict__['_id_props']
+
+class ID(IDPropertyMixin):
+    def __init__(self, name):
+        self.name = name
+        self.users = 0
+        self.use_fake_user = False
+
+    def __repr__(self):
+        return f"bpy.data.{type(self).__name__.lower()}s['{self.name}']"
+
+    def __setattr__(self, key, value):
+        # renaming moves the ID in its collection, taken names get a `.001` suffix
+        collection = self.__dict__.get('_collection')
+        if key == 'name' and collection is not None and value != self.__dict__.get('name'):
+            del collection.items[self.name]
+            value = collection._uniqueName(value)
+            collection.items[value] = self
+        object.__setattr__(self, key, value)
+
+    def as_pointer(self):
+        return id(self)
+
+    def user_remap(self, new_id):
+        calls['ID.user_remap'] += 1
+        for collection in (data.materials, data.images, data.node_groups, data.objects):
+            for id_ in collection:
+                id_._remap(self, new_id)
+
+    def _remap(self, old_id, new_id):
+        pass
+
+class Socket:
+    def __init__(self, node, name, identifier, is_output):
+        self.node = node
+        self.name = name
+        self.identifier = identifier
+        self.is_output = is_output
+        self.default_value = 0.0
+        self.links = []
+
+    @property
+    def is_linked(self):
+        return bool(self.links)
+
+class SocketCollection:
+    """
+        Sockets by index or name. Unknown names are created on access, since
+        the fake node groups don't know the real shader interfaces.
+
+        Group nodes share the socket names (and so the order) of their node tree,
+        like in blender. Only lookups by name count as `sockets.lookup`, by index is
+        a plain array access.
+    """
+    def __init__(self, node, is_output, names=None):
+        self.node = node
+        self.is_output = is_output
+        self.names = names if names is not None else []
+        self.sockets = []
+
+    def _sync(self):
+        while len(self.sockets) < len(self.names):
+            name = self.names[len(self.sockets)]
+            self.sockets.append(Socket(self.node, name, f'{name}_{len(self.sockets)}', self.is_output))
+
+    def _add(self, name):
+        self._sync()
+        self.names.append(name)
+        self._sync()
+        return self.sockets[-1]
+
+    def _share(self, names):
+        # node tree of a group node set, existing sockets (and their links) stay
+        for name in self.names[len(names):]:
+            names.append(name)
+        self.names = names
+        self._sync()
+
+    def __getitem__(self, key):
+        self._sync()
+        if isinstance(key, int):
+            while len(self.sockets) <= key:
+                self._add(f'Socket_{len(self.sockets)}')
+            return self.sockets[key]
+        calls['sockets.lookup'] += 1
+        for socket in self.sockets:
+            if socket.name == key:
+                return socket
+        return self._add(key)
+
+    def find(self, key):
+        calls['sockets.lookup'] += 1
+        self[key]
+        return self.names.index(key)
+
+    def get(self, key, default=None):
+        self._sync()
+        for socket in self.sockets:
+            if socket.name == key:
+                return socket
+        return default
+
+    def __iter__(self):
+        self._sync()
+        return iter(self.sockets)
+
+    def __len__(self):
+        self._sync()
+        return len(self.sockets)
+
+    def keys(self):
+        self._sync()
+        return [socket.name for socket in self.sockets]
+
+    def values(self):
+        self._sync()
+        return list(self.sockets)
+
+class ColorspaceSettings:
+    def __init__(self):
+        self.name = 'sRGB'
+
+class Node(IDPropertyMixin):
+    def __init__(self, tree, type_name, name):
+        self.id_data = tree
+        self.bl_idname = type_name
+        self.type = NODE_TYPES.get(type_name, type_name.upper())
+        self.name = name
+        self.label = ''
+        self.location = (0.0, 0.0)
+        self.width = 140.0
+        self.hide = False
+        self.mute = False
+        self.image = None
+        self.node_tree = None
+        self.blend_type = 'MIX'
+        self.inputs = SocketCollection(self, False)
+        self.outputs = SocketCollection(self, True)
+
+    def __repr__(self):
+        return f'<Node {self.name} ({self.type})>'
+
+class Link:
+    def __init__(self, from_socket, to_socket):
+        self.from_socket = from_socket
+        self.to_socket = to_socket
+        self.from_node = from_socket.node
+        self.to_node = to_socket.node
+
+class Nodes:
+    def __init__(self, tree):
+        self.tree = tree
+        self.nodes = {}
+
+    def new(self, type):
+        calls['nodes.new'] += 1
+        base = type[len('ShaderNode'):] if type.startswith('ShaderNode') else type
+        name = base
+        i = 0
+        while name in self.nodes:
+            i += 1
+            name = f'{base}.{i:03d}'
+        node = Node(self.tree, type, name)
+        # outputs in blender's order, where code uses them by index
+        for output in NODE_OUTPUTS.get(node.type, ()):
+            node.outputs._add(output)
+        self.nodes[name] = node
+        return node
+
+    def remove(self, node):
+        calls['nodes.remove'] += 1
+        for link in list(self.tree.links):
+            if link.from_node is node or link.to_node is node:
+                self.tree.links.remove(link)
+        if node.image is not None:
+            node.image.users -= 1
+        del self.nodes[node.name]
+
+    def clear(self):
+        calls['nodes.clear'] += 1
+        for node in list(self.nodes.values()):
+            if node.image is not None:
+                node.image.users -= 1
+        self.nodes.clear()
+        self.tree.links.links.clear()
+
+    def get(self, name, default=None):
+        return self.nodes.get(name, default)
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.nodes.values())[key]
+        return self.nodes[key]
+
+    def __iter__(self):
+        return iter(list(self.nodes.values()))
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def values(self):
+        return list(self.nodes.values())
+
+    def items(self):
+        return list(self.nodes.items())
+
+    def keys(self):
+        return list(self.nodes.keys())
+
+class Links:
+    def __init__(self, tree):
+        self.tree = tree
+        self.links = []
+
+    def new(self, from_socket, to_socket):
+        calls['links.new'] += 1
+        # an input socket only has one link
+        for link in list(to_socket.links):
+            self.remove(link)
+        link = Link(from_socket, to_socket)
+        from_socket.links.append(link)
+        to_socket.links.append(link)
+        self.links.append(link)
+        return link
+
+    def remove(self, link):
+        link.from_socket.links.remove(link)
+        link.to_socket.links.remove(link)
+        self.links.remove(link)
+
+    def __iter__(self):
+        return iter(list(self.links))
+
+    def __len__(self):
+        return len(self.links)
+
+class NodeTree(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.nodes = Nodes(self)
+        self.links = Links(self)
+        self.library = None
+        # sockets of group nodes using this tree
+        self.input_names = []
+        self.output_names = []
+
+    def _remap(self, old_id, new_id):
+        _remapNodes(self, old_id, new_id)
+
+# image nodes count as users of their image
+def _setNodeImage(node, image):
+    old = node.__dict__.get('image')
+    if old is not None:
+        old.users -= 1
+    if image is not None:
+        image.users += 1
+    node.__dict__['image'] = image
+
+Node.image = property(lambda self: self.__dict__.get('image'), _setNodeImage)
+
+def _setNodeTree(node, tree):
+    if tree is not None:
+        node.inputs._share(tree.input_names)
+        node.outputs._share(tree.output_names)
+    node.__dict__['node_tree'] = tree
+
+Node.node_tree = property(lambda self: self.__dict__.get('node_tree'), _setNodeTree)
+
+class Image(ID):
+    def __init__(self, name, filepath):
+        super().__init__(name)
+        self.filepath = filepath
+        self.filepath_raw = filepath
+        self.source = 'FILE'
+        self.colorspace_settings = ColorspaceSettings()
+        self.alpha_mode = 'STRAIGHT'
+        self.has_data = False
+        self.is_float = False
+        self.channels = 4
+        self.size = (0, 0)
+        self.packed_file = None
+        self.library = None
+
+    def reload(self):
+        calls['images.reload'] += 1
+
+    def _remap(self, old_id, new_id):
+        pass
+
+def _remapNodes(node_tree, old_id, new_id):
+    # group nodes / image nodes using the old datablock
+    if node_tree is None:
+        return
+    for node in node_tree.nodes:
+        for attr in ('node_tree', 'image'):
+            if node.__dict__.get(attr) is old_id:
+                setattr(node, attr, new_id)
+
+class RNAProperty:
+    def __init__(self, identifier, type, is_readonly=False):
+        self.identifier = identifier
+        self.type = type
+        self.is_readonly = is_readonly
+
+class RNAStruct:
+    """ `bl_rna`, only the properties """
+    def __init__(self, properties):
+        self.properties = [RNAProperty(*prop) for prop in properties]
+
+class Material(ID):
+    bl_rna = RNAStruct([
+        ('name', 'STRING'), ('use_nodes', 'BOOLEAN'), ('use_fake_user', 'BOOLEAN'), ('users', 'INT', True),
+        ('node_tree', 'POINTER', True), ('library', 'POINTER', True), ('blend_method', 'ENUM'),
+        ('shadow_method', 'ENUM'), ('pass_index', 'INT'), ('diffuse_color', 'FLOAT'),
+    ])
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.use_nodes = False
+        self.node_tree = None
+        self.blend_method = 'OPAQUE'
+        self.shadow_method = 'OPAQUE'
+        self.pass_index = 0
+        self.diffuse_color = (0.8, 0.8, 0.8, 1.0)
+        self.library = None
+
+    def __setattr__(self, key, value):
+        if key == 'use_nodes' and value and self.__dict__.get('node_tree') is None:
+            object.__setattr__(self, 'node_tree', NodeTree('Shader Nodetree'))
+        super().__setattr__(key, value)
+
+    def copy(self):
+        # one call in blender, so what is done here to copy doesn't count
+        saved_calls = calls.copy()
+        new = data.materials.new(self.name)
+        new.use_nodes = self.use_nodes
+        new.blend_method = self.blend_method
+        new._props().update(self._props())
+        if self.node_tree is not None:
+            mapping = {}
+            for node in self.node_tree.nodes:
+                new_node = new.node_tree.nodes.new(node.bl_idname)
+                for attr in ['label', 'location', 'width', 'hide', 'mute', 'image', 'node_tree', 'blend_type']:
+                    setattr(new_node, attr, getattr(node, attr))
+                new_node._props().update(node._props())
+                for socket in node.inputs:
+                    new_node.inputs[socket.name].default_value = socket.default_value
+                mapping[node.name] = new_node
+            for link in self.node_tree.links:
+                new.node_tree.links.new(mapping[link.from_node.name].outputs[link.from_socket.name],
+                                        mapping[link.to_node.name].inputs[link.to_socket.name])
+        calls.clear()
+        calls.update(saved_calls)
+        calls['materials.copy'] += 1
+        return new
+
+    def _remap(self, old_id, new_id):
+        _remapNodes(self.node_tree, old_id, new_id)
+
+class MaterialSlot:
+    def __init__(self, obj, idx):
+        self.obj = obj
+        self.idx = idx
+
+    @property
+    def material(self):
+        return self.obj.data.materials[self.idx]
+
+    @material.setter
+    def material(self, mat):
+        self.obj.data.materials[self.idx] = mat
+
+class MeshMaterials(list):
+    def _remapIn(self, old_id, new_id):
+        for i, mat in enumerate(self):
+            if mat is old_id:
+                self[i] = new_id
+
+class Mesh(ID):
+    def __init__(self, name):
+        super().__init__(name)
+        self.materials = MeshMaterials()
+
+class Object(ID):
+    def __init__(self, name, type='MESH', parent=None):
+        super().__init__(name)
+        self.type = type
+        self.parent = parent
+        self.data = Mesh(name) if type == 'MESH' else ID(name)
+        self.active_material_index = 0
+        self.matrix_world = None
+
+    @property
+    def children(self):
+        return tuple(obj for obj in data.objects if obj.parent is self)
+
+    @property
+    def material_slots(self):
+        if self.type != 'MESH':
+            return []
+        return [MaterialSlot(self, i) for i in range(len(self.data.materials))]
+
+    @property
+    def active_material(self):
+        if self.type != 'MESH' or not self.data.materials:
+            return None
+        return self.data.materials[self.active_material_index]
+
+    @active_material.setter
+    def active_material(self, mat):
+        self.data.materials[self.active_material_index] = mat
+
+    def _remap(self, old_id, new_id):
+        if self.type == 'MESH':
+            self.data.materials._remapIn(old_id, new_id)
+
+class RemovedID:
+    """ What an ID becomes when it's removed: like blender, any use of it raises """
+    def __getattribute__(self, key):
+        raise ReferenceError(f'StructRNA has been removed (accessing .{key})')
+
+    def __setattr__(self, key, value):
+        raise ReferenceError(f'StructRNA has been removed (setting .{key})')
+
+    def __getitem__(self, key):
+        raise ReferenceError('StructRNA has been removed')
+
+    def __repr__(self):
+        return '<bpy_struct, removed>'
+
+class DataCollection:
+    def __init__(self, cls):
+        self.cls = cls
+        self.items = {}
+
+    def _uniqueName(self, name):
+        if name not in self.items:
+            return name
+        i = 1
+        while f'{name}.{i:03d}' in self.items:
+            i += 1
+        return f'{name}.{i:03d}'
+
+    def _add(self, item):
+        item.name = self._uniqueName(item.name)
+        self.items[item.name] = item
+        item._collection = self
+        return item
+
+    def new(self, name, *args, **kwargs):
+        calls[f'{self.cls.__name__.lower()}s.new'] += 1
+        return self._add(self.cls(name, *args, **kwargs))
+
+    def get(self, name, default=None):
+        return self.items.get(name, default)
+
+    def remove(self, item):
+        calls[f'{self.cls.__name__.lower()}s.remove'] += 1
+        del self.items[item.name]
+        item._collection = None
+        item.__class__ = RemovedID
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            return list(self.items.values())[key]
+        return self.items[key]
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def __iter__(self):
+        return iter(list(self.items.values()))
+
+    def __len__(self):
+        return len(self.items)
+
+    def keys(self):
+        return list(self.items.keys())
+
+    def values(self):
+        return list(self.items.values())
+
+class Images(DataCollection):
+    def load(self, filepath, check_existing=False):
+        calls['images.load'] += 1
+        if not Path(filepath).is_file():
+            raise RuntimeError(f'Error: Cannot read image file "{filepath}"')
+        if check_existing:
+            for image in self:
+                if image.filepath == filepath:
+                    return image
+        return self._add(Image(Path(filepath).name, filepath))
+
+class _LibraryNames:
+    def __init__(self, names=()):
+        self.node_groups = list(names)
+        self.materials = []
+        self.images = []
+
+class _LibraryContext:
+    def __init__(self, filepath, link):
+        self.filepath = filepath
+        self.link = link
+        self.data_from = _LibraryNames(LIBRARY_CATALOG.get(Path(filepath).name, []))
+        self.data_to = _LibraryNames()
+
+    def __enter__(self):
+        calls['libraries.load'] += 1
+        return self.data_from, self.data_to
+
+    def __exit__(self, *args):
+        # like blender, names requested in data_to are replaced by the loaded datablocks
+        groups = []
+        for name in self.data_to.node_groups:
+            if name is None:
+                continue
+            group = data.node_groups.new(name)
+            if self.link:
+                group.library = data.libraries.find(self.filepath) or data.libraries._add(Library(Path(self.filepath).name, self.filepath))
+            groups.append(group)
+            calls['node_groups.append'] += 1
+        self.data_to.node_groups = groups
+        return False
+
+class Library(ID):
+    def __init__(self, name, filepath):
+        super().__init__(name)
+        self.filepath = filepath
+
+    def reload(self):
+        calls['library.reload'] += 1
+
+class Libraries(DataCollection):
+    def find(self, filepath):
+        return next((lib for lib in self if lib.filepath == filepath), None)
+
+    def load(self, filepath, link=False, relative=False):
+        if not Path(filepath).is_file():
+            raise OSError(f'Cannot read file "{filepath}"')
+        return _LibraryContext(filepath, link)
+
+class BlendData:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.materials = DataCollection(Material)
+        self.images = Images(Image)
+        self.node_groups = DataCollection(NodeTree)
+        self.objects = DataCollection(Object)
+        self.libraries = Libraries(Library)
+        self.filepath = ''
+        self.is_dirty = False
+
+data = BlendData()
+
+# ---
+
+def _abspath(path, start=None, library=None):
+    if path.startswith('//'):
+        base = Path(data.filepath).parent if data.filepath else Path.cwd()
+        return str(base / path[2:])
+    return path
+
+class _Handlers:
+    def __init__(self):
+        self.load_pre = []
+        self.load_post = []
+        self.render_init = []
+        self.render_pre = []
+        self.render_post = []
+        self.render_cancel = []
+        self.render_complete = []
+        self.save_pre = []
+        self.depsgraph_update_post = []
+        self.persistent = lambda func: func
+
+class _Timers:
+    def __init__(self):
+        self.registered = []
+
+    def register(self, func, first_interval=0, persistent=False):
+        self.registered.append(func)
+
+    def is_registered(self, func):
+        return func in self.registered
+
+    def unregister(self, func):
+        self.registered.remove(func)
+
+    def runAll(self):
+        # run registered timers until they all return None, like a blender session would
+        while self.registered:
+            for func in list(self.registered):
+                if func() is None and func in self.registered:
+                    self.registered.remove(func)
+
+class _Struct:
+    """ Placeholder for bpy.types.*, addon classes just subclass them """
+    bl_rna = None
+
+    def report(self, level, message):
+        print(f'[{"/".join(sorted(level))}] {message}')
+
+def _prop(*args, **kwargs):
+    return kwargs.get('default')
+
+def _callableNamespace(name):
+    # bpy.ops.<module>.<op>(), does nothing but counts the call
+    class Namespace:
+        def __getattr__(self, attr):
+            def op(*args, **kwargs):
+                calls[f'ops.{name}.{attr}'] += 1
+                return {'FINISHED'}
+            return op
+    return Namespace()
+
+def _makeModule():
+    bpy = _types.ModuleType('bpy')
+    bpy.data = data
+    bpy.calls = calls
+    bpy.path = _types.SimpleNamespace(abspath=_abspath)
+    bpy.app = _types.SimpleNamespace(
+        handlers=_Handlers(), timers=_Timers(), version=(3, 6, 0), background=True, binary_path='')
+    bpy.types = _types.SimpleNamespace(
+        Operator=_Struct, Menu=_Struct, Panel=_Struct, PropertyGroup=_Struct, AddonPreferences=_Struct,
+        Material=Material, Object=Object, Image=Image, NodeTree=NodeTree, ShaderNodeTree=NodeTree,
+        Node=Node, ID=ID,
+        VIEW3D_MT_object_context_menu=_types.SimpleNamespace(append=lambda f: None, remove=lambda f: None),
+        VIEW3D_MT_pose_context_menu=_types.SimpleNamespace(append=lambda f: None, remove=lambda f: None),
+    )
+    bpy.props = _types.SimpleNamespace(
+        StringProperty=_prop, BoolProperty=_prop, IntProperty=_prop, FloatProperty=_prop,
+        EnumProperty=_prop, PointerProperty=_prop, CollectionProperty=_prop)
+    bpy.utils = _types.SimpleNamespace(register_class=lambda cls: None, unregister_class=lambda cls: None)
+    bpy.ops = _types.SimpleNamespace(wm=_callableNamespace('wm'), import_scene=_callableNamespace('import_scene'))
+    bpy.context = _types.SimpleNamespace(selected_objects=[], active_object=None, scene=None)
+
+    bpy_extras = _types.ModuleType('bpy_extras')
+    io_utils = _types.ModuleType('bpy_extras.io_utils')
+    io_utils.ImportHelper = type('ImportHelper', (), {})
+    io_utils.ExportHelper = type('ExportHelper', (), {})
+    bpy_extras.io_utils = io_utils
+    return bpy, bpy_extras, io_utils
+
+def install():
+    """
+        Put the fake modules in sys.modules. Returns the fake bpy module.
+    """
+    if 'bpy' in sys.modules:
+        return sys.modules['bpy']
+    bpy, bpy_extras, io_utils = _makeModule()
+    sys.modules['bpy'] = bpy
+    # `from bpy.props import ...` needs them as modules
+    for sub_name in ['app', 'path', 'props', 'types', 'utils', 'ops']:
+        sub_module = _types.ModuleType(f'bpy.{sub_name}')
+        sub_module.__dict__.update(vars(getattr(bpy, sub_name)))
+        setattr(bpy, sub_name, sub_module)
+        sys.modules[f'bpy.{sub_name}'] = sub_module
+    sys.modules['bpy.app.handlers'] = bpy.app.handlers
+    sys.modules['bpy_extras'] = bpy_extras
+    sys.modules['bpy_extras.io_utils'] = io_utils
+    return bpy
+
+def reset():
+    """
+        Empty blend data and call counts, like opening a new file.
+    """
+    handlers = sys.modules['bpy'].app.handlers if 'bpy' in sys.modules else None
+    for handler in (handlers.load_pre if handlers else []):
+        handler(None)
+    data.reset()
+    for handler in (handlers.load_post if handlers else []):
+        handler(None)
+    calls.clear()
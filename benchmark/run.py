@@ -0,0 +1,425 @@
+"""
+    Benchmark suite for the shading pipeline, runs outside blender with `fake_bpy`.
+
+        python benchmark/run.py                       # small size, compare with baseline
+        python benchmark/run.py --size medium
+        python benchmark/run.py --update-baseline     # after an intended change
+        python benchmark/run.py --only shade_cores recolor
+        python -m benchmark.run                       # the same, from the addon folder
+
+    Generates synthetic Legion+ / Titanfall export trees in a temp folder, drives
+    `utils` / node adders against the fake bpy and reports time, throughput and
+    bpy call counts (`nodes.new`, `links.new`, `images.load`, ...).
+
+    Behaviour checks of the bpy-free modules (`checks.py`) run first.
+
+    Exits with 1 if a check failed, or a benchmark regressed against `baseline.json`: any bpy
+    call count went up (those are deterministic), or time got slower than the tolerance allows
+    (timing is machine dependent, use --no-time-check on other machines).
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import contextlib
+import tempfile
+import importlib
+from pathlib import Path
+from typing import *
+
+BENCH_DIR = Path(__file__).absolute().parent
+ADDON_DIR = BENCH_DIR.parent
+BASELINE_FILE = BENCH_DIR / 'baseline.json'
+
+# `python -m benchmark.run` puts the addon folder on sys.path, not this one
+if str(BENCH_DIR) not in sys.path:
+    sys.path.insert(0, str(BENCH_DIR))
+
+import fake_bpy
+import synthetic
+import checks
+
+bpy = fake_bpy.install()
+sys.path.insert(0, str(ADDON_DIR.parent))
+addon = importlib.import_module(ADDON_DIR.name)
+
+def addonModule(name: str):
+    return importlib.import_module(f'{addon.__name__}.{name}')
+
+utils = addonModule('utils')
+node_adder = addonModule('node_adder')
+shade_plan = addonModule('shade_plan')
+image_registry = addonModule('image_registry')
+dir_index = addonModule('dir_index')
+prefetch = addonModule('prefetch')
+shader_library = addonModule('shader_library')
+material_template = addonModule('material_template')
+texture_roles = addonModule('texture_roles')
+profiler = addonModule('profiler')
+config = addonModule('config')
+skin_set = addonModule('skin_set')
+
+SIZES = {
+    #           models, meshes, lods, recolors, filler files, titanfall materials
+    'small':  dict(models=4, meshes=6, lods=2, recolors=2, filler=200, titanfall=60),
+    'medium': dict(models=20, meshes=8, lods=3, recolors=3, filler=2000, titanfall=200),
+    'large':  dict(models=40, meshes=8, lods=4, recolors=4, filler=10000, titanfall=1000),
+}
+
+# bpy calls shown in the table
+SHOWN_CALLS = ['nodes.new', 'links.new', 'images.load', 'libraries.load', 'node_groups.append']
+
+class Env:
+    """
+        Synthetic trees shared by all benchmarks, and the timer of the current run.
+    """
+    def __init__(self, root: Path, size: dict):
+        self.root = root
+        self.size = size
+        self.apex_models = synthetic.makeApexTree(root / 'apex', size['models'], size['meshes'],
+                                                  size['recolors'], size['filler'])
+        self.titanfall_dir = root / 'titanfall' / 'materials'
+        self.titanfall_folders = synthetic.makeTitanfallTree(self.titanfall_dir, size['titanfall'])
+        self.seconds = 0.0
+
+    def timed(self):
+        env = self
+
+        class Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *args):
+                env.seconds += time.perf_counter() - self.start
+        return Timer()
+
+def resetSession():
+    """
+        Like starting blender again: no blend data, no cache.
+    """
+    fake_bpy.reset()
+    shader_library.clearShaderLibraries()
+    image_registry.image_registry.clear()
+    image_registry.image_registry.resetStats()
+    dir_index.dir_index.invalidate()
+    prefetch.prefetcher.clear()
+    material_template.material_templates.clear()
+    material_template.material_templates.resetStats()
+    texture_roles.group_sockets.clear()
+    profiler.profiler.enable(False)
+
+# ---
+
+BENCHMARKS = {}
+def benchmark(func):
+    BENCHMARKS[func.__name__[len('bench_'):]] = func
+    return func
+
+@benchmark
+def bench_plan_apex(env: Env) -> int:
+    # bpy-free planning only
+    albedo_ls = [path for model in env.apex_models for path in model['meshes'].values()]
+    roles = node_adder.CoresNodeAdder.roles.keys()
+    with env.timed():
+        plan = shade_plan.ShadingPlan([
+            shade_plan.planMaterialFromTexture(path.stem, path, 'CoresNodeAdder', roles) for path in albedo_ls
+        ])
+        plan.toJson()
+    return len(plan)
+
+def _shadeApex(env: Env, node_adder_cls) -> int:
+    armatures = synthetic.buildApexScene(bpy, env.apex_models, env.size['lods'])
+    with env.timed():
+        result = utils.shadeObjects(armatures, node_adder_cls)
+    assert result['failed'] == 0, result['errors']
+    return result['shaded']
+
+@benchmark
+def bench_shade_cores(env: Env) -> int:
+    return _shadeApex(env, node_adder.CoresNodeAdder)
+
+@benchmark
+def bench_shade_plus(env: Env) -> int:
+    return _shadeApex(env, node_adder.PlusNodeAdder)
+
+@benchmark
+def bench_shade_cores_no_templates(env: Env) -> int:
+    # every material built node by node, to compare with shade_cores
+    config.MATERIAL_TEMPLATES = False
+    try:
+        return _shadeApex(env, node_adder.CoresNodeAdder)
+    finally:
+        config.MATERIAL_TEMPLATES = True
+
+@benchmark
+def bench_shade_cores_profiled(env: Env) -> int:
+    # same as shade_cores_no_templates with the profiler on, its counts must match the real ones
+    config.MATERIAL_TEMPLATES = False
+    profiler.profiler.enable()
+    try:
+        items = _shadeApex(env, node_adder.CoresNodeAdder)
+    finally:
+        config.MATERIAL_TEMPLATES = True
+        profiler.profiler.enable(False)
+    for call in ['nodes.new', 'links.new', 'images.load', 'libraries.load']:
+        assert profiler.profiler.counts[call] == bpy.calls[call], f'profiler counted {call} wrong'
+    assert len([s for s in profiler.profiler.scopes if s['kind'] == 'material']) == items
+    profiler.profiler.toChromeTrace()
+    return items
+
+@benchmark
+def bench_reshade_cores(env: Env) -> int:
+    # second shade of the same scene in the same session
+    armatures = synthetic.buildApexScene(bpy, env.apex_models, env.size['lods'])
+    utils.shadeObjects(armatures, node_adder.CoresNodeAdder)
+    bpy.calls.clear()
+    with env.timed():
+        result = utils.shadeObjects(armatures, node_adder.CoresNodeAdder)
+    return result['shaded'] + result['duplicate'] + result['unchanged']
+
+@benchmark
+def bench_reshade_touched(env: Env) -> int:
+    # second shade after a few textures were edited, only their materials are rebuilt
+    armatures = synthetic.buildApexScene(bpy, env.apex_models, env.size['lods'])
+    utils.shadeObjects(armatures, node_adder.CoresNodeAdder)
+    for model in env.apex_models[:3]:
+        albedo_path = next(iter(model['meshes'].values()))
+        stat = os.stat(albedo_path)
+        os.utime(albedo_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    bpy.calls.clear()
+    with env.timed():
+        result = utils.shadeObjects(armatures, node_adder.CoresNodeAdder)
+    return result['shaded'] + result['duplicate'] + result['unchanged']
+
+@benchmark
+def bench_convert_shader(env: Env) -> int:
+    # A/B of shaders on a shaded scene, Cores -> Plus -> Cores
+    armatures = synthetic.buildApexScene(bpy, env.apex_models, env.size['lods'])
+    utils.shadeObjects(armatures, node_adder.CoresNodeAdder)
+    node_adder.PlusNodeAdder.getShaderNodeGroup()
+    bpy.calls.clear()
+    cnt = 0
+    with env.timed():
+        for node_adder_cls in [node_adder.PlusNodeAdder, node_adder.CoresNodeAdder]:
+            cnt += len(utils.convertObjects(armatures, node_adder_cls).success_ls)
+    return cnt
+
+@benchmark
+def bench_remove_textures(env: Env) -> int:
+    # several roles off every material of a shaded scene, in one pass
+    armatures = synthetic.buildApexScene(bpy, env.apex_models, env.size['lods'])
+    utils.shadeObjects(armatures, node_adder.CoresNodeAdder)
+    bpy.calls.clear()
+    with env.timed():
+        report = utils.removeTextures(armatures, ['opacityMultiplyTexture', 'scatterThicknessTexture', 'aoTexture'])
+    assert report.ok, report.failed_ls
+    return len(report.success_ls)
+
+@benchmark
+def bench_recolor(env: Env) -> int:
+    armatures = synthetic.buildApexScene(bpy, env.apex_models, env.size['lods'])
+    cnt = 0
+    with env.timed():
+        for armature, model in zip(armatures, env.apex_models):
+            for recolor_dir in model['recolor_dirs']:
+                report = utils.recolorArmature(armature, recolor_dir, node_adder.CoresNodeAdder)
+                # the recolor's skin set has exactly the meshes that got it
+                recolored = {name.split(' <- ')[0] for name in report.success_ls}
+                assert set(skin_set.getSkinSets(armature)[skin_set.getActiveSkin(armature)]) == recolored
+                cnt += 1
+    return cnt
+
+@benchmark
+def bench_recolor_variants(env: Env) -> int:
+    armatures = synthetic.buildApexScene(bpy, env.apex_models, env.size['lods'])
+    cnt = 0
+    with env.timed():
+        for armature, model in zip(armatures, env.apex_models):
+            report = utils.recolorArmatureVariants(armature, model['recolor_dirs'][0], node_adder.CoresNodeAdder)
+            cnt += len(report.success_ls)
+    return cnt
+
+@benchmark
+def bench_switch_skin(env: Env) -> int:
+    armatures = synthetic.buildApexScene(bpy, env.apex_models, env.size['lods'])
+    for armature, model in zip(armatures, env.apex_models):
+        utils.recolorArmatureVariants(armature, model['recolor_dirs'][0], node_adder.CoresNodeAdder)
+    bpy.calls.clear()
+    cnt = 0
+    with env.timed():
+        for _ in range(10):
+            for armature in armatures:
+                for name in skin_set.getSkinSets(armature):
+                    cnt += skin_set.switchSkin(armature, name)
+    return cnt
+
+@benchmark
+def bench_match_string(env: Env) -> int:
+    rng = random.Random(0)
+    mat_name_ls = [synthetic.makeMaterialNameVariant(name, rng) for name in env.titanfall_folders]
+    with env.timed():
+        name_map = utils.matchString(mat_name_ls, env.titanfall_folders)
+    return len(name_map)
+
+def referenceMatchString(from_ls: List[str], to_ls: List[str]) -> Dict[str, str]:
+    # the old full Levenshtein matrix for every pair, to compare with `matchString`
+    def distance(s: str, t: str) -> int:
+        d = list(range(len(t) + 1))
+        for i in range(1, len(s) + 1):
+            prev, d[0] = d[0], i
+            for j in range(1, len(t) + 1):
+                prev, d[j] = d[j], min(d[j] + 1, d[j - 1] + 1, prev + (s[i - 1] != t[j - 1]))
+        return d[len(t)]
+
+    result = {}
+    for f_s in from_ls:
+        d_ls = [distance(f_s, t_s) for t_s in to_ls]
+        result[f_s] = to_ls[min(range(len(d_ls)), key=lambda x: d_ls[x])]
+    return result
+
+@benchmark
+def bench_match_string_reference(env: Env) -> int:
+    # same input as match_string (capped, it's slow), result must be the same
+    folder_ls = env.titanfall_folders[:200]
+    rng = random.Random(0)
+    mat_name_ls = [synthetic.makeMaterialNameVariant(name, rng) for name in folder_ls]
+    with env.timed():
+        name_map = referenceMatchString(mat_name_ls, folder_ls)
+    assert name_map == utils.matchString(mat_name_ls, folder_ls), 'matchString differs from reference'
+    return len(name_map)
+
+@benchmark
+def bench_shade_titanfall_matching(env: Env) -> int:
+    armature = synthetic.buildTitanfallScene(bpy, env.titanfall_folders)
+    with env.timed():
+        pairs = utils.matchMaterialDirectories([armature], env.titanfall_dir)
+        for mat, mat_dir_path in pairs:
+            utils.shadeMaterialByDirectory(mat, mat_dir_path, node_adder.TitanfallSGNodeAdder)
+    return len(pairs)
+
+@benchmark
+def bench_shader_groups(env: Env) -> int:
+    # node groups of every adder (Cores and Pathfinder emote share a file), again after opening a new file
+    getters = [node_adder.CoresNodeAdder.getShaderNodeGroup, node_adder.PathfinderEmoteNodeAdder.getShaderNodeGroup,
+               node_adder.PathfinderEmoteNodeAdder.getPathfinderUVTransformNodeGroup,
+               node_adder.PlusNodeAdder.getShaderNodeGroup, node_adder.TitanfallSGNodeAdder.getShaderNodeGroup]
+    with env.timed():
+        for _ in range(2):
+            for getter in getters * 10:
+                getter()
+            fake_bpy.data.reset()
+    return len(getters) * 20
+
+@benchmark
+def bench_dispatch(env: Env) -> int:
+    # NodeAdder.addImageTexture only, every texture of every model into one material
+    texture_ls = [path for model in env.apex_models for path in model['image_dir'].glob(f'{model["skin"]}_*')]
+    mat = bpy.data.materials.new('dispatch')
+    mat.use_nodes = True
+    group_node = mat.node_tree.nodes.new('ShaderNodeGroup')
+    group_node.node_tree = node_adder.CoresNodeAdder.getShaderNodeGroup()
+    mat.node_tree.nodes.new('ShaderNodeOutputMaterial')
+    bpy.calls.clear()
+    with env.timed():
+        for i, path in enumerate(texture_ls):
+            node_adder.CoresNodeAdder.addImageTexture(path, mat, group_node, (0.0, -70.0 * i))
+    return len(texture_ls)
+
+# ---
+
+def runBenchmark(env: Env, name: str, repeat: int, verbose: bool) -> dict:
+    """
+        Best time of `repeat` runs, call counts of the last run.
+    """
+    best = None
+    for _ in range(repeat):
+        resetSession()
+        env.seconds = 0.0
+        # the addon prints a lot, which is not what we want to measure
+        with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+            items = BENCHMARKS[name](env)
+        if best is None or env.seconds < best:
+            best = env.seconds
+    return {'items': items, 'seconds': round(best, 6), 'calls': dict(sorted(bpy.calls.items()))}
+
+def printTable(results: Dict[str, dict]):
+    width = {c: max(16, len(c) + 2) for c in SHOWN_CALLS}
+    header = f'{"benchmark":<28}{"items":>8}{"seconds":>10}{"items/s":>11}' + ''.join(f'{c:>{width[c]}}' for c in SHOWN_CALLS)
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        rate = r['items'] / r['seconds'] if r['seconds'] > 0 else float('inf')
+        print(f'{name:<28}{r["items"]:>8}{r["seconds"]:>10.4f}{rate:>11.1f}'
+              + ''.join(f'{r["calls"].get(c, 0):>{width[c]}}' for c in SHOWN_CALLS))
+
+def compareBaseline(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float, check_time: bool) -> List[str]:
+    regressions = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if r['items'] != base['items']:
+            # different workload, numbers are not comparable
+            continue
+        for call, cnt in r['calls'].items():
+            if cnt > base['calls'].get(call, 0):
+                regressions.append(f'{name}: {call} {base["calls"].get(call, 0)} -> {cnt}')
+        if check_time and r['seconds'] > base['seconds'] * (1 + tolerance):
+            regressions.append(f'{name}: {base["seconds"]:.4f}s -> {r["seconds"]:.4f}s')
+    return regressions
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog='run.py', description='Benchmark the shading pipeline with a fake bpy.')
+    parser.add_argument('--size', choices=list(SIZES), default='small')
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), help='only run these benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=0.5, help='allowed relative slowdown (default 0.5)')
+    parser.add_argument('--no-time-check', action='store_true', help='only compare bpy call counts')
+    parser.add_argument('--update-baseline', action='store_true', help='store results as the new baseline')
+    parser.add_argument('--json', help='also write results to this json file')
+    parser.add_argument('--verbose', action='store_true', help='show output of the addon')
+    args = parser.parse_args(argv)
+
+    root = Path(tempfile.mkdtemp(prefix='apex_shader_bench_'))
+    try:
+        failures = checks.runChecks(addonModule, root / 'checks')
+        if failures:
+            print('FAILED CHECKS:')
+            for failure in failures:
+                print(f'    {failure}')
+            return 1
+        print(f'{len(checks.CHECKS)} checks passed.')
+        env = Env(root, SIZES[args.size])
+        results = {name: runBenchmark(env, name, args.repeat, args.verbose) for name in (args.only or BENCHMARKS)}
+    finally:
+        prefetch.prefetcher.shutdown()
+        shutil.rmtree(root, ignore_errors=True)
+
+    printTable(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    baseline_all = json.loads(BASELINE_FILE.read_text(encoding='utf-8')) if BASELINE_FILE.is_file() else {}
+    if args.update_baseline:
+        baseline_all.setdefault(args.size, {}).update(results)
+        BASELINE_FILE.write_text(json.dumps(baseline_all, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+        print(f'Baseline updated: {BASELINE_FILE}')
+        return 0
+
+    regressions = compareBaseline(results, baseline_all.get(args.size, {}), args.tolerance, not args.no_time_check)
+    if regressions:
+        print('REGRESSIONS:')
+        for regression in regressions:
+            print(f'    {regression}')
+        return 1
+    print('No regression against baseline.' if args.size in baseline_all else 'No baseline for this size.')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
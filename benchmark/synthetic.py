@@ -0,0 +1,138 @@
+"""
+    Synthetic Legion+ export trees and matching fake scenes.
+
+    Texture files are tiny valid PNGs (only signature + IHDR claiming the given
+    resolution), so header reading works but disk usage stays small.
+"""
+
+import zlib
+import random
+import struct
+from pathlib import Path
+from typing import *
+
+APEX_ROLES = [
+    'albedoTexture', 'aoTexture', 'cavityTexture', 'glossTexture', 'normalTexture', 'specTexture',
+    'emissiveTexture', 'opacityMultiplyTexture', 'scatterThicknessTexture', 'anisoSpecDirTexture',
+]
+APEX_MESHES = ['body', 'gear', 'helmet', 'hair', 'eye', 'fur', 'jacket', 'hands']
+TITANFALL_ROLES = ['col', 'nml', 'spc', 'gls', 'ao', 'cav', 'ilm', 'opa']
+IGNORED_PASSES = ['colpass', 'prepass', 'shadow', 'vsm']
+
+def makePNG(width: int = 2048, height: int = 2048, color_type: int = 6) -> bytes:
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    chunk = b'IHDR' + ihdr
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + chunk + struct.pack('>I', zlib.crc32(chunk))
+
+def _roleSubset(rng: random.Random, roles: List[str], min_cnt: int) -> List[str]:
+    # most materials have one of a few common texture sets (e.g. albedo, ao, cavity, gloss, normal, spec),
+    # the rest have any. first role (albedo / col) is always there
+    if rng.random() < 0.75:
+        return roles[:rng.choice([min_cnt, min_cnt + 2])]
+    cnt = rng.randint(min_cnt, len(roles))
+    return [roles[0]] + rng.sample(roles[1:], cnt - 1)
+
+def makeApexTree(root: Path, models: int, meshes: int, recolors: int = 1, filler: int = 0,
+                 seed: int = 0) -> List[dict]:
+    """
+        <root>/<model>/_images/<skin>_<mesh>_<role>.png
+        <root>/materials/<skin>_rt<NN>_<mesh>/<skin>_rt<NN>_<mesh>_<role>.png, plus ignored pass folders
+
+        Returns one dict per model: {'model', 'skin', 'image_dir', 'meshes': {mesh: albedo path}, 'recolor_dirs'}
+    """
+    rng = random.Random(seed)
+    png = makePNG()
+    material_dir = root / 'materials'
+    material_dir.mkdir(parents=True, exist_ok=True)
+    model_ls = []
+    for m in range(models):
+        model = f'pilot_medium_legend{m:03d}_base'
+        skin = f'legend{m:03d}_lgnd_v{m % 30:02d}_skin'
+        image_dir = root / model / '_images'
+        image_dir.mkdir(parents=True, exist_ok=True)
+
+        mesh_map = {}
+        for mesh in APEX_MESHES[:meshes]:
+            for role in _roleSubset(rng, APEX_ROLES, 4):
+                (image_dir / f'{skin}_{mesh}_{role}.png').write_bytes(png)
+            mesh_map[mesh] = image_dir / f'{skin}_{mesh}_albedoTexture.png'
+        for i in range(filler):
+            (image_dir / f'0x{rng.getrandbits(64):016x}.png').write_bytes(png)
+
+        recolor_dirs = []
+        for r in range(1, recolors + 1):
+            for mesh in APEX_MESHES[:meshes]:
+                name = f'{skin}_rt{r:02d}_{mesh}'
+                (material_dir / name).mkdir(exist_ok=True)
+                for role in _roleSubset(rng, APEX_ROLES, 4):
+                    (material_dir / name / f'{name}_{role}.png').write_bytes(png)
+                for pass_name in IGNORED_PASSES:
+                    (material_dir / f'{name}_{pass_name}').mkdir(exist_ok=True)
+            recolor_dirs.append(material_dir / f'{skin}_rt{r:02d}_{APEX_MESHES[0]}')
+
+        model_ls.append({'model': model, 'skin': skin, 'image_dir': image_dir,
+                         'meshes': mesh_map, 'recolor_dirs': recolor_dirs})
+    return model_ls
+
+def makeTitanfallTree(root: Path, materials: int, seed: int = 0) -> List[str]:
+    """
+        <root>/<material>/<material>_<role>.png. Returns material folder names.
+    """
+    rng = random.Random(seed)
+    png = makePNG()
+    parts = ['hero', 'mil', 'imc', 'pilot', 'titan', 'jack', 'body', 'helmet', 'gear', 'arms', 'legs', 'skn']
+    name_ls = []
+    for i in range(materials):
+        name = '_'.join(rng.sample(parts, 4)) + f'_{i:04d}'
+        (root / name).mkdir(parents=True, exist_ok=True)
+        for role in _roleSubset(rng, TITANFALL_ROLES, 3):
+            (root / name / f'{name}_{role}.png').write_bytes(png)
+        name_ls.append(name)
+    return name_ls
+
+def makeMaterialNameVariant(folder_name: str, rng: random.Random) -> str:
+    # material names in imported models are close to, but not always the same as, folder names
+    choice = rng.randint(0, 3)
+    if choice == 0:
+        return folder_name
+    if choice == 1:
+        return folder_name + '.001'
+    if choice == 2:
+        return 'mat_' + folder_name
+    return folder_name.replace('_', '', 1)
+
+# ---
+
+def buildApexScene(bpy, model_ls: List[dict], lods: int = 1) -> List:
+    """
+        One armature per model, `lods` meshes per mesh name sharing one material,
+        each material has one image texture (albedo) like Legion+ imports.
+        Returns armatures.
+    """
+    armatures = []
+    for model in model_ls:
+        armature = bpy.data.objects.new(f'{model["model"]}_skel', type='ARMATURE')
+        for mesh_name, albedo_path in model['meshes'].items():
+            mat = bpy.data.materials.new(f'{model["skin"]}_{mesh_name}')
+            mat.use_nodes = True
+            img_node = mat.node_tree.nodes.new('ShaderNodeTexImage')
+            img_node.image = bpy.data.images.load(str(albedo_path))
+            for lod in range(lods):
+                obj = bpy.data.objects.new(f'{model["model"]}_LOD{lod}_{mesh_name}', type='MESH', parent=armature)
+                obj.data.materials.append(mat)
+        armatures.append(armature)
+    bpy.calls.clear()
+    return armatures
+
+def buildTitanfallScene(bpy, folder_name_ls: List[str], seed: int = 0):
+    """
+        One armature with one mesh per material, material names are variants of folder names.
+    """
+    rng = random.Random(seed)
+    armature = bpy.data.objects.new('titanfall_skel', type='ARMATURE')
+    for i, folder_name in enumerate(folder_name_ls):
+        mat = bpy.data.materials.new(makeMaterialNameVariant(folder_name, rng))
+        obj = bpy.data.objects.new(f'titanfall_mesh_{i}', type='MESH', parent=armature)
+        obj.data.materials.append(mat)
+    bpy.calls.clear()
+    return armature
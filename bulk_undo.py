@@ -0,0 +1,148 @@
+"""
+    Bulk undo mode of the shading / texture removal operators (`config.BULK_UNDO_MODE`).
+
+    An operator with 'UNDO' in bl_options gets one undo step from blender when it finishes.
+    On a big scene that step is the slow part: global undo writes the whole file to memory
+    (like saving an uncompressed .blend) and keeps the changed datablocks of every step.
+    In bulk mode the operators don't have 'UNDO' (ref. `OPERATOR_OPTIONS`), and `BulkUndo`:
+
+    + 'STEP': pushes the undo step itself after the batch (also when a non-blocking batch
+      is cancelled, blender doesn't push for cancelled operators) and times it
+    + 'SNAPSHOT': saves a copy of the .blend to `config.BULK_UNDO_SNAPSHOT_DIR` before the batch
+      instead, reopen it to go back
+    + 'NONE': nothing
+
+    Without an undo step the report only has what was measured: an estimate of the memory
+    the batch's node trees take in an undo step (nodes, sockets and links, the rest of
+    the file global undo writes isn't counted) and the time of the snapshot save, if any.
+
+    The mode can be picked per run with the operators' `undo_mode` property (`undoModeProperty()`),
+    but only when `config.BULK_UNDO_MODE` isn't 'STEP': bl_options are read when the operator is
+    registered, so with 'UNDO' in them blender pushes its step whatever the property says.
+"""
+
+import bpy
+import re
+import time
+from . import config
+from pathlib import Path
+from typing import *
+from .log import logger
+
+UNDO_MODES = ['STEP', 'SNAPSHOT', 'NONE', 'AUTO']
+
+if config.BULK_UNDO_MODE not in UNDO_MODES:
+    raise ValueError(f'Unknown undo mode "{config.BULK_UNDO_MODE}" (config.BULK_UNDO_MODE), use one of {UNDO_MODES}')
+
+# bl_options of operators using `BulkUndo`, blender pushes the undo step only in 'STEP' mode
+OPERATOR_OPTIONS = {'REGISTER', 'UNDO'} if config.BULK_UNDO_MODE == 'STEP' else {'REGISTER'}
+
+# about sizeof() of blender's bNode / bNodeSocket / bNodeLink, what global undo stores of a node tree
+NODE_BYTES = 600
+SOCKET_BYTES = 500
+LINK_BYTES = 64
+
+def undoModeProperty():
+    """
+        The `undo_mode` property of operators using `BulkUndo`, hidden when blender pushes the undo step.
+    """
+    return bpy.props.EnumProperty(
+        name="Undo",
+        items=[
+            ('STEP', 'Undo Step', 'One undo step for the batch'),
+            ('SNAPSHOT', 'Snapshot', f'No undo step, save a copy of the .blend to {config.BULK_UNDO_SNAPSHOT_DIR} before the batch'),
+            ('NONE', 'None', 'No undo step and no snapshot'),
+            ('AUTO', 'Auto', f'Snapshot for batches over {config.BULK_UNDO_THRESHOLD} materials, undo step otherwise'),
+        ],
+        default=config.BULK_UNDO_MODE,
+        options=set() if 'UNDO' not in OPERATOR_OPTIONS else {'HIDDEN'},
+    )
+
+def batchMode(mat_cnt: int, mode: str = None) -> str:
+    """
+        'STEP', 'SNAPSHOT' or 'NONE' for a batch of `mat_cnt` materials in `mode` (default `config.BULK_UNDO_MODE`).
+    """
+    mode = mode or config.BULK_UNDO_MODE
+    if mode == 'AUTO':
+        return 'SNAPSHOT' if mat_cnt > config.BULK_UNDO_THRESHOLD else 'STEP'
+    return mode
+
+def saveSnapshot(name: str) -> Path:
+    """
+        Save a copy of the current file (the open file is unchanged), keeping the
+        `config.BULK_UNDO_SNAPSHOT_KEEP` newest snapshots of it for operation `name`.
+    """
+    snapshot_dir = Path(config.BULK_UNDO_SNAPSHOT_DIR)
+    snapshot_dir.mkdir(parents=True, exist_ok=True)
+    stem = Path(bpy.data.filepath).stem if bpy.data.filepath else 'untitled'
+    path = snapshot_dir / f'{stem}_{name}_{time.strftime("%Y%m%d_%H%M%S")}.blend'
+    bpy.ops.wm.save_as_mainfile(filepath=str(path), copy=True, compress=False)
+
+    # only this file's snapshots of this operation, `{stem}_*` would also match e.g. `{stem}_v2`'s
+    pattern = re.compile(rf'{re.escape(stem)}_{re.escape(name)}_\d{{8}}_\d{{6}}\.blend')
+    old_ls = sorted((p for p in snapshot_dir.iterdir() if pattern.fullmatch(p.name)), key=lambda p: p.stat().st_mtime)
+    for old_path in old_ls[:-config.BULK_UNDO_SNAPSHOT_KEEP]:
+        old_path.unlink()
+    return path
+
+def undoMemory(mat_names: Iterable[str]) -> int:
+    """
+        Estimated bytes an undo step holds for the node trees of the materials. Only counts
+        nodes, sockets and links, nothing is written.
+    """
+    nbytes = 0
+    for mat_name in set(mat_names):
+        mat = bpy.data.materials.get(mat_name)
+        if mat is None or mat.node_tree is None:
+            continue
+        for node in mat.node_tree.nodes:
+            nbytes += NODE_BYTES + SOCKET_BYTES * (len(node.inputs) + len(node.outputs))
+        nbytes += LINK_BYTES * len(mat.node_tree.links)
+    return nbytes
+
+class BulkUndo:
+    """
+        Undo of one batch of an operator using `OPERATOR_OPTIONS` (and `undo_mode: undoModeProperty()`):
+
+            bulk_undo = BulkUndo(self, 'shade', len(mat_names))
+            bulk_undo.begin()
+            ...     # change the materials
+            self.report({'INFO'}, bulk_undo.end(mat_names))
+
+        Materials are given by name, they are looked up after the batch (ref. the RSAStruct bug in TODO.md).
+    """
+    def __init__(self, op: bpy.types.Operator, name: str, mat_cnt: int):
+        self.label = op.bl_label
+        self.name = name
+        self.mat_cnt = mat_cnt
+        # blender pushes the step itself, unless the operator is cancelled
+        self.blender_undo = 'UNDO' in op.bl_options
+        # the operator's `undo_mode` can't turn off blender's step, ref. `undoModeProperty()`
+        self.mode = 'STEP' if self.blender_undo else batchMode(mat_cnt, getattr(op, 'undo_mode', None))
+        self.snapshot_path = None
+        self.snapshot_seconds = None
+
+    def begin(self):
+        if self.mode == 'SNAPSHOT':
+            start = time.perf_counter()
+            self.snapshot_path = saveSnapshot(self.name)
+            self.snapshot_seconds = time.perf_counter() - start
+            logger.summary('[*] Snapshot before %s: %s (%.1fs)', self.label, self.snapshot_path, self.snapshot_seconds)
+
+    def end(self, mat_names: List[str], cancelled: bool = False) -> str:
+        """
+            Push the undo step (or not) after the batch. Returns what was done, for the operator report.
+        """
+        if self.mode == 'STEP':
+            if self.blender_undo and not cancelled:
+                return ''
+            start = time.perf_counter()
+            bpy.ops.ed.undo_push(message=self.label)
+            return f'Undo: 1 step for {self.mat_cnt} materials, pushed in {time.perf_counter() - start:.2f}s'
+
+        # an estimate of the node trees only, the skipped push itself isn't measured
+        msg = f'Undo: no undo step for {self.mat_cnt} materials, their node trees are ~{undoMemory(mat_names) / 2**20:.1f} MiB of undo memory'
+        if self.snapshot_path is not None:
+            msg += f'. Snapshot saved in {self.snapshot_seconds:.2f}s (reopen to undo): {self.snapshot_path}'
+        logger.summary('[*] %s: %s', self.label, msg)
+        return msg
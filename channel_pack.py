@@ -0,0 +1,156 @@
+"""
+    Channel packing of single-channel textures.
+
+    AO, cavity, gloss and opacity maps are grayscale, but blender decodes each into its own
+    RGBA image. With `config.CHANNEL_PACKING`, those of one material are packed into the
+    channels of one image before it is shaded (roles with `RoleSpec.pack_channel`, ref.
+    `texture_roles`), and node adders read them back through a Separate Color node
+    (`NodeAdder.addPackedTexture()`). 4 packed roles are a quarter of the memory, and one
+    image datablock instead of four.
+
+    Packing changes the material's plan: the packed textures are replaced by one texture with
+    a `packed:` role (ref. `texture_roles.packedRole()`), so material templates, proxies and
+    the image registry treat packed images like any other texture.
+
+    Packed images are written once to a disk cache, named by the content hash of the
+    source textures and the channel layout. Only 8 bit textures of the same resolution
+    are packed, anything else is left as it is.
+"""
+
+import os
+import hashlib
+from . import config
+from pathlib import Path
+from typing import *
+from .image_registry import loadImage
+from .prefetch import getImageInfo
+from .shade_plan import MaterialPlan, TexturePlan
+from .texture_roles import PACK_CHANNELS, packChannels, packedRole, parsePackedRole
+from .texture_proxy import readPixels, savePixels
+from .content_hash import content_hashes
+from .profiler import profiler
+from .log import logger
+
+# custom properties of packed images
+PACKED_ROLE_PROP = 'apex_packed_role'       # `packed:` role of the image
+PACKED_SOURCE_PROP = 'apex_packed_source'   # path of one of its source textures
+
+def writePacked(layout: Dict[str, str], packed_path: Path):
+    """
+        Pack the red channel of each source texture (`layout` is channel -> path) into one
+        RGBA image. Missing channels are 1.
+    """
+    import numpy as np
+
+    packed = None
+    for channel, path in layout.items():
+        pixels, _ = readPixels(path)
+        if packed is None:
+            packed = np.ones(pixels.shape, dtype=np.float32)
+        packed[..., PACK_CHANNELS.index(channel)] = pixels[..., 0]
+    savePixels(packed, packed_path)
+
+def removePackedRole(node_tree, img_node, role: str) -> bool:
+    """
+        Unlink one role of a packed image node, the other channels stay.
+        Returns False if the image isn't packed or doesn't have that role.
+    """
+    layout = parsePackedRole(img_node.image.get(PACKED_ROLE_PROP, '')) if img_node.image is not None else None
+    channel = next((channel for channel, r in (layout or {}).items() if r == role), None)
+    if channel is None:
+        return False
+    if channel == 'A':
+        output = img_node.outputs['Alpha']
+    else:
+        separate_nodes = [link.to_node for link in img_node.outputs['Color'].links]
+        if not separate_nodes:
+            return False
+        output = separate_nodes[0].outputs['RGB'.index(channel)]
+    for link in list(output.links):
+        node_tree.links.remove(link)
+    return True
+
+class ChannelPacker:
+    """
+        Packs single-channel textures of material plans, keeps the disk cache.
+    """
+    def __init__(self, enabled: bool = False, cache_dir=None):
+        self.enabled = enabled
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.built = 0
+        self.reused = 0
+
+    @staticmethod
+    def layoutOf(mat_plan: MaterialPlan, node_adder_cls) -> Dict[str, TexturePlan]:
+        """
+            channel -> texture to pack, empty if there's nothing worth packing
+            (less than 2 textures, or textures that can't be packed together).
+        """
+        channels = packChannels(node_adder_cls.roles)
+        layout = {}
+        for texture in mat_plan.plannedTextures(node_adder_cls):
+            channel = channels.get(texture.role)
+            # the same role twice (e.g. .png and .tga), only the first one is packed
+            if channel is None or channel in layout:
+                continue
+            layout[channel] = texture
+        if len(layout) < 2:
+            return {}
+
+        infos = [getImageInfo(texture.path) for texture in layout.values()]
+        if any(info['error'] is not None or info.get('format') is None or info['bit_depth'] != 8 for info in infos):
+            return {}
+        if len(set((info['width'], info['height']) for info in infos)) != 1:
+            return {}
+        return {channel: layout[channel] for channel in PACK_CHANNELS if channel in layout}
+
+    def packedPath(self, layout: Dict[str, str]) -> Path:
+        h = hashlib.sha1()
+        for channel, path in layout.items():
+            h.update(f'{channel}={content_hashes.full(path)};'.encode())
+        digest = h.hexdigest()
+        return self.cache_dir / digest[:2] / f'{digest}.png'
+
+    def pack(self, mat_plan: MaterialPlan, node_adder_cls) -> MaterialPlan:
+        """
+            Plan with the packable textures of `mat_plan` replaced by one packed texture,
+            or `mat_plan` itself if nothing is packed. The packed image is built if it
+            isn't cached yet.
+        """
+        layout = self.layoutOf(mat_plan, node_adder_cls)
+        if not layout:
+            return mat_plan
+        paths = {channel: os.path.realpath(texture.path) for channel, texture in layout.items()}
+        role = packedRole({channel: texture.role for channel, texture in layout.items()})
+
+        packed_path = self.packedPath(paths)
+        if packed_path.is_file():
+            self.reused += 1
+        else:
+            with profiler.stage('channel_pack'):
+                writePacked(paths, packed_path)
+            profiler.count('channel_pack.build')
+            self.built += 1
+            logger.texture('     Packed %s of %s', role, mat_plan.material)
+
+        # what the node needs to know about the image besides its role, kept on the datablock
+        # since materials made from templates copy nodes but get their own images
+        image = loadImage(packed_path)
+        image.alpha_mode = 'CHANNEL_PACKED'
+        image[PACKED_ROLE_PROP] = role
+        image[PACKED_SOURCE_PROP] = next(iter(paths.values()))
+
+        packed_textures = set(map(id, layout.values()))
+        textures = [texture for texture in mat_plan.textures if id(texture) not in packed_textures]
+        textures.append(TexturePlan(str(packed_path), role, True))
+        return MaterialPlan(mat_plan.material, mat_plan.node_adder, mat_plan.directory,
+                            mat_plan.mesh_name, textures, mat_plan.error)
+
+    def resetStats(self):
+        self.built = 0
+        self.reused = 0
+
+    def stats(self) -> dict:
+        return {'built': self.built, 'reused': self.reused}
+
+channel_packer = ChannelPacker(config.CHANNEL_PACKING, config.CHANNEL_PACK_CACHE_DIR)
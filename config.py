@@ -1,5 +1,6 @@
 # basically global variables that can be configged
 
+import tempfile
 from pathlib import Path
 
 # builtin blender fine
@@ -11,4 +12,84 @@ BUILTIN_BLENDER_FILE_SG_SHADER = str(Path(__file__).absolute().parent / 'asset'
 CORE_APEX_SHADER_BLENDER_FILE = BUILTIN_BLENDER_FILE_BASE
 PLUS_APEX_SHADER_BLENDER_FILE = BUILTIN_BLENDER_FILE_PLUS
 PATHFINDER_EMOTE_SHADER_BLENDER_FILE = BUILTIN_BLENDER_FILE_BASE
-SG_TITANFALL_SHADER_BLENDER_FILE = BUILTIN_BLENDER_FILE_SG_SHADER
\ No newline at end of file
+SG_TITANFALL_SHADER_BLENDER_FILE = BUILTIN_BLENDER_FILE_SG_SHADER
+
+# memory cap (in MiB) for images loaded by the image registry. least recently used
+# images that no material uses anymore are removed when exceeded. None for no cap
+IMAGE_REGISTRY_MEMORY_CAP_MB = 4096
+
+# textures with the same content (and role) as an already loaded one, e.g. the same pixels exported
+# under another name for another skin / recolor, use that image instead of loading it again
+IMAGE_DEDUP = False
+
+# json file to persist the texture directory index between sessions
+# (e.g. str(Path.home() / 'apex_shader_dir_index.json')). None to only keep it in memory
+DIRECTORY_INDEX_CACHE_FILE = None
+
+# number of threads reading texture headers / files ahead of node building. 0 to disable
+PREFETCH_WORKERS = 4
+# read whole texture files in prefetch threads so they are in OS page cache when blender loads them
+PREFETCH_WARM_PAGE_CACHE = True
+
+# Legion+ render pass folders in `materials/` that aren't materials, skipped by "Import All Recolors"
+# (folder names ending with `_<pass>`)
+RECOLOR_IGNORED_PASSES = ['colpass', 'prepass', 'shadow', 'tightshadow', 'vsm']
+
+# "Shade By Material Name Matching": ignore case and blender's `.001` suffixes when matching
+MATERIAL_MATCH_NORMALIZE = True
+# "Shade By Material Name Matching": use every folder at most once (as long as there are unused ones)
+MATERIAL_MATCH_ONE_TO_ONE = False
+
+# link shader node groups from the asset .blend files instead of appending them
+# (smaller files, but the node groups can't be edited)
+SHADER_LIBRARY_LINK = False
+# node adders (class names) whose node groups are imported in the background after
+# a file is opened, so the first shade is faster. e.g. ['CoresNodeAdder']. empty to disable
+SHADER_LIBRARY_WARM_UP = []
+# seconds after opening a file before the warm up starts
+SHADER_LIBRARY_WARM_UP_DELAY = 1.0
+
+# proxy mode: shaded materials use downscaled copies of the textures (made once, cached on disk),
+# full resolution is swapped in for final renders. Also toggled by "Texture Proxies" in the menu
+TEXTURE_PROXY = False
+# folder of the proxy cache. files are named by content hash, so it can be shared between projects
+TEXTURE_PROXY_CACHE_DIR = str(Path(tempfile.gettempdir()) / 'apex_shader_proxies')
+# proxy size, 1: 1/2, 2: 1/4, 3: 1/8 of width / height
+TEXTURE_PROXY_LEVEL = 1
+# proxy size of texture roles that differ from TEXTURE_PROXY_LEVEL (less visible ones can be smaller)
+TEXTURE_PROXY_ROLE_LEVELS = {'aoTexture': 2, 'cavityTexture': 2, 'ao': 2, 'cav': 2}
+# memory budget (in MiB) of the proxies of one shading batch, textures are downscaled further
+# (less visible roles first) to fit. None for no budget
+TEXTURE_PROXY_MEMORY_BUDGET_MB = None
+# swap proxies to full resolution while rendering (render_init), and back when it's done
+TEXTURE_PROXY_RENDER_FULL_RESOLUTION = True
+
+# pack single-channel textures of a material (ao, cavity, gloss, opacity) into the channels of
+# one image, read back through a Separate Color node. less memory and fewer images
+CHANNEL_PACKING = False
+# folder of packed images. files are named by content hash of their textures
+CHANNEL_PACK_CACHE_DIR = str(Path(tempfile.gettempdir()) / 'apex_shader_packed')
+
+# materials with the same texture roles (and node adder) as one shaded before get a copy
+# of its nodes with only the images changed, instead of going through the node adder again
+MATERIAL_TEMPLATES = True
+
+# undo of the shading / "Remove Texture" operators. pushing the undo step of a batch that changed
+# thousands of nodes takes seconds and holds the changed data in memory.
+# 'STEP': one undo step per batch (blender default), 'SNAPSHOT': no undo step, a copy of the .blend is
+# saved before the batch instead, 'NONE': no undo step and no snapshot,
+# 'AUTO': 'STEP' for batches up to BULK_UNDO_THRESHOLD materials, 'SNAPSHOT' above.
+# with anything but 'STEP' the operators have no "Adjust Last Operation" panel (it needs blender's undo)
+# and the mode can be changed per run with the operators' `undo_mode` property (default: this one)
+BULK_UNDO_MODE = 'STEP'
+BULK_UNDO_THRESHOLD = 200
+# folder of the snapshots, and how many are kept per .blend file (oldest are deleted)
+BULK_UNDO_SNAPSHOT_DIR = str(Path(tempfile.gettempdir()) / 'apex_shader_snapshots')
+BULK_UNDO_SNAPSHOT_KEEP = 5
+
+# console output: 'quiet' (errors only), 'summary', 'material' (a line per material) or 'texture' (a line per texture)
+LOG_LEVEL = 'material'
+# seconds between console writes, lines are buffered in between
+LOG_FLUSH_INTERVAL = 0.5
+# per-material / per-texture lines written at most per flush, the rest are only counted
+LOG_MAX_LINES_PER_FLUSH = 500
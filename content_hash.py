@@ -0,0 +1,89 @@
+"""
+    Content hashes of texture files.
+
+    Legion+ writes the same pixels under different file names (e.g. the normal map of a
+    skin and of its recolors), so files are compared by content, not by path:
+
+    + `sampled()`: size and a few chunks of the file, cheap, to find candidates
+    + `full()`: the whole file, to confirm candidates are really the same
+
+    Both are kept by (path, size, mtime), a file is only read again if it changed.
+
+    Doesn't use bpy.
+"""
+
+import os
+import hashlib
+from collections import defaultdict
+from typing import *
+
+class ContentHashes:
+    def __init__(self, sample_size: int = 1 << 16, samples: int = 3):
+        self.sample_size = sample_size
+        self.samples = samples
+        self.full_hashes = {}       # (path, size, mtime) -> hash of the whole file
+        self.sampled_hashes = {}    # (path, size, mtime) -> hash of size + samples
+
+    @staticmethod
+    def _key(path: str) -> Tuple[str, int, int]:
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime_ns)
+
+    def full(self, path: str) -> str:
+        key = self._key(path)
+        digest = self.full_hashes.get(key)
+        if digest is None:
+            h = hashlib.sha1()
+            buf = bytearray(1 << 20)
+            view = memoryview(buf)
+            with open(path, 'rb', buffering=0) as f:
+                while True:
+                    n = f.readinto(buf)
+                    if not n:
+                        break
+                    h.update(view[:n])
+            digest = self.full_hashes[key] = h.hexdigest()
+        return digest
+
+    def sampled(self, path: str) -> str:
+        key = self._key(path)
+        digest = self.sampled_hashes.get(key)
+        if digest is None:
+            size = key[1]
+            if size <= self.sample_size * self.samples:
+                # small enough to just read it
+                digest = self.full(path)
+            else:
+                h = hashlib.sha1(str(size).encode())
+                step = (size - self.sample_size) // (self.samples - 1)
+                with open(path, 'rb', buffering=0) as f:
+                    for i in range(self.samples):
+                        f.seek(i * step)
+                        h.update(f.read(self.sample_size))
+                digest = h.hexdigest()
+            self.sampled_hashes[key] = digest
+        return digest
+
+    def findDuplicates(self, paths: Iterable[str]) -> List[List[str]]:
+        """
+            Groups (2 or more) of files with the same content, in the order given.
+            Only files with the same sampled hash are fully hashed.
+        """
+        by_sample = defaultdict(list)
+        for path in paths:
+            by_sample[self.sampled(path)].append(path)
+        groups = []
+        for candidates in by_sample.values():
+            if len(candidates) < 2:
+                continue
+            by_full = defaultdict(list)
+            for path in candidates:
+                by_full[self.full(path)].append(path)
+            groups.extend(group for group in by_full.values() if len(group) > 1)
+        return groups
+
+    def clear(self):
+        self.full_hashes.clear()
+        self.sampled_hashes.clear()
+
+content_hashes = ContentHashes()
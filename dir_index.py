@@ -0,0 +1,144 @@
+"""
+    Cached directory index for texture discovery.
+
+    Legion+ export folders can hold tens of thousands of files, so instead of
+    globbing the folder for every material, each folder is listed once and its
+    files are grouped by `<meshName>` prefix and texture suffix, i.e.
+    `<meshName>_<textureName>.<fileType>`.
+
+    An entry is rescanned when the directory's mtime changes (a file is added,
+    removed or renamed). Optionally the index is persisted to
+    `config.DIRECTORY_INDEX_CACHE_FILE` so it survives between sessions.
+
+    Doesn't use bpy, so it can be used outside of blender.
+"""
+
+import os
+import json
+from . import config
+from .profiler import profiler
+from .log import logger
+from pathlib import Path
+from typing import *
+
+def splitTextureName(name: str) -> Tuple[str, str]:
+    """
+        "bloodhound_lgnd_v20_ascension_body_albedoTexture.png"
+        -> ("bloodhound_lgnd_v20_ascension_body", "albedoTexture")
+
+        Names without `_` have an empty prefix.
+    """
+    stem = name[:name.rindex('.')] if '.' in name else name
+    if '_' not in stem:
+        return '', stem
+    idx = stem.rindex('_')
+    return stem[:idx], stem[idx+1:]
+
+class DirectoryIndex:
+    """
+        Index of directories, each entry is:
+            {
+                'mtime': directory mtime (ns) when scanned,
+                'files': [file names],
+                'dirs': [subdirectory names],
+                'groups': {<meshName>: {<textureName>: [file names]}},
+            }
+    """
+    VERSION = 1
+
+    def __init__(self, persist_path=None):
+        self.persist_path = persist_path
+        self.entries = {}
+        self.scan_count = 0
+        self.dirty = False
+        self.loaded = False
+
+    @staticmethod
+    def _scan(dir_path: str, mtime: int) -> dict:
+        files = []
+        dirs = []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                else:
+                    files.append(entry.name)
+        files.sort()
+        dirs.sort()
+
+        groups = {}
+        for name in files:
+            prefix, suffix = splitTextureName(name)
+            groups.setdefault(prefix, {}).setdefault(suffix, []).append(name)
+        return {'mtime': mtime, 'files': files, 'dirs': dirs, 'groups': groups}
+
+    def get(self, dir_path) -> dict:
+        """
+            Get the index entry of the directory, (re)scanning it if needed.
+        """
+        self.load()
+        dir_path = str(Path(dir_path).absolute())
+        mtime = os.stat(dir_path).st_mtime_ns
+        entry = self.entries.get(dir_path)
+        if entry is None or entry['mtime'] != mtime:
+            with profiler.stage('directory_scan'):
+                entry = self._scan(dir_path, mtime)
+            self.entries[dir_path] = entry
+            self.scan_count += 1
+            self.dirty = True
+        return entry
+
+    def getTextures(self, dir_path, mesh_name: str) -> List[Path]:
+        """
+            All files named `<mesh_name>_<textureName>.*` inside the directory.
+        """
+        groups = self.get(dir_path)['groups'].get(mesh_name, {})
+        return [Path(dir_path) / name for suffix in sorted(groups) for name in groups[suffix]]
+
+    def getTextureGroups(self, dir_path) -> Dict[str, Dict[str, List[str]]]:
+        return self.get(dir_path)['groups']
+
+    def getSubdirs(self, dir_path, prefix: str = '') -> List[Path]:
+        return [Path(dir_path) / name for name in self.get(dir_path)['dirs'] if name.startswith(prefix)]
+
+    def getAnyFile(self, dir_path) -> Optional[Path]:
+        files = self.get(dir_path)['files']
+        return Path(dir_path) / files[0] if files else None
+
+    def invalidate(self, dir_path=None):
+        if dir_path is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(str(Path(dir_path).absolute()), None)
+        self.dirty = True
+
+    def load(self):
+        """
+            Load persisted index once. Broken or outdated cache file is ignored.
+        """
+        if self.loaded:
+            return
+        self.loaded = True
+        if self.persist_path is None or not Path(self.persist_path).is_file():
+            return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                self.entries.update(data['entries'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.error('Cannot load directory index %s: %s', self.persist_path, e)
+
+    def save(self):
+        """
+            Persist the index if `persist_path` is set. No-op otherwise.
+        """
+        if self.persist_path is None or not self.dirty:
+            return
+        tmp_path = str(self.persist_path) + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'entries': self.entries}, f)
+        os.replace(tmp_path, self.persist_path)
+        self.dirty = False
+
+dir_index = DirectoryIndex(config.DIRECTORY_INDEX_CACHE_FILE)
@@ -0,0 +1,227 @@
+"""
+    Local batch shading farm.
+
+    Splits a corpus of .blend files / Legion+ export folders across N blender
+    worker processes, each running `headless.py` (i.e. `utils.shade*`) on one job.
+
+        python farm.py --blender /opt/blender/blender --blends characters/ --workers 8 --shader cores --work-dir farm/
+
+    Every job is tracked in `<work-dir>/manifest.json` (pending / running / done / failed,
+    timing, summary from headless.py), which is rewritten after every state change.
+    Running the same command again resumes: done jobs are skipped, interrupted jobs are
+    run again, and failed jobs are retried only with `--retry-failed`.
+    Blender output of each job is kept in `<work-dir>/logs/`.
+
+    Doesn't need bpy, only a blender executable.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import *
+
+HEADLESS_SCRIPT = Path(__file__).absolute().parent / 'headless.py'
+SUMMARY_PREFIX = 'APEX_SHADER_SUMMARY '
+
+class Manifest:
+    """
+        Job states on disk. Only touched by the main thread.
+    """
+    VERSION = 1
+
+    def __init__(self, fpath: Path):
+        self.fpath = fpath
+        self.jobs = {}
+        if fpath.is_file():
+            with open(fpath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') != self.VERSION:
+                raise Exception(f'Unknown manifest version in {fpath}')
+            self.jobs = data['jobs']
+
+    def save(self):
+        self.fpath.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.fpath.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'jobs': self.jobs}, f, indent=2)
+        os.replace(tmp_path, self.fpath)
+
+    def add(self, job_id: str, kind: str, input_path: str, output_path: str, log_path: str):
+        if job_id not in self.jobs:
+            self.jobs[job_id] = {
+                'kind': kind, 'input': input_path, 'output': output_path, 'log': log_path,
+                'status': 'pending', 'attempts': 0, 'seconds': None, 'returncode': None, 'summary': None,
+            }
+
+    def update(self, job_id: str, **kwargs):
+        self.jobs[job_id].update(kwargs)
+        self.save()
+
+def makeJobName(input_path: Path) -> str:
+    # file name stem is readable, hash keeps names unique across folders
+    digest = hashlib.sha1(str(input_path).encode('utf-8')).hexdigest()[:8]
+    return f'{input_path.stem}_{digest}'
+
+def collectJobs(blends: List[str], import_dirs: List[str], work_dir: Path) -> List[Tuple[str, Path]]:
+    """
+        (kind, input path) of every job. Directories given as blends are searched recursively
+        (skipping our own output in `work_dir`).
+    """
+    job_ls = []
+    for blend in blends:
+        blend = Path(blend).absolute()
+        if blend.is_dir():
+            job_ls += [('blend', p) for p in sorted(blend.glob('**/*.blend')) if work_dir not in p.parents]
+        else:
+            job_ls.append(('blend', blend))
+    for import_dir in import_dirs:
+        job_ls.append(('import', Path(import_dir).absolute()))
+    return job_ls
+
+def runJob(job: dict, blender: str, headless_args: List[str], blender_threads: int, timeout: Optional[float]) -> dict:
+    """
+        Run one blender process for the job. Called from worker threads, returns the fields to update.
+    """
+    cmd = [blender, '-b']
+    if blender_threads:
+        cmd += ['--threads', str(blender_threads)]
+    cmd += ['--python', str(HEADLESS_SCRIPT), '--']
+    cmd += ['--blend' if job['kind'] == 'blend' else '--import-dir', job['input']]
+    if '--save' not in headless_args:
+        cmd += ['--output', job['output']]
+    cmd += headless_args
+
+    start_time = time.perf_counter()
+    with open(job['log'], 'w', encoding='utf-8', errors='replace') as log_f:
+        log_f.write(' '.join(cmd) + '\n\n')
+        log_f.flush()
+        try:
+            proc = subprocess.run(cmd, stdout=log_f, stderr=subprocess.STDOUT, timeout=timeout)
+            returncode = proc.returncode
+        except subprocess.TimeoutExpired:
+            returncode = None
+    seconds = round(time.perf_counter() - start_time, 3)
+
+    # the summary line from headless.py tells us what happened inside blender
+    summary = None
+    with open(job['log'], 'r', encoding='utf-8', errors='replace') as log_f:
+        for line in log_f:
+            if line.startswith(SUMMARY_PREFIX):
+                summary = json.loads(line[len(SUMMARY_PREFIX):])
+
+    if returncode is None:
+        status = 'failed'
+        summary = summary or {'fatal': f'Timeout after {timeout}s'}
+    else:
+        # 1 is "some materials failed", the file is still shaded and saved
+        status = 'done' if returncode in (0, 1) and summary is not None else 'failed'
+    return {'status': status, 'returncode': returncode, 'seconds': seconds, 'summary': summary}
+
+def printStats(manifest: Manifest, wall_seconds: float):
+    jobs = list(manifest.jobs.values())
+    cnt = {status: len([j for j in jobs if j['status'] == status]) for status in ['done', 'failed', 'pending', 'running']}
+    job_seconds = sum(j['seconds'] or 0 for j in jobs if j['status'] == 'done')
+    summaries = [j['summary'] for j in jobs if j['status'] == 'done' and j['summary']]
+    print(f'Jobs: {cnt["done"]} done, {cnt["failed"]} failed, {cnt["pending"] + cnt["running"]} not finished')
+    print(f'Materials: {sum(s.get("shaded", 0) for s in summaries)} shaded, '
+          f'{sum(s.get("failed", 0) for s in summaries)} failed')
+    print(f'Time: {wall_seconds:.1f}s wall, {job_seconds:.1f}s in finished jobs')
+    for job_id, job in manifest.jobs.items():
+        if job['status'] == 'failed':
+            reason = (job['summary'] or {}).get('fatal', f'return code {job["returncode"]}')
+            print(f'    FAILED {job["input"]}: {reason} (log: {job["log"]})')
+
+def makeArgParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='farm.py',
+        description='Shade many .blend files / export folders with multiple blender processes.',
+        epilog='Arguments after `--` are passed to headless.py, e.g. `-- --target armatures`. '
+               'Results go to <work-dir>/output/, or over the .blend files with `-- --save`.')
+    parser.add_argument('--blender', default='blender', help='blender executable')
+    parser.add_argument('--blends', nargs='*', default=[], help='.blend files, or directories to search for them')
+    parser.add_argument('--import-dirs', nargs='*', default=[], help='export folders, each imported into a new file')
+    parser.add_argument('--work-dir', default='apex_shader_farm', help='manifest, logs and output go here')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='number of blender processes (default: half of cpu cores)')
+    parser.add_argument('--blender-threads', type=int, default=0,
+                        help='threads per blender process (default: blender decides)')
+    parser.add_argument('--shader', choices=['cores', 'plus', 'sg'], default='cores')
+    parser.add_argument('--timeout', type=float, default=None, help='seconds before a job is killed')
+    parser.add_argument('--retry-failed', action='store_true', help='run failed jobs again')
+    return parser
+
+def main(argv: List[str]) -> int:
+    if '--' in argv:
+        idx = argv.index('--')
+        argv, headless_args = argv[:idx], argv[idx + 1:]
+    else:
+        headless_args = []
+    parser = makeArgParser()
+    args = parser.parse_args(argv)
+    # each job has its own output file, or `-- --save` saves over the .blend files instead
+    if any(arg == '--output' or arg.startswith('--output=') for arg in headless_args):
+        parser.error('--output is set per job (<work-dir>/output/), use `-- --save` to save over the .blend files instead')
+    save_in_place = '--save' in headless_args
+    if save_in_place and args.import_dirs:
+        parser.error('`-- --save` saves over the opened .blend file, --import-dirs jobs have none')
+    headless_args = ['--shader', args.shader] + headless_args
+
+    work_dir = Path(args.work_dir).absolute()
+    (work_dir / 'logs').mkdir(parents=True, exist_ok=True)
+    (work_dir / 'output').mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(work_dir / 'manifest.json')
+
+    for kind, input_path in collectJobs(args.blends, args.import_dirs, work_dir):
+        name = makeJobName(input_path)
+        output_path = input_path if save_in_place else work_dir / 'output' / f'{name}.blend'
+        manifest.add(str(input_path), kind, str(input_path), str(output_path), str(work_dir / 'logs' / f'{name}.log'))
+
+    # anything still running was interrupted last time
+    todo_status = ['pending', 'running'] + (['failed'] if args.retry_failed else [])
+    todo_ls = [job_id for job_id, job in manifest.jobs.items() if job['status'] in todo_status]
+    for job_id in todo_ls:
+        manifest.jobs[job_id]['status'] = 'pending'
+    manifest.save()
+    print(f'{len(manifest.jobs)} jobs, {len(todo_ls)} to run with {args.workers} workers')
+
+    start_time = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(args.workers) as executor:
+            # only keep `workers` jobs in flight, so `running` in manifest means actually running
+            queue = list(reversed(todo_ls))
+            running = {}
+            finished_cnt = 0
+            while queue or running:
+                while queue and len(running) < args.workers:
+                    job_id = queue.pop()
+                    job = manifest.jobs[job_id]
+                    manifest.update(job_id, status='running', attempts=job['attempts'] + 1)
+                    future = executor.submit(runJob, dict(job), args.blender, headless_args,
+                                             args.blender_threads, args.timeout)
+                    running[future] = job_id
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'status': 'failed', 'summary': {'fatal': f'{type(e).__name__}: {e}'}}
+                    manifest.update(job_id, **result)
+                    finished_cnt += 1
+                    print(f'[{finished_cnt}/{len(todo_ls)}] {result["status"]}: {job_id}')
+    except KeyboardInterrupt:
+        print('Interrupted, run the same command again to resume.')
+    finally:
+        manifest.save()
+        printStats(manifest, time.perf_counter() - start_time)
+
+    return 0 if all(job['status'] == 'done' for job in manifest.jobs.values()) else 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
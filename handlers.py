@@ -0,0 +1,109 @@
+"""
+    Application handlers (`bpy.app.handlers`) of the addon.
+
+    + load_pre: forget datablock names of the file being closed (shader node groups and their sockets, images, template materials)
+    + load_post: optionally import shader node groups in the background (one per timer
+      tick) after a file is opened, so the first shade doesn't wait for library loads.
+      Rebuilds texture proxies missing from the cache
+    + render_init / render_complete / render_cancel: swap texture proxies to full resolution
+      for final renders and back afterwards (ref. `texture_proxy`)
+"""
+
+import bpy
+from bpy.app.handlers import persistent
+from typing import *
+from . import config
+from .node_adder import node_adder_classes, PathfinderEmoteNodeAdder
+from .shader_library import forgetLoadedShaderLibraries
+from .image_registry import image_registry
+from .material_template import material_templates
+from .texture_roles import group_sockets
+from .texture_proxy import texture_proxies
+from .log import logger
+
+def getWarmUpGetters() -> List:
+    getters = [node_adder_classes[name].getShaderNodeGroup for name in config.SHADER_LIBRARY_WARM_UP]
+    if 'PathfinderEmoteNodeAdder' in config.SHADER_LIBRARY_WARM_UP:
+        getters.append(PathfinderEmoteNodeAdder.getPathfinderUVTransformNodeGroup)
+    return getters
+
+_warm_up_queue = []
+def _warmUpStep():
+    # runs in blender's main thread between UI updates, one node group per call
+    if not _warm_up_queue:
+        return None
+    getter = _warm_up_queue.pop(0)
+    try:
+        getter()
+    except Exception as e:
+        logger.error('[!] Shader warm up failed: %s', e)
+        logger.flush()
+    return 0.0 if _warm_up_queue else None
+
+def startWarmUp():
+    if not config.SHADER_LIBRARY_WARM_UP or bpy.app.background:
+        return
+    _warm_up_queue[:] = getWarmUpGetters()
+    if not bpy.app.timers.is_registered(_warmUpStep):
+        bpy.app.timers.register(_warmUpStep, first_interval=config.SHADER_LIBRARY_WARM_UP_DELAY)
+
+@persistent
+def onLoadPre(*args):
+    _warm_up_queue.clear()
+    forgetLoadedShaderLibraries()
+    image_registry.clear()
+    material_templates.clear()
+    group_sockets.clear()
+    texture_proxies.clear()
+
+@persistent
+def onLoadPost(*args):
+    startWarmUp()
+    texture_proxies.repair()
+    texture_proxies.full_resolution = texture_proxies.isFullResolution()
+
+# whether proxies were swapped by onRenderInit, so they're only swapped back then
+_render_swapped = False
+
+@persistent
+def onRenderInit(*args):
+    global _render_swapped
+    if not config.TEXTURE_PROXY_RENDER_FULL_RESOLUTION or texture_proxies.full_resolution:
+        return
+    _render_swapped = texture_proxies.setFullResolution(True) > 0
+
+@persistent
+def onRenderEnd(*args):
+    global _render_swapped
+    if _render_swapped:
+        _render_swapped = False
+        texture_proxies.setFullResolution(False)
+
+render_handlers = (
+    ('render_init', onRenderInit),
+    ('render_complete', onRenderEnd),
+    ('render_cancel', onRenderEnd),
+)
+
+def register():
+    if onLoadPre not in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.append(onLoadPre)
+    if onLoadPost not in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.append(onLoadPost)
+    for name, handler in render_handlers:
+        if handler not in getattr(bpy.app.handlers, name):
+            getattr(bpy.app.handlers, name).append(handler)
+    # a file is already open when the addon is enabled
+    startWarmUp()
+
+def unregister():
+    if onLoadPre in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.remove(onLoadPre)
+    if onLoadPost in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(onLoadPost)
+    for name, handler in render_handlers:
+        if handler in getattr(bpy.app.handlers, name):
+            getattr(bpy.app.handlers, name).remove(handler)
+    _warm_up_queue.clear()
+    if bpy.app.timers.is_registered(_warmUpStep):
+        bpy.app.timers.unregister(_warmUpStep)
@@ -0,0 +1,229 @@
+"""
+    Headless (command line) batch shading.
+
+    Run with blender in background mode (arguments for this script go after `--`):
+
+        blender -b character.blend --python <addon_dir>/headless.py -- --shader cores --output shaded.blend
+        blender -b --python <addon_dir>/headless.py -- --import-dir exported_files/models --shader plus --output out.blend
+
+    or with the `bpy` pip module:
+
+        python <addon_dir>/headless.py --blend character.blend --shader sg --material-dir materials/ --save
+
+    Shades everything in the target selection without relying on UI state
+    (selection, active object, menus), saves the result and prints a machine
+    readable summary line:
+
+        APEX_SHADER_SUMMARY {"ok": true, "objects": 3, "shaded": 12, ...}
+
+    Exit code is 0 if every material is shaded, 1 if some failed, 2 on errors
+    that stopped the whole run (e.g. file not found).
+
+    With `--profile`, time of each shading stage, bpy calls and memory are
+    printed and added to the summary (ref. `profiler`).
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import importlib
+from pathlib import Path
+from typing import *
+
+SUMMARY_PREFIX = 'APEX_SHADER_SUMMARY '
+
+# model importer operators we know of, (bpy.ops.import_scene.<name>, file extension)
+IMPORTERS = [
+    ('semodel', '.semodel'),
+    ('cast', '.cast'),
+]
+
+def makeArgParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='headless.py',
+        description='Batch shade Apex Legends / Titanfall models without blender UI.')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--blend', help='.blend file to open (default: the file blender was started with)')
+    source.add_argument('--import-dir', help='import every model (.semodel / .cast) in this directory into a new file')
+    parser.add_argument('--shader', choices=['cores', 'plus', 'sg'], default='cores',
+                        help='cores: Cores Apex Shader, plus: Apex Shader Plus 1, sg: Titanfall S/G shader')
+    parser.add_argument('--target', choices=['all', 'armatures', 'meshes'], default='all',
+                        help='all: armatures and meshes without armature parent (default)')
+    parser.add_argument('--objects', nargs='+', metavar='NAME', help='only shade these objects (overrides --target)')
+    parser.add_argument('--material-dir',
+                        help='shade by matching material names to subfolders of this directory '
+                             '(like "Shade By Material Name Matching") instead of using image textures in materials')
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--output', help='save result as this .blend file')
+    output.add_argument('--save', action='store_true', help='save result over the opened .blend file')
+    parser.add_argument('--summary', help='also write the json summary to this file')
+    parser.add_argument('--log-level', choices=['quiet', 'summary', 'material', 'texture'],
+                        help='console output, default is config.LOG_LEVEL (ref. log.py)')
+    parser.add_argument('--force', action='store_true',
+                        help='also shade materials whose textures didn\'t change since they were shaded (ref. shade_fingerprint)')
+    parser.add_argument('--proxy', action='store_true',
+                        help='shade with downscaled texture proxies (ref. texture_proxy), stats are added to the summary as "proxies"')
+    parser.add_argument('--pack', action='store_true',
+                        help='channel-pack single-channel textures (ref. channel_pack), stats are added to the summary as "packed"')
+    parser.add_argument('--profile', action='store_true',
+                        help='print time of each shading stage, bpy calls and memory per material, '
+                             'and add them to the summary as "profile"')
+    parser.add_argument('--profile-trace', metavar='FILE', help='also write the profile as a Chrome trace (implies --profile)')
+    return parser
+
+def getNodeAdder(shader: str):
+    from .node_adder import CoresNodeAdder, PlusNodeAdder, TitanfallSGNodeAdder
+    return {
+        'cores': CoresNodeAdder,
+        'plus': PlusNodeAdder,
+        'sg': TitanfallSGNodeAdder,
+    }[shader]
+
+def importDirectory(import_dir: Path) -> int:
+    """
+        Import every model in the directory with whichever importer addon is enabled.
+        Returns number of imported files.
+    """
+    import bpy
+    from .log import logger
+    available = dir(bpy.ops.import_scene)
+    importers = [(name, ext) for name, ext in IMPORTERS if name in available]
+    if not importers:
+        raise Exception(f'No model importer enabled, need one of {[name for name, _ in IMPORTERS]}')
+
+    cnt = 0
+    for name, ext in importers:
+        for fpath in sorted(import_dir.glob(f'**/*{ext}')):
+            logger.summary('[*] import %s', fpath)
+            getattr(bpy.ops.import_scene, name)(filepath=str(fpath))
+            cnt += 1
+    return cnt
+
+def getTargetObjects(target: str, names: Optional[List[str]]) -> List:
+    import bpy
+    if names:
+        missing = [name for name in names if name not in bpy.data.objects]
+        if missing:
+            raise Exception(f'No such objects: {missing}')
+        return [bpy.data.objects[name] for name in names]
+
+    armatures = [obj for obj in bpy.data.objects if obj.type == 'ARMATURE']
+    # meshes of armatures are already shaded through the armature
+    meshes = [obj for obj in bpy.data.objects
+              if obj.type == 'MESH' and (obj.parent is None or obj.parent.type != 'ARMATURE')]
+    if target == 'armatures':
+        return armatures
+    if target == 'meshes':
+        return [obj for obj in bpy.data.objects if obj.type == 'MESH']
+    return armatures + meshes
+
+def shadeByMaterialDirectory(objs: List, material_dir: Path, node_adder_cls) -> Dict[str, Any]:
+    from . import utils
+    from .log import BatchReport
+    report = BatchReport('Shade by material name matching')
+    for mat, mat_dir_path in utils.matchMaterialDirectories(objs, material_dir):
+        report.run(mat.name, utils.shadeMaterialByDirectory, mat, mat_dir_path, node_adder_cls)
+    report.log()
+    return {'shaded': len(report.success_ls), 'duplicate': 0, 'unchanged': 0, 'failed': len(report.failed_ls), 'errors': dict(report.failed_ls)}
+
+def run(args) -> Dict[str, Any]:
+    import bpy
+    from . import utils
+    from .image_registry import image_registry
+    from .dir_index import dir_index
+    from .profiler import profiler
+    from .texture_proxy import texture_proxies
+    from .channel_pack import channel_packer
+    from .log import logger
+
+    start_time = time.perf_counter()
+    if args.log_level:
+        logger.setLevel(args.log_level)
+    if args.profile or args.profile_trace:
+        profiler.enable()
+    if args.proxy:
+        texture_proxies.enabled = True
+    if args.pack:
+        channel_packer.enabled = True
+    summary = {'ok': False, 'shader': args.shader}
+
+    if args.blend:
+        bpy.ops.wm.open_mainfile(filepath=str(Path(args.blend).absolute()))
+    elif args.import_dir:
+        bpy.ops.wm.read_homefile(use_empty=True)
+        summary['imported'] = importDirectory(Path(args.import_dir))
+    summary['input'] = bpy.data.filepath or args.import_dir
+
+    objs = getTargetObjects(args.target, args.objects)
+    node_adder_cls = getNodeAdder(args.shader)
+    image_registry.resetStats()
+    if args.material_dir:
+        result = shadeByMaterialDirectory(objs, Path(args.material_dir), node_adder_cls)
+    else:
+        result = utils.shadeObjects(objs, node_adder_cls, args.force)
+    dir_index.save()
+
+    summary.update(result)
+    summary['objects'] = len(objs)
+    summary['images'] = image_registry.stats()
+    if texture_proxies.enabled:
+        summary['proxies'] = texture_proxies.stats()
+    if channel_packer.enabled:
+        summary['packed'] = channel_packer.stats()
+
+    if args.output:
+        bpy.ops.wm.save_as_mainfile(filepath=str(Path(args.output).absolute()))
+        summary['output'] = bpy.data.filepath
+    elif args.save:
+        if not bpy.data.filepath:
+            raise Exception('--save needs an opened .blend file, use --output instead')
+        bpy.ops.wm.save_mainfile()
+        summary['output'] = bpy.data.filepath
+
+    summary['ok'] = result['failed'] == 0
+    summary['seconds'] = round(time.perf_counter() - start_time, 3)
+    logger.flush()
+    if profiler.enabled:
+        print(profiler.summaryTable())
+        summary['profile'] = profiler.stats()
+        if args.profile_trace:
+            profiler.saveChromeTrace(args.profile_trace)
+            summary['profile_trace'] = str(Path(args.profile_trace).absolute())
+    return summary
+
+def writeSummary(summary: Dict[str, Any], summary_path: Optional[str]):
+    line = json.dumps(summary)
+    print(SUMMARY_PREFIX + line, flush=True)
+    if summary_path:
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+def main(argv: List[str]) -> int:
+    args = makeArgParser().parse_args(argv)
+    try:
+        summary = run(args)
+    except Exception as e:
+        writeSummary({'ok': False, 'shader': args.shader, 'fatal': f'{type(e).__name__}: {e}'}, args.summary)
+        return 2
+    writeSummary(summary, args.summary)
+    return 0 if summary['ok'] else 1
+
+def getScriptArgv() -> List[str]:
+    # blender passes its own arguments in sys.argv, ours are after `--`
+    if '--' in sys.argv:
+        return sys.argv[sys.argv.index('--') + 1:]
+    # `python headless.py ...` (bpy pip module): argv[0] is this script. inside blender it's
+    # the blender binary, and the rest are blender's own flags, not ours
+    if sys.argv and os.path.realpath(sys.argv[0]) == os.path.realpath(__file__):
+        return sys.argv[1:]
+    return []
+
+if __name__ == '__main__':
+    # run as a script (`blender --python headless.py`), so import the addon as a
+    # package first to make relative imports work
+    addon_dir = Path(__file__).absolute().parent
+    sys.path.insert(0, str(addon_dir.parent))
+    headless = importlib.import_module(f'{addon_dir.name}.headless')
+    sys.exit(headless.main(getScriptArgv()))
@@ -0,0 +1,146 @@
+"""
+    Texture memory audit (Apex Shader menu -> "Audit Texture Memory").
+
+    + memory of the images used by each armature (or mesh), material and texture role,
+      width x height x channels x bytes per channel. Images blender hasn't decoded yet
+      are estimated from their file header
+    + images with the same content (ref. `content_hash`), colorspace and alpha mode
+      are merged into one datablock
+"""
+
+import os
+import bpy
+from collections import defaultdict
+from typing import *
+from .utils import collectMaterials, getNodeRole
+from .image_registry import image_registry
+from .content_hash import content_hashes
+from .prefetch import fetchImageInfo, decodedMemory
+from .texture_proxy import PROXY_SOURCE_PROP
+from .log import logger
+
+def imageFile(image) -> Optional[str]:
+    """
+        Absolute path of the file the image is read from, None if it isn't read from a file.
+    """
+    if image.source != 'FILE' or image.packed_file is not None or not image.filepath:
+        return None
+    path = os.path.realpath(bpy.path.abspath(image.filepath, library=image.library))
+    return path if os.path.isfile(path) else None
+
+def imageMemory(image) -> Tuple[int, bool]:
+    """
+        (bytes, whether it's decoded). Not decoded images are estimated from the file header,
+        reading `image.size` would decode them.
+    """
+    if image.has_data:
+        width, height = image.size
+        return width * height * image.channels * (4 if image.is_float else 1), True
+    path = imageFile(image)
+    return (decodedMemory(fetchImageInfo(path)) if path is not None else 0), False
+
+def materialImages(mat) -> List[Tuple[Any, str]]:
+    """
+        (image, texture role) of the material's Image Texture nodes.
+    """
+    if mat.node_tree is None:
+        return []
+    return [(node.image, getNodeRole(node) or '?') for node in mat.node_tree.nodes
+            if node.type == 'TEX_IMAGE' and node.image is not None]
+
+def auditMemory(objs: List) -> Dict[str, Any]:
+    """
+        Memory of the images of the given meshes / armatures. Each image counts once per
+        group, images shared by groups count in each.
+    """
+    memory = {}     # image name -> (bytes, decoded)
+    def add(groups: Dict[str, set], group: str, image):
+        if image.name not in memory:
+            memory[image.name] = imageMemory(image)
+        groups[group].add(image.name)
+
+    objects = defaultdict(set)
+    materials = defaultdict(set)
+    roles = defaultdict(set)
+    for obj in objs:
+        mat_ls, _ = collectMaterials([obj])
+        for mat in mat_ls:
+            for image, role in materialImages(mat):
+                add(objects, obj.name, image)
+                add(materials, mat.name, image)
+                add(roles, role, image)
+
+    def total(names) -> int:
+        return sum(memory[name][0] for name in names)
+
+    def byMemory(groups: Dict[str, set]) -> Dict[str, int]:
+        return dict(sorted(((group, total(names)) for group, names in groups.items()), key=lambda x: -x[1]))
+
+    return {
+        'images': len(memory),
+        'total': total(memory),
+        'decoded': sum(nbytes for nbytes, decoded in memory.values() if decoded),
+        'objects': byMemory(objects),
+        'materials': byMemory(materials),
+        'roles': byMemory(roles),
+    }
+
+def auditTable(audit: Dict[str, Any], top: int = 10) -> str:
+    lines = [f"Texture memory: {_formatMiB(audit['total'])} in {audit['images']} images "
+             f"({_formatMiB(audit['decoded'])} decoded)"]
+    for title, key in [('armature / mesh', 'objects'), ('material', 'materials'), ('texture role', 'roles')]:
+        groups = audit[key]
+        lines.append(f'    {title} ({len(groups)}):')
+        for name, nbytes in list(groups.items())[:top]:
+            lines.append(f'        {_formatMiB(nbytes):>12}  {name}')
+        if len(groups) > top:
+            lines.append(f'        ... {len(groups) - top} more')
+    return '\n'.join(lines)
+
+def mergeDuplicateImages() -> Dict[str, int]:
+    """
+        Merge images with the same file content, colorspace and alpha mode into the one with
+        most users. Proxies (one per texture, ref. `texture_proxy`) are left alone.
+        Returns {'merged': images removed, 'saved': bytes of them}.
+    """
+    by_path = defaultdict(list)
+    for image in bpy.data.images:
+        if image.library is not None or PROXY_SOURCE_PROP in image:
+            continue
+        path = imageFile(image)
+        if path is not None:
+            by_path[path].append(image)
+
+    # same content under other names, and several datablocks of the same file (e.g. `.001` copies)
+    groups = content_hashes.findDuplicates(by_path)
+    grouped = set(path for group in groups for path in group)
+    groups.extend([path] for path, images in by_path.items() if len(images) > 1 and path not in grouped)
+
+    merged = 0
+    saved = 0
+    for group in groups:
+        same_settings = defaultdict(list)
+        for path in group:
+            for image in by_path[path]:
+                same_settings[(image.colorspace_settings.name, image.alpha_mode)].append(image)
+        for images in same_settings.values():
+            if len(images) < 2:
+                continue
+            keep = max(images, key=lambda image: image.users)
+            for image in images:
+                if image == keep:
+                    continue
+                nbytes, _ = imageMemory(image)
+                path = imageFile(image)
+                logger.material('    Merged %s into %s', image.name, keep.name)
+                image.user_remap(keep)
+                bpy.data.images.remove(image)
+                # so loading that file again gets the kept image
+                image_registry.alias(path, keep)
+                merged += 1
+                saved += nbytes
+    logger.summary('[*] Merged %d duplicate images, %s', merged, _formatMiB(saved))
+    return {'merged': merged, 'saved': saved}
+
+def _formatMiB(n: int) -> str:
+    return f'{n / 2**20:.1f} MiB'
@@ -0,0 +1,312 @@
+"""
+    Image datablock registry.
+
+    Every texture goes through `loadImage()` instead of `bpy.data.images.load()`,
+    so a PNG referenced by multiple meshes / LODs / recolors (e.g. `hand` and `body`
+    both using `body` textures) is only decoded once per session.
+
+    With `config.IMAGE_DEDUP`, files with the same content as an already loaded one
+    (Legion+ writes the same pixels under another name for each skin / recolor) also
+    use that image, ref. `content_hash`.
+"""
+
+import os
+import bpy
+from . import config
+from .profiler import profiler
+from .content_hash import content_hashes
+from .dir_index import splitTextureName
+from .prefetch import getImageInfo, decodedMemory
+from pathlib import Path
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import *
+
+# images whose file is swapped for a while (ref. `texture_proxy`) keep the path they were loaded from here
+LOADED_FILEPATH_PROP = 'apex_loaded_filepath'
+
+def loadedFilepath(image) -> str:
+    return image.get(LOADED_FILEPATH_PROP, image.filepath)
+
+class ImageRegistry:
+    """
+        Registry of loaded image datablocks, keyed by (resolved absolute path, file size, mtime).
+
+        Only datablock names are stored (not the datablock itself), so the registry
+        never holds stale references when a new file is opened (ref. the RSAStruct bug in TODO.md).
+
+        If `memory_cap` (in bytes) is given, least recently used images that have
+        no users anymore are removed from `bpy.data.images` when the cap is exceeded.
+        Memory is a running total of the decoded size of each image, as of the last time
+        it was loaded or hit. Blender decodes lazily, images not decoded yet are estimated
+        from their file header (ref. `prefetch.decodedMemory()`), they will be once a node shows them.
+
+        Images loaded inside `keepLoaded()` aren't evicted before it ends, they have no users
+        until the caller assigns them to nodes.
+
+        If `dedup`, a file with the same texture role (name suffix, so the same colorspace)
+        and content as a loaded image gets that image, instead of loading the same pixels again.
+    """
+    def __init__(self, memory_cap=None, dedup: bool = False):
+        self.memory_cap = memory_cap
+        self.dedup = dedup
+        self.contents = {}              # (role, sampled content hash) -> [(image datablock name, image.filepath)]
+        self.entries = OrderedDict()    # key -> (image datablock name, image.filepath), in LRU order
+        self.image_keys = {}            # image datablock name -> keys of the entries using it
+        self.image_memory = {}          # image datablock name -> decoded bytes, ref. `memoryUsage()`
+        self.usage = 0                  # sum of `image_memory`
+        self.pinned = None              # names of images loaded inside `keepLoaded()`
+        self.existing = {}              # resolved path -> (image datablock name, image.filepath), of all images
+        self.existing_count = -1        # len(bpy.data.images) when `existing` was last up-to-date
+        self.hit = 0
+        self.miss = 0
+        self.evicted = 0
+        self.deduped = 0
+
+    @staticmethod
+    def makeKey(img_path):
+        img_path = Path(img_path).resolve()
+        stat = img_path.stat()
+        return (str(img_path), stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def imageMemory(image) -> int:
+        """
+            Estimated memory of a decoded image in bytes. Images that are not decoded yet
+            (blender loads pixels lazily) are estimated from the file header, reading
+            `image.size` would decode them.
+        """
+        if not image.has_data:
+            return decodedMemory(getImageInfo(bpy.path.abspath(loadedFilepath(image))))
+        width, height = image.size
+        return width * height * image.channels * (4 if image.is_float else 1)
+
+    def _setEntry(self, key, image):
+        if key in self.entries:
+            self._removeEntry(key)
+        self.entries[key] = (image.name, loadedFilepath(image))
+        self.image_keys.setdefault(image.name, set()).add(key)
+        self._updateMemory(image)
+
+    def _removeEntry(self, key):
+        name, _ = self.entries.pop(key)
+        keys = self.image_keys[name]
+        keys.discard(key)
+        if not keys:
+            del self.image_keys[name]
+            self.usage -= self.image_memory.pop(name, 0)
+
+    def _updateMemory(self, image):
+        # the header estimate of an image that is still not decoded is already there
+        if not image.has_data and image.name in self.image_memory:
+            return
+        nbytes = self.imageMemory(image)
+        self.usage += nbytes - self.image_memory.get(image.name, 0)
+        self.image_memory[image.name] = nbytes
+
+    def _getImage(self, key):
+        # the entry may be gone if user removed it or opened another file
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        name, filepath = entry
+        image = bpy.data.images.get(name)
+        if image is None or loadedFilepath(image) != filepath:
+            self._removeEntry(key)
+            return None
+        return image
+
+    def _indexExisting(self):
+        # resolving every image path is slow, so only do it when images were added / removed behind our back
+        self.existing = {}
+        for image in bpy.data.images:
+            if image.source != 'FILE' or not image.filepath:
+                continue
+            filepath = loadedFilepath(image)
+            self.existing[os.path.realpath(bpy.path.abspath(filepath))] = (image.name, filepath)
+        self.existing_count = len(bpy.data.images)
+
+    def _findExisting(self, abs_path: str):
+        # images loaded outside the registry (e.g. by the model importer) can also be reused
+        if len(bpy.data.images) != self.existing_count:
+            self._indexExisting()
+        entry = self.existing.get(abs_path)
+        if entry is None:
+            return None
+        name, filepath = entry
+        image = bpy.data.images.get(name)
+        if image is None or loadedFilepath(image) != filepath:
+            # renamed / replaced, index again and trust the result
+            self._indexExisting()
+            entry = self.existing.get(abs_path)
+            return bpy.data.images.get(entry[0]) if entry is not None else None
+        return image
+
+    def _findDuplicate(self, content_key, abs_path: str):
+        # candidates have the same sampled hash, confirmed by hashing both files fully
+        for name, filepath in self.contents.get(content_key, ()):
+            image = bpy.data.images.get(name)
+            if image is None or loadedFilepath(image) != filepath:
+                continue
+            other_path = os.path.realpath(bpy.path.abspath(filepath))
+            if os.path.isfile(other_path) and content_hashes.full(other_path) == content_hashes.full(abs_path):
+                return image
+        return None
+
+    def load(self, img_path):
+        """
+            Return an image datablock for `img_path`, loading it only if there
+            is no up-to-date datablock for that file yet.
+        """
+        key = self.makeKey(img_path)
+        image = self._getImage(key)
+        if image is not None:
+            self.hit += 1
+            self.entries.move_to_end(key)
+            self._updateMemory(image)
+            self._pin(image)
+            self.evict(keep=image.name)
+            return image
+
+        self.miss += 1
+        # drop entries of the same path but older file, the datablock is reloaded below
+        old_keys = [k for k in self.entries if k[0] == key[0]]
+        for old_key in old_keys:
+            self._removeEntry(old_key)
+
+        image = self._findExisting(key[0])
+        if image is None and self.dedup:
+            content_key = (splitTextureName(Path(key[0]).name)[1], content_hashes.sampled(key[0]))
+            image = self._findDuplicate(content_key, key[0])
+            if image is not None:
+                self.deduped += 1
+        if image is None:
+            with profiler.stage('image_load'):
+                image = bpy.data.images.load(key[0])
+            profiler.count('images.load')
+            self.existing[key[0]] = (image.name, image.filepath)
+            self.existing_count = len(bpy.data.images)
+            if self.dedup:
+                self.contents.setdefault(content_key, []).append((image.name, image.filepath))
+        elif old_keys:
+            # file changed on disk since we loaded it
+            image.reload()
+        self._setEntry(key, image)
+        self._pin(image)
+        # not assigned to any node yet, so it has no users, but the caller is about to use it
+        self.evict(keep=image.name)
+        return image
+
+    def _pin(self, image):
+        if self.pinned is not None:
+            self.pinned.add(image.name)
+
+    @contextmanager
+    def keepLoaded(self):
+        """
+            `with image_registry.keepLoaded(): ...` keeps every image loaded inside,
+            e.g. all textures of a material, until they are assigned to its nodes. Can be nested.
+        """
+        if self.pinned is not None:
+            yield
+            return
+        self.pinned = set()
+        try:
+            yield
+        finally:
+            self.pinned = None
+
+    def alias(self, img_path, image):
+        """
+            Use `image` for the file `img_path` from now on, e.g. after merging images of identical files.
+        """
+        key = self.makeKey(img_path)
+        for old_key in [k for k in self.entries if k[0] == key[0]]:
+            self._removeEntry(old_key)
+        self._setEntry(key, image)
+
+    def memoryUsage(self) -> int:
+        """
+            Decoded bytes of the registered images, each image counted once
+            (files with the same content may share an image).
+        """
+        return self.usage
+
+    def evict(self, keep: Optional[str] = None):
+        """
+            Remove least recently used images without users until the memory cap is satisfied.
+            The image named `keep` (the one just loaded) is left alone.
+        """
+        if self.memory_cap is None or self.usage <= self.memory_cap:
+            return
+        for key in list(self.entries):
+            if self.usage <= self.memory_cap:
+                break
+            if key not in self.entries:
+                # dropped with another entry of the same image
+                continue
+            image = self._getImage(key)
+            if image is None or image.name == keep or image.users != 0 or (self.pinned and image.name in self.pinned):
+                continue
+            self._updateMemory(image)
+            if self.image_memory[image.name] == 0:
+                # size unknown, nothing to gain
+                continue
+            for image_key in list(self.image_keys[image.name]):
+                self._removeEntry(image_key)
+                self.existing.pop(image_key[0], None)
+            bpy.data.images.remove(image)
+            self.existing_count = len(bpy.data.images)
+            self.evicted += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.image_keys.clear()
+        self.image_memory.clear()
+        self.usage = 0
+        self.existing.clear()
+        self.existing_count = -1
+        self.contents.clear()
+
+    def resetStats(self):
+        self.hit = 0
+        self.miss = 0
+        self.evicted = 0
+        self.deduped = 0
+
+    def stats(self) -> dict:
+        return {
+            'hit': self.hit,
+            'miss': self.miss,
+            'evicted': self.evicted,
+            'deduped': self.deduped,
+            'entries': len(self.entries),
+            'memory': self.memoryUsage(),
+        }
+
+    def summary(self) -> str:
+        s = self.stats()
+        return (f"Image registry: {s['hit']} hit, {s['miss']} miss, {s['evicted']} evicted, {s['deduped']} deduped, "
+                f"{s['entries']} images ({s['memory'] / 2**20:.1f} MiB decoded)")
+
+def _memoryCap():
+    if config.IMAGE_REGISTRY_MEMORY_CAP_MB is None:
+        return None
+    return config.IMAGE_REGISTRY_MEMORY_CAP_MB * 2**20
+
+image_registry = ImageRegistry(_memoryCap(), config.IMAGE_DEDUP)
+
+_texture_proxies = None
+
+def loadImage(img_path):
+    """
+        Load image through the global image registry. Use this instead of `bpy.data.images.load()`.
+        In proxy mode it's a downscaled copy of the image (ref. `texture_proxy`).
+    """
+    global _texture_proxies
+    if _texture_proxies is None:
+        # texture_proxy imports this module, so it's looked up on first use
+        from .texture_proxy import texture_proxies as _texture_proxies
+    if _texture_proxies.enabled:
+        return _texture_proxies.load(img_path)
+    return image_registry.load(img_path)
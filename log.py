@@ -0,0 +1,139 @@
+"""
+    Leveled, buffered console output of the addon.
+
+    Levels (`config.LOG_LEVEL`, `headless.py --log-level`):
+        quiet:    errors only
+        summary:  one line per operation (plan, armature, batch report)
+        material: also one line per material
+        texture:  also one line per texture
+
+    Lines are collected and written to the console in one write every
+    `config.LOG_FLUSH_INTERVAL` seconds (and when a batch ends), since blender's
+    console gets very slow with thousands of small writes. Per-material / per-texture
+    lines above `config.LOG_MAX_LINES_PER_FLUSH` in one interval are dropped and only
+    counted, errors and summary lines are always kept.
+
+    Messages take `%` args like `logging`, so nothing is formatted for levels that are off:
+
+        logger.texture('Adding texture %s... %s', path, 'O')
+
+    Doesn't use bpy.
+"""
+
+import sys
+import time
+from . import config
+from typing import *
+
+QUIET, SUMMARY, MATERIAL, TEXTURE = range(4)
+LEVELS = {'quiet': QUIET, 'summary': SUMMARY, 'material': MATERIAL, 'texture': TEXTURE}
+
+class Logger:
+    def __init__(self, level: str = 'material', flush_interval: float = 0.5, max_lines_per_flush: int = 500):
+        self.setLevel(level)
+        self.flush_interval = flush_interval
+        self.max_lines_per_flush = max_lines_per_flush
+        self.buffer = []
+        self.dropped = 0
+        self.last_flush = time.monotonic()
+
+    def setLevel(self, level: str):
+        if level not in LEVELS:
+            raise ValueError(f'Unknown log level "{level}", use one of {list(LEVELS)}')
+        self.level = LEVELS[level]
+
+    def isEnabled(self, level: int) -> bool:
+        return level <= self.level
+
+    def _add(self, level: int, msg: str, args: tuple):
+        if args:
+            msg = msg % args
+        if level >= MATERIAL and len(self.buffer) >= self.max_lines_per_flush:
+            self.dropped += 1
+        else:
+            self.buffer.append(msg)
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def error(self, msg: str, *args):
+        self._add(QUIET, msg, args)
+
+    def summary(self, msg: str, *args):
+        if self.level >= SUMMARY:
+            self._add(SUMMARY, msg, args)
+
+    def material(self, msg: str, *args):
+        if self.level >= MATERIAL:
+            self._add(MATERIAL, msg, args)
+
+    def texture(self, msg: str, *args):
+        if self.level >= TEXTURE:
+            self._add(TEXTURE, msg, args)
+
+    def flush(self):
+        if self.dropped:
+            self.buffer.append(f'    ... {self.dropped} lines not shown (ref. config.LOG_MAX_LINES_PER_FLUSH)')
+            self.dropped = 0
+        if self.buffer:
+            sys.stdout.write('\n'.join(self.buffer) + '\n')
+            sys.stdout.flush()
+            self.buffer.clear()
+        self.last_flush = time.monotonic()
+
+logger = Logger(config.LOG_LEVEL, config.LOG_FLUSH_INTERVAL, config.LOG_MAX_LINES_PER_FLUSH)
+
+class BatchReport:
+    """
+        Success / failure of each item of a batch (meshes of an armature, materials, ...),
+        so one failing item doesn't stop the rest.
+
+            report = BatchReport('Recolor bloodhound')
+            for mesh in meshes:
+                report.run(mesh.name, recolorMesh, mesh, ...)
+            report.log()
+    """
+    def __init__(self, title: str):
+        self.title = title
+        self.success_ls = []    # item names
+        self.failed_ls = []     # (item name, error message)
+
+    def success(self, name: str):
+        self.success_ls.append(name)
+
+    def fail(self, name: str, error):
+        self.failed_ls.append((name, str(error)))
+
+    def run(self, name: str, func: Callable, *args, **kwargs):
+        """
+            Call `func`, record whether it raised. Returns what `func` returns, None if it failed.
+        """
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            # every failure is in the report at the end, right away only if per-material lines are on
+            logger.material('    %s failed: %s', name, e)
+            self.fail(name, e)
+            return None
+        self.success(name)
+        return result
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed_ls
+
+    def summary(self) -> str:
+        return f'{self.title}: {len(self.success_ls)} succeeded, {len(self.failed_ls)} failed'
+
+    def log(self):
+        """
+            End of the batch: summary line, failures (always) and successes (per-material level), then flush.
+        """
+        logger.summary('%s', self.summary())
+        for name in self.success_ls:
+            logger.material('    Success: %s', name)
+        for name, error in self.failed_ls:
+            logger.error('    Failed: %s (%s)', name, error)
+        logger.flush()
+
+    def toDict(self) -> dict:
+        return {'success': list(self.success_ls), 'failed': dict(self.failed_ls)}
@@ -0,0 +1,166 @@
+"""
+    Template materials for repeated texture sets.
+
+    Most materials of a character have the same set of texture roles (e.g. albedo,
+    ao, cavity, gloss, normal, spec), so their node trees only differ by images.
+    The first material shaded with a (node adder, role set) signature becomes a
+    template: a copy of it without images. Further materials with that signature
+    get a copy of the template's nodes and links, with only the images filled in,
+    instead of going through the node adder (role lookups, socket lookups by name,
+    sub-graphs, image checks).
+
+    Image nodes of the template are tagged with the role they are for, and the
+    colorspace the node adder set on the image (that's on the image, not the node).
+
+    Blender can't give a material another node tree, so the nodes are copied one by one
+    (`copyNodes()`), as many `nodes.new` / `links.new` as building it. The material itself
+    stays the same datablock: references, settings, animation and asset data are kept.
+"""
+
+import bpy
+from typing import *
+from .node_adder import NodeAdder, TEXTURE_PATH_PROP
+from .texture_roles import parsePackedRole
+from .shade_plan import TexturePlan
+from .image_registry import loadImage
+from .log import logger
+
+TEMPLATE_PREFIX = '.apex_template'     # names starting with `.` are hidden in most of blender's UI
+SIGNATURE_PROP = 'apex_template_signature'
+ROLE_PROP = 'apex_template_role'
+COLORSPACE_PROP = 'apex_template_colorspace'
+
+def getSignature(textures: List[TexturePlan], node_adder_cls: NodeAdder) -> Tuple[str, Tuple[str, ...]]:
+    """
+        (node adder name, sorted roles of the textures), `textures` are the ones that will
+        be added (ref. `MaterialPlan.plannedTextures()`). Roles can repeat (e.g. both a .png
+        and a .tga of the same texture).
+    """
+    return (node_adder_cls.__name__, tuple(sorted(t.role for t in textures)))
+
+def getRoleTextures(textures: List[TexturePlan]) -> Dict[Tuple[str, int], str]:
+    # (role, n-th texture of that role) -> texture path
+    result = {}
+    for t in textures:
+        ordinal = len([key for key in result if key[0] == t.role])
+        result[(t.role, ordinal)] = t.path
+    return result
+
+# node settings the node adders change, everything else is left as the node type's default
+NODE_ATTRS = ['label', 'location', 'width', 'hide', 'mute', 'image', 'node_tree', 'blend_type']
+
+def copyNodes(src_tree, dst_tree):
+    """
+        Add a copy of every node and link of `src_tree` to `dst_tree` (nodes keep their names if
+        `dst_tree` is empty). Sockets are matched by index, names can repeat (e.g. Mix Shader).
+    """
+    copies = {}     # node name -> (copy, output index by identifier, input index by identifier)
+    for node in src_tree.nodes:
+        new_node = dst_tree.nodes.new(type=node.bl_idname)
+        new_node.name = node.name
+        for attr in NODE_ATTRS:
+            if hasattr(node, attr):
+                setattr(new_node, attr, getattr(node, attr))
+        for key in node.keys():
+            new_node[key] = node[key]
+        for sockets, new_sockets in ((node.inputs, new_node.inputs), (node.outputs, new_node.outputs)):
+            for i, socket in enumerate(sockets):
+                if hasattr(socket, 'default_value'):
+                    new_sockets[i].default_value = socket.default_value
+        copies[node.name] = (new_node, {socket.identifier: i for i, socket in enumerate(node.outputs)},
+                             {socket.identifier: i for i, socket in enumerate(node.inputs)})
+    for link in src_tree.links:
+        from_node, from_outputs, _ = copies[link.from_node.name]
+        to_node, _, to_inputs = copies[link.to_node.name]
+        dst_tree.links.new(from_node.outputs[from_outputs[link.from_socket.identifier]],
+                           to_node.inputs[to_inputs[link.to_socket.identifier]])
+
+def applyBlendMethods(mat: bpy.types.Material, roles: Iterable[str], node_adder_cls: NodeAdder):
+    # like `NodeAdder.linkRole()` does when the material is built
+    for role in roles:
+        layout = parsePackedRole(role)
+        for sub_role in (layout.values() if layout is not None else [role]):
+            spec = node_adder_cls.roles.get(sub_role)
+            if spec is not None and spec.blend_method is not None:
+                mat.blend_method = spec.blend_method
+
+class MaterialTemplates:
+    """
+        Template material of each signature. Only names are kept (ref. the RSAStruct bug in TODO.md).
+    """
+    def __init__(self):
+        self.templates = {}     # signature -> template material name
+        self.built = 0
+        self.cloned = 0
+
+    def get(self, signature, shader_node_tree):
+        """
+            Template of the signature, if there is one that still uses `shader_node_tree`.
+        """
+        name = self.templates.get(signature)
+        template = bpy.data.materials.get(name) if name is not None else None
+        if template is None or template.get(SIGNATURE_PROP) != repr(signature):
+            self.templates.pop(signature, None)
+            return None
+        # node group got replaced (e.g. asset file edited), build a new one
+        if not any(node.type == 'GROUP' and node.node_tree == shader_node_tree for node in template.node_tree.nodes):
+            self.templates.pop(signature, None)
+            bpy.data.materials.remove(template)
+            return None
+        return template
+
+    def add(self, signature, mat: bpy.types.Material, textures: List[TexturePlan]):
+        """
+            Make a template from a material that was just built from `textures`.
+        """
+        image_roles = {loadImage(path).name: key for key, path in getRoleTextures(textures).items()}
+        template = mat.copy()
+        template.name = f'{TEMPLATE_PREFIX}_{signature[0]}_{len(self.templates):03d}'
+        template[SIGNATURE_PROP] = repr(signature)
+        for node in template.node_tree.nodes:
+            if node.type != 'TEX_IMAGE' or node.image is None or node.image.name not in image_roles:
+                continue
+            role, ordinal = image_roles[node.image.name]
+            node[ROLE_PROP] = f'{role}:{ordinal}'
+            node[COLORSPACE_PROP] = node.image.colorspace_settings.name
+            # template shouldn't keep images alive
+            node.image = None
+            if TEXTURE_PATH_PROP in node:
+                del node[TEXTURE_PATH_PROP]
+        self.templates[signature] = template.name
+        self.built += 1
+
+    def clone(self, template, mat: bpy.types.Material, textures: List[TexturePlan], node_adder_cls: NodeAdder) -> bpy.types.Material:
+        """
+            Replace the nodes of `mat` by a copy of the template's, with the images of `textures`.
+            Returns `mat`, only its node tree changes (and the blend method, like building it would).
+        """
+        role_textures = getRoleTextures(textures)
+        mat.use_nodes = True
+        mat.node_tree.nodes.clear()
+        copyNodes(template.node_tree, mat.node_tree)
+        for node in mat.node_tree.nodes:
+            if ROLE_PROP not in node:
+                continue
+            role, ordinal = node[ROLE_PROP].rsplit(':', 1)
+            img_path = role_textures[(role, int(ordinal))]
+            image = loadImage(img_path)
+            image.colorspace_settings.name = node[COLORSPACE_PROP]
+            node.image = image
+            node[TEXTURE_PATH_PROP] = str(img_path)
+            del node[ROLE_PROP]
+            del node[COLORSPACE_PROP]
+            logger.texture('     Adding texture %s... O', image.filepath)
+        applyBlendMethods(mat, [role for role, _ in role_textures], node_adder_cls)
+        self.cloned += 1
+        return mat
+
+    def clear(self):
+        # templates are removed with the file they're in, only forget the names
+        self.templates.clear()
+
+    def resetStats(self):
+        self.built = 0
+        self.cloned = 0
+
+material_templates = MaterialTemplates()
@@ -8,6 +8,16 @@ from bpy_extras.io_utils import ImportHelper, ExportHelper
 from bpy.props import StringProperty
 from pathlib import Path
 from .node_adder import *
+from .image_registry import image_registry
+from .dir_index import dir_index
+from .modal_batch import ModalBatchMixin
+from .profiler import profiler
+from .log import logger
+from .texture_proxy import texture_proxies
+from .image_audit import auditMemory, auditTable, mergeDuplicateImages
+from .skin_set import getArmature, getSkinSets, getActiveSkin, switchSkin, recordBaseSkin
+from .bulk_undo import BulkUndo, undoModeProperty, OPERATOR_OPTIONS as BULK_UNDO_OPTIONS
+import functools
 
 CURRENT_NODEADDER = CoresNodeAdder
 
@@ -15,20 +25,90 @@ class ApexShadeSelectedLegendOp(bpy.types.Operator):
     """Auto-shade all selected Apex Legends. Can select multiple meshes or armatures."""
     bl_idname = "apexaddon.shade_selected_legend"
     bl_label = "Shade Selected Apex Legend"
-    bl_options = {'REGISTER', 'UNDO'}
+    bl_options = BULK_UNDO_OPTIONS
+    undo_mode: undoModeProperty()
+    force: bpy.props.BoolProperty(name="Rebuild Unchanged Materials", default=False,
+                                  description="Also shade materials whose textures didn't change since they were shaded")
 
     def execute(self, context):
-        methods = {
-            'MESH': utils.shadeMesh,
-            'ARMATURE': utils.shadeArmature
-        }
-        for i, obj in enumerate(context.selected_objects):
-            print(f'[ShadeAll {i}/{len(context.selected_objects)}] {obj}')
-            if obj.type in methods:
-                methods[obj.type](obj, CURRENT_NODEADDER)
+        shadeable_types = ['MESH', 'ARMATURE']
+        objs = []
+        for obj in context.selected_objects:
+            if obj.type in shadeable_types:
+                objs.append(obj)
             else:
-                print(f'{obj} is not one of the following: {list(methods.keys())}')
-                # raise Exception(f'{obj} is not one of the following: {list(methods.keys())}')
+                logger.summary('%s is not one of the following: %s', obj, shadeable_types)
+
+        # collect materials of all selected objects first, so materials shared
+        # between selected armatures are also only shaded once
+        image_registry.resetStats()
+        logger.summary('[ShadeAll] %d objects', len(objs))
+        # by name, for after shading (ref. the RSAStruct bug in TODO.md)
+        mat_names = [mat.name for mat in utils.collectMaterials(objs)[0]]
+        bulk_undo = BulkUndo(self, 'shade', len(mat_names))
+        bulk_undo.begin()
+        result = utils.shadeObjects(objs, CURRENT_NODEADDER, self.force)
+        undo_msg = bulk_undo.end(mat_names)
+        self.report({'INFO'}, f"Shaded {result['shaded']} materials, skipped {result['duplicate']} "
+                              f"shared material rebuilds and {result['unchanged']} unchanged materials, "
+                              f"{result['failed']} materials can't be shaded. "
+                              f"{image_registry.summary()}" + (f". {undo_msg}" if undo_msg else ''))
+        if profiler.enabled:
+            print(profiler.summaryTable())
+        return {'FINISHED'}
+
+class ApexShadeSelectedLegendModalOp(ModalBatchMixin, bpy.types.Operator):
+    """Auto-shade all selected Apex Legends without freezing blender. Shows progress in the status bar, press Esc to cancel."""
+    bl_idname = "apexaddon.shade_selected_legend_modal"
+    bl_label = "Shade Selected Apex Legend (Non-blocking)"
+    bl_options = BULK_UNDO_OPTIONS
+    undo_mode: undoModeProperty()
+
+    def execute(self, context):
+        objs = [obj for obj in context.selected_objects if obj.type in ['MESH', 'ARMATURE']]
+        mat_ls, slot_count = utils.collectMaterials(objs)
+        plan = utils.planMaterials(mat_ls, CURRENT_NODEADDER)
+        logger.summary('[ShadeAll] %d objects, plan: %s', len(objs), plan.summary())
+        plan, unchanged_ls = utils.splitUnchanged(plan, CURRENT_NODEADDER)
+
+        utils.prefetchPlan(plan)
+        image_registry.resetStats()
+        self.duplicate_cnt = slot_count - len(mat_ls)
+        self.unchanged_cnt = len(unchanged_ls)
+        self.unplanned_cnt = len([mat_plan for mat_plan in plan if not mat_plan.ok])
+        steps = [
+            (f'Shading {mat_plan.material}', functools.partial(utils.applyMaterialPlanByName, mat_plan))
+            for mat_plan in plan if mat_plan.ok
+        ]
+        # by name, ref. `applyMaterialPlanByName()`
+        self.mat_names = [mat_plan.material for mat_plan in plan if mat_plan.ok]
+        self.bulk_undo = BulkUndo(self, 'shade', len(steps))
+        self.bulk_undo.begin()
+        return self.startBatch(context, steps)
+
+    def finishBatch(self, context, cancelled):
+        dir_index.save()
+        self.undo_msg = self.bulk_undo.end(self.mat_names, cancelled)
+        super().finishBatch(context, cancelled)
+
+    def batchDetails(self) -> str:
+        return (f"Skipped {self.duplicate_cnt} shared material rebuilds and {self.unchanged_cnt} unchanged materials, "
+                f"{self.unplanned_cnt} materials can't be shaded. {image_registry.summary()}"
+                + (f". {self.undo_msg}" if self.undo_msg else ''))
+
+class ApexExportShadingPlanOp(bpy.types.Operator, ExportHelper):
+    """Plan shading of all selected Apex Legends without changing anything, and export the plan as json (dry run)."""
+    bl_idname = "apexaddon.export_shading_plan"
+    bl_label = "Export Shading Plan (Dry Run)"
+    bl_options = {'REGISTER'}
+    filename_ext = ".json"
+    filter_glob: StringProperty(default="*.json", options={"HIDDEN"})
+
+    def execute(self, context):
+        mat_ls, _ = utils.collectMaterials(context.selected_objects)
+        plan = utils.planMaterials(mat_ls, CURRENT_NODEADDER)
+        plan.save(self.filepath)
+        self.report({'INFO'}, f'Exported shading plan ({plan.summary()}) to {self.filepath}')
         return {'FINISHED'}
 
 # https://blender.stackexchange.com/questions/14738/use-filemanager-to-select-directory-instead-of-file
@@ -43,7 +123,7 @@ class ApexImportRecolor(bpy.types.Operator):
 
     def execute(self, context):
         # chosen dir: `self.directory`
-        print("[ImportRecolor] Selected dir: '" + self.directory + "'")
+        logger.summary("[ImportRecolor] Selected dir: '%s'", self.directory)
 
         obj = context.active_object
         methods = {
@@ -51,15 +131,123 @@ class ApexImportRecolor(bpy.types.Operator):
             'ARMATURE': utils.recolorArmature
         }
         if obj.type in methods:
-            methods[obj.type](obj, Path(self.directory), CURRENT_NODEADDER)
+            report = methods[obj.type](obj, Path(self.directory), CURRENT_NODEADDER)
+            dir_index.save()
+            logger.flush()
         else:
             raise Exception(f'{obj} is not one of the following: {list(methods.keys())}')
+        if report is not None:
+            self.report({'INFO'} if report.ok else {'WARNING'}, report.summary())
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+class ApexImportRecolorModal(ModalBatchMixin, bpy.types.Operator):
+    """Import recolor by choosing a related material folder, without freezing blender. Press Esc to cancel."""
+    bl_idname = "apexaddon.import_recolor_modal"
+    bl_label = "Import Recolor (Non-blocking)"
+    bl_options = {'REGISTER'}
+    directory: bpy.props.StringProperty(name="Directory", options={"HIDDEN"})
+    filter_folder: bpy.props.BoolProperty(default=True, options={"HIDDEN"})
+
+    batch_label = 'Recoloring'
+
+    def execute(self, context):
+        logger.summary("[ImportRecolor] Selected dir: '%s'", self.directory)
+
+        obj = context.active_object
+        # skin set of the armature, like `utils.recolorArmature()`
+        self.armature_name = None
+        if obj.type == 'MESH':
+            job_ls = [(obj, Path(self.directory))]
+        elif obj.type == 'ARMATURE':
+            recordBaseSkin(obj)
+            self.armature_name = obj.name
+            job_ls = utils.getRecolorJobs(obj, Path(self.directory))
+        else:
+            raise Exception(f"{obj} is not one of the following: ['MESH', 'ARMATURE']")
+
+        self.step_meshes = {f'Recoloring {mesh.name}': mesh.name for mesh, _ in job_ls}
+        steps = [
+            # by name, the mesh may be removed while the batch runs
+            (f'Recoloring {mesh.name}', functools.partial(utils.recolorMeshByName, mesh.name, dir_path, CURRENT_NODEADDER))
+            for mesh, dir_path in job_ls
+        ]
+        return self.startBatch(context, steps)
+
+    def finishBatch(self, context, cancelled):
+        dir_index.save()
+        armature = bpy.data.objects.get(self.armature_name) if self.armature_name is not None else None
+        if armature is not None:
+            # meshes recolored before Esc are recorded too
+            utils.recordRecolorSkinSet(armature, Path(self.directory),
+                                       [self.step_meshes[description] for description in self.batch_report.success_ls])
+        super().finishBatch(context, cancelled)
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+class ApexImportAllRecolors(bpy.types.Operator):
+    """Make materials of every recolor of the selected armature's skin at once, by choosing its Legion+ materials folder (or one of the recolor folders, which the armature then uses)."""
+    bl_idname = "apexaddon.import_all_recolors"
+    bl_label = "Import All Recolors"
+    bl_options = {'REGISTER'}
+    directory: bpy.props.StringProperty(name="Directory", options={"HIDDEN"})
+    filter_folder: bpy.props.BoolProperty(default=True, options={"HIDDEN"})
+
+    def execute(self, context):
+        logger.summary("[ImportAllRecolors] Selected dir: '%s'", self.directory)
+
+        obj = context.active_object
+        if obj is None or obj.type != 'ARMATURE':
+            raise Exception(f'{obj} is not an armature')
+        report = utils.recolorArmatureVariants(obj, Path(self.directory), CURRENT_NODEADDER)
+        logger.flush()
+        self.report({'INFO'} if report.ok else {'WARNING'}, report.summary())
         return {'FINISHED'}
 
     def invoke(self, context, event):
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
+class ApexSwitchSkinOp(bpy.types.Operator):
+    """Put a skin / recolor imported before on the active armature, only swaps materials"""
+    bl_idname = "apexaddon.switch_skin"
+    bl_label = "Switch Skin"
+    bl_options = {'REGISTER', 'UNDO'}
+    skin: StringProperty(name="Skin")
+
+    def execute(self, context):
+        armature = getArmature(context.active_object)
+        if armature is None:
+            raise Exception(f'{context.active_object} is not an armature or its mesh')
+        count = switchSkin(armature, self.skin)
+        logger.flush()
+        self.report({'INFO'}, f'Switched {count} meshes of {armature.name} to {self.skin}')
+        return {'FINISHED'}
+
+class ApexSwitchSkinSubmenu(bpy.types.Menu):
+    """
+        Skin sets of the active armature (ref. `skin_set`), made by importing recolors.
+    """
+    bl_idname = "OBJECT_MT_apex_switch_skin_submenu"
+    bl_label = "Switch Skin"
+
+    def draw(self, context):
+        layout = self.layout
+        armature = getArmature(context.active_object)
+        sets = getSkinSets(armature) if armature is not None else {}
+        if not sets:
+            layout.label(text="No recolor imported for the active armature")
+            return
+        active = getActiveSkin(armature)
+        for name, meshes in sets.items():
+            text = f"{name} ({len(meshes)} meshes)" + (" (selected)" if name == active else "")
+            layout.operator(ApexSwitchSkinOp.bl_idname, text=text).skin = name
+
 class ApexShadePathfinderEmoteOp(bpy.types.Operator):
     """Give a value shader node s.t. you can click its left & right to change Pathfinder's emote. Use this on Pathfinder's emote mesh."""
     bl_idname = "apexaddon.shade_pathfinder_emote"
@@ -79,6 +267,21 @@ class ApexShadePathfinderEmoteOp(bpy.types.Operator):
 
 # ---
 
+def removeSelectedTextures(op, context, roles):
+    objs = []
+    for obj in context.selected_objects:
+        if obj.type in ['MESH', 'ARMATURE']:
+            objs.append(obj)
+        else:
+            logger.summary('%s is not one of the following: %s', obj, ['MESH', 'ARMATURE'])
+    mat_names = [mat.name for mat in utils.collectMaterials(objs)[0]]
+    bulk_undo = BulkUndo(op, 'remove_textures', len(mat_names))
+    bulk_undo.begin()
+    report = utils.removeTextures(objs, roles)
+    undo_msg = bulk_undo.end(mat_names)
+    logger.flush()
+    op.report({'INFO'} if report.ok else {'WARNING'}, f'{report.summary()}. {undo_msg}' if undo_msg else report.summary())
+
 def makeRemoveTextureSelectedClass(texture_type):
     # NOTE: when registering class, bl_idname must only contain lower case w/o special chars
     # texture_type.lower() may not be enough
@@ -86,20 +289,11 @@ def makeRemoveTextureSelectedClass(texture_type):
         # f"""Remove texture '{texture_type}' from all selected armature or mesh"""
         bl_idname = f"apexaddon.remove_texture_{texture_type.lower()}"
         bl_label = f"Remove {texture_type}"
-        bl_options = {'REGISTER', 'UNDO'}
+        bl_options = BULK_UNDO_OPTIONS
+        undo_mode: undoModeProperty()
 
         def execute(self, context):
-            methods = {
-                'MESH': utils.removeTextureMesh,
-                'ARMATURE': utils.removeTextureArmature
-            }
-            for i, obj in enumerate(context.selected_objects):
-                print(f'[RemoveAllTexture {texture_type} {i}/{len(context.selected_objects)}] {obj}')
-                if obj.type in methods:
-                    methods[obj.type](obj, texture_type)
-                else:
-                    # raise Exception(f'{obj} is not one of the following: {list(methods.keys())}')
-                    print(f'{obj} is not one of the following: {list(methods.keys())}')
+            removeSelectedTextures(self, context, [texture_type])
             return {'FINISHED'}
     
     # in-class docstring cannot be f-string, or it will become None, so we set it here
@@ -125,6 +319,25 @@ remove_texture_class_ls = [
     for texture_type in removable_texture_ls
 ]
 
+class ApexRemoveTexturesOp(bpy.types.Operator):
+    """Remove any of the textures from all selected armatures or meshes at once"""
+    bl_idname = "apexaddon.remove_textures"
+    bl_label = "Remove Multiple Textures..."
+    bl_options = BULK_UNDO_OPTIONS
+    undo_mode: undoModeProperty()
+    roles: bpy.props.EnumProperty(
+        name="Textures",
+        items=[(texture_type, texture_type, f"Remove {texture_type}") for texture_type in removable_texture_ls],
+        options={'ENUM_FLAG'},
+    )
+
+    def execute(self, context):
+        removeSelectedTextures(self, context, self.roles)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
 class ApexRemoveTextureSubmenu(bpy.types.Menu):
     bl_idname = "OBJECT_MT_apex_remove_texture_submenu"
     bl_label = "Remove Texture From Selected Legends"
@@ -133,6 +346,8 @@ class ApexRemoveTextureSubmenu(bpy.types.Menu):
         layout = self.layout
         for rm_cls in remove_texture_class_ls:
             layout.operator(rm_cls.bl_idname)
+        layout.separator()
+        layout.operator(ApexRemoveTexturesOp.bl_idname)
 
 # ---
 
@@ -148,7 +363,8 @@ def makeChooseShaderOptionOperator(idname, display_name, node_adder_cls_arg, des
         def execute(self, context):
             global CURRENT_NODEADDER
             CURRENT_NODEADDER = self.node_adder_cls
-            print(f'Current node adder is {CURRENT_NODEADDER}')
+            logger.summary('Current node adder is %s', CURRENT_NODEADDER)
+            logger.flush()
             return {'FINISHED'}
     
     ApexChooseShaderOptionOp.__doc__ = description
@@ -166,6 +382,19 @@ shader_op_ls = [
     for idname, display_name, node_adder_cls, description in available_shaders
 ]
 
+class ApexConvertShaderOp(bpy.types.Operator):
+    """Switch materials of the selected armatures / meshes to the chosen shader without shading them again, the image nodes are relinked to the new shader node group"""
+    bl_idname = "apexaddon.convert_shader"
+    bl_label = "Convert Selected to Chosen Shader"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        objs = [obj for obj in context.selected_objects if obj.type in ['MESH', 'ARMATURE']]
+        report = utils.convertObjects(objs, CURRENT_NODEADDER)
+        logger.flush()
+        self.report({'INFO'} if report.ok else {'WARNING'}, report.summary())
+        return {'FINISHED'}
+
 class ApexChooseShaderSubmenu(bpy.types.Menu):
     """ 
         The menu to choose shader / node adder to use.
@@ -182,7 +411,84 @@ class ApexChooseShaderSubmenu(bpy.types.Menu):
                 layout.operator(shader_op_cls.bl_idname, text=f"{shader_op_cls.bl_label} (selected)")
             else:
                 layout.operator(shader_op_cls.bl_idname)
-            
+        layout.separator()
+        layout.operator(ApexConvertShaderOp.bl_idname)
+
+
+# ---
+
+class ApexToggleProfilingOp(bpy.types.Operator):
+    """Record time of each shading stage, bpy calls and memory of each material / armature. Prints a summary to the console when turned off."""
+    bl_idname = "apexaddon.toggle_profiling"
+    bl_label = "Profiling"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        if profiler.enabled:
+            profiler.enable(False)
+            print(profiler.summaryTable())
+            self.report({'INFO'}, 'Profiling stopped, summary is in the system console')
+        else:
+            profiler.enable()
+            self.report({'INFO'}, 'Profiling started')
+        return {'FINISHED'}
+
+class ApexExportProfileOp(bpy.types.Operator, ExportHelper):
+    """Export what was recorded since profiling started as a Chrome trace (open with chrome://tracing or ui.perfetto.dev)."""
+    bl_idname = "apexaddon.export_profile"
+    bl_label = "Export Profile Trace"
+    bl_options = {'REGISTER'}
+    filename_ext = ".json"
+    filter_glob: StringProperty(default="*.json", options={"HIDDEN"})
+
+    def execute(self, context):
+        profiler.saveChromeTrace(self.filepath)
+        print(profiler.summaryTable())
+        self.report({'INFO'}, f'Exported profile trace ({len(profiler.events)} events) to {self.filepath}')
+        return {'FINISHED'}
+
+class ApexToggleTextureProxyOp(bpy.types.Operator):
+    """Shade with downscaled copies of textures (cached on disk) to save memory in the viewport. Final renders swap in full resolution. Only affects materials shaded afterwards."""
+    bl_idname = "apexaddon.toggle_texture_proxy"
+    bl_label = "Texture Proxies"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        texture_proxies.enabled = not texture_proxies.enabled
+        self.report({'INFO'}, f"Texture proxies {'on' if texture_proxies.enabled else 'off'}")
+        return {'FINISHED'}
+
+class ApexToggleFullResolutionOp(bpy.types.Operator):
+    """Swap every texture proxy to its full resolution texture, or back to the proxy"""
+    bl_idname = "apexaddon.toggle_full_resolution"
+    bl_label = "Full Resolution Textures"
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        full_resolution = not texture_proxies.full_resolution
+        count = texture_proxies.setFullResolution(full_resolution)
+        self.report({'INFO'}, f"Swapped {count} textures to {'full resolution' if full_resolution else 'proxies'}")
+        return {'FINISHED'}
+
+class ApexAuditTextureMemoryOp(bpy.types.Operator):
+    """Print texture memory by armature, material and texture role of the selected objects (all if none are selected) to the system console. Can merge images with identical file content first."""
+    bl_idname = "apexaddon.audit_texture_memory"
+    bl_label = "Audit Texture Memory"
+    bl_options = {'REGISTER', 'UNDO'}
+    merge_duplicates: bpy.props.BoolProperty(name="Merge Duplicate Images", default=True)
+
+    def execute(self, context):
+        objs = [obj for obj in context.selected_objects if obj.type in ('ARMATURE', 'MESH')]
+        if not objs:
+            objs = [obj for obj in bpy.data.objects if obj.type == 'ARMATURE'] or \
+                   [obj for obj in bpy.data.objects if obj.type == 'MESH']
+        merged = mergeDuplicateImages() if self.merge_duplicates else {'merged': 0, 'saved': 0}
+        audit = auditMemory(objs)
+        logger.summary('%s', auditTable(audit))
+        logger.flush()
+        self.report({'INFO'}, f"Textures use {audit['total'] / 2**20:.1f} MiB, merged {merged['merged']} "
+                              f"duplicate images ({merged['saved'] / 2**20:.1f} MiB), details are in the system console")
+        return {'FINISHED'}
 
 # ---
 
@@ -193,6 +499,8 @@ class ApexSubmenu(bpy.types.Menu):
     def draw(self, context):
         layout = self.layout
         layout.operator(ApexShadeSelectedLegendOp.bl_idname)
+        layout.operator(ApexShadeSelectedLegendModalOp.bl_idname)
+        layout.operator(ApexExportShadingPlanOp.bl_idname)
 
         layout.separator()
 
@@ -201,21 +509,50 @@ class ApexSubmenu(bpy.types.Menu):
         layout.separator()
 
         layout.operator(ApexImportRecolor.bl_idname)
+        layout.operator(ApexImportRecolorModal.bl_idname)
+        layout.operator(ApexImportAllRecolors.bl_idname)
+        layout.menu(ApexSwitchSkinSubmenu.bl_idname)
         layout.operator(ApexShadePathfinderEmoteOp.bl_idname)
 
         layout.separator()
 
         layout.menu(ApexChooseShaderSubmenu.bl_idname)
 
+        layout.separator()
+
+        layout.operator(ApexToggleTextureProxyOp.bl_idname, text=f"Texture Proxies ({'on' if texture_proxies.enabled else 'off'})")
+        layout.operator(ApexToggleFullResolutionOp.bl_idname,
+                        text=f"Full Resolution Textures ({'on' if texture_proxies.full_resolution else 'off'})")
+        layout.operator(ApexAuditTextureMemoryOp.bl_idname)
+
+        layout.separator()
+
+        layout.operator(ApexToggleProfilingOp.bl_idname, text=f"Profiling ({'on' if profiler.enabled else 'off'})")
+        if profiler.events:
+            layout.operator(ApexExportProfileOp.bl_idname)
+
 # class contains everything that needs (un)registering
 apex_classes = (
     ApexShadeSelectedLegendOp,
+    ApexShadeSelectedLegendModalOp,
+    ApexExportShadingPlanOp,
     *remove_texture_class_ls,
+    ApexRemoveTexturesOp,
     ApexRemoveTextureSubmenu,
     ApexImportRecolor,
+    ApexImportRecolorModal,
+    ApexImportAllRecolors,
+    ApexSwitchSkinOp,
+    ApexSwitchSkinSubmenu,
     ApexShadePathfinderEmoteOp,
     *shader_op_ls,
+    ApexConvertShaderOp,
     ApexChooseShaderSubmenu,
+    ApexToggleProfilingOp,
+    ApexExportProfileOp,
+    ApexToggleTextureProxyOp,
+    ApexToggleFullResolutionOp,
+    ApexAuditTextureMemoryOp,
     ApexSubmenu
 )
 
@@ -8,6 +8,12 @@ from bpy_extras.io_utils import ImportHelper, ExportHelper
 from bpy.props import StringProperty
 from pathlib import Path
 from .node_adder import *
+from .dir_index import dir_index
+from .modal_batch import ModalBatchMixin
+from .log import logger, BatchReport
+from .bulk_undo import BulkUndo, undoModeProperty, OPERATOR_OPTIONS as BULK_UNDO_OPTIONS
+from typing import *
+import functools
 
 CURRENT_NODEADDER = TitanfallSGNodeAdder
 
@@ -23,13 +29,14 @@ class TitanfallShadeActiveMaterialOp(bpy.types.Operator):
 
     def execute(self, context):
         # chosen dir: `self.directory`
-        print("[TitanfallShadeActiveMaterial] Selected dir: '" + self.directory + "'")
+        logger.summary("[TitanfallShadeActiveMaterial] Selected dir: '%s'", self.directory)
 
         obj = context.active_object
         if obj.type != 'MESH':
             raise Exception(f'{obj} is not mesh')
         
         utils.shadeMaterialByDirectory(obj.active_material, Path(self.directory), CURRENT_NODEADDER)
+        logger.flush()
 
         return {'FINISHED'}
 
@@ -37,6 +44,12 @@ class TitanfallShadeActiveMaterialOp(bpy.types.Operator):
         context.window_manager.fileselect_add(self)
         return {'RUNNING_MODAL'}
 
+def getMeshOrArmature(context) -> List[bpy.types.Object]:
+    obj = context.active_object
+    if obj.type not in ['MESH', 'ARMATURE']:
+        raise Exception('Object is not mesh or armature')
+    return [obj]
+
 class TitanfallShadeByMaterialMatchingOp(bpy.types.Operator):
     "Choose a folder, try to match the name of subfolder for each material "
     "and shade from the most similarly names subfolder. "
@@ -50,37 +63,43 @@ class TitanfallShadeByMaterialMatchingOp(bpy.types.Operator):
 
     def execute(self, context):
         # chosen dir: `self.directory`
-        print("[TitanfallShadeMeshByMaterialMatching] Selected dir: '" + self.directory + "'")
+        logger.summary("[TitanfallShadeMeshByMaterialMatching] Selected dir: '%s'", self.directory)
 
-        obj = context.active_object
+        # shade all material, one that fails doesn't stop the others
+        report = BatchReport('Shade by material name matching')
+        for mat, mat_dir_path in utils.matchMaterialDirectories(getMeshOrArmature(context), self.directory):
+            report.run(mat.name, utils.shadeMaterialByDirectory, mat, mat_dir_path, CURRENT_NODEADDER)
+        dir_index.save()
+        report.log()
+        self.report({'INFO'} if report.ok else {'WARNING'}, report.summary())
 
-        # get all meshes need shading
-        if obj.type == 'MESH':
-            meshes = [obj]
-        elif obj.type == 'ARMATURE':
-            meshes = [m for m in obj.children if m.type == 'MESH']
-        else:
-            raise Exception('Object is not mesh or armature')
-        
-        # get all materials needs shading 
-        mat_ls = [mat for mesh in meshes for mat in mesh.data.materials]
-        mat_ls = list(set(mat_ls))  # avoid shading same material multiple times
+        return {'FINISHED'}
 
-        # match name of material to folder
-        mat_name_ls = [mat.name for mat in mat_ls]
-        folder_name_ls = [p.name for p in Path(self.directory).iterdir() if p.is_dir()]
-        name_map = utils.matchString(mat_name_ls, folder_name_ls)
-        
-        print('    Matching result:')
-        for mat in mat_ls:
-            print(f'        {mat.name} -> {name_map[mat.name]}')
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
 
-        # shade all material
-        for mat in mat_ls:
-            mat_dir_path = Path(self.directory) / name_map[mat.name]
-            utils.shadeMaterialByDirectory(mat, mat_dir_path, CURRENT_NODEADDER)
+class TitanfallShadeByMaterialMatchingModalOp(ModalBatchMixin, bpy.types.Operator):
+    """Shade by material name matching without freezing blender. Shows progress in the status bar, press Esc to cancel."""
+    bl_idname = "apexaddon.titanfall_shade_material_matching_modal"
+    bl_label = "Shade By Material Name Matching (Folder, Non-blocking)"
+    bl_options = {'REGISTER'}
+    directory: bpy.props.StringProperty(name="Directory", options={"HIDDEN"})
+    filter_folder: bpy.props.BoolProperty(default=True, options={"HIDDEN"})
 
-        return {'FINISHED'}
+    def execute(self, context):
+        logger.summary("[TitanfallShadeMeshByMaterialMatching] Selected dir: '%s'", self.directory)
+
+        steps = [
+            # by name, the material may be removed while the batch runs
+            (f'Shading {mat.name}', functools.partial(utils.shadeMaterialByDirectoryName, mat.name, mat_dir_path, CURRENT_NODEADDER))
+            for mat, mat_dir_path in utils.matchMaterialDirectories(getMeshOrArmature(context), self.directory)
+        ]
+        return self.startBatch(context, steps)
+
+    def finishBatch(self, context, cancelled):
+        super().finishBatch(context, cancelled)
+        dir_index.save()
 
     def invoke(self, context, event):
         context.window_manager.fileselect_add(self)
@@ -93,9 +112,6 @@ class TitanfallToggleEmissionOnOp(bpy.types.Operator):
     bl_options = {'REGISTER'}
 
     def execute(self, context):
-        # chosen dir: `self.directory`
-        print("[TitanfallShadeActiveMaterial] Selected dir: '" + self.directory + "'")
-
         obj = context.active_object
 
         # get all meshes need shading
@@ -116,6 +132,32 @@ class TitanfallToggleEmissionOnOp(bpy.types.Operator):
 
         return {'FINISHED'}
 
+class TitanfallRemoveTexturesOp(bpy.types.Operator):
+    """Remove any of the textures from all selected armatures or meshes at once"""
+    bl_idname = "apexaddon.titanfall_remove_textures"
+    bl_label = "Remove Textures From Selected..."
+    bl_options = BULK_UNDO_OPTIONS
+    undo_mode: undoModeProperty()
+    roles: bpy.props.EnumProperty(
+        name="Textures",
+        items=[(role, role, f"Remove {role}") for role, spec in TitanfallSGNodeAdder.roles.items() if not spec.ignore],
+        options={'ENUM_FLAG'},
+    )
+
+    def execute(self, context):
+        objs = [obj for obj in context.selected_objects if obj.type in ['MESH', 'ARMATURE']]
+        mat_names = [mat.name for mat in utils.collectMaterials(objs)[0]]
+        bulk_undo = BulkUndo(self, 'remove_textures', len(mat_names))
+        bulk_undo.begin()
+        report = utils.removeTextures(objs, self.roles)
+        undo_msg = bulk_undo.end(mat_names)
+        logger.flush()
+        self.report({'INFO'} if report.ok else {'WARNING'}, f'{report.summary()}. {undo_msg}' if undo_msg else report.summary())
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
 # ---
 
 class TitanfallSubmenu(bpy.types.Menu):
@@ -126,11 +168,15 @@ class TitanfallSubmenu(bpy.types.Menu):
         layout = self.layout
         layout.operator(TitanfallShadeActiveMaterialOp.bl_idname)
         layout.operator(TitanfallShadeByMaterialMatchingOp.bl_idname)
+        layout.operator(TitanfallShadeByMaterialMatchingModalOp.bl_idname)
+        layout.operator(TitanfallRemoveTexturesOp.bl_idname)
 
 # class contains everything that needs (un)registering
 titanfall_classes = (
     TitanfallShadeActiveMaterialOp,
     TitanfallShadeByMaterialMatchingOp,
+    TitanfallShadeByMaterialMatchingModalOp,
+    TitanfallRemoveTexturesOp,
     TitanfallSubmenu
 )
 
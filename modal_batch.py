@@ -0,0 +1,99 @@
+"""
+    Non-blocking batch operators.
+
+    Shading a lot of meshes at once freezes blender for minutes. Operators using
+    `ModalBatchMixin` split the work into small steps (usually one material each)
+    and run them in time-budgeted slices on a modal timer, so the UI stays
+    responsive, shows progress / ETA in the status bar and can be cancelled with Esc.
+"""
+
+import bpy
+import time
+from typing import *
+from .profiler import profiler
+from .log import logger, BatchReport
+
+class ModalBatchMixin:
+    """
+        Mixin for operators that run a list of steps in time-sliced batches.
+
+        Call `self.startBatch(context, steps)` from execute() and return its result.
+        `steps` is a list of (description, callable). A step that raises is recorded
+        in `self.batch_report` (ref. `log.BatchReport`) and the batch continues with the next step.
+
+        Override `finishBatch(context, cancelled)` to do something after the batch, and
+        `batchDetails()` to add to the report (the operator reports once, blender only shows the last one).
+    """
+    # seconds of work per timer tick, the UI is redrawn between slices
+    time_budget = 0.1
+    batch_label = 'Shading'
+
+    def startBatch(self, context, steps: List[Tuple[str, Callable[[], Any]]]):
+        self._steps = steps
+        self._step_idx = 0
+        self._start_time = time.perf_counter()
+        self.batch_report = BatchReport(self.batch_label)
+
+        wm = context.window_manager
+        wm.progress_begin(0, max(len(steps), 1))
+        self._timer = wm.event_timer_add(0.01, window=context.window)
+        wm.modal_handler_add(self)
+        self._updateStatus(context)
+        return {'RUNNING_MODAL'}
+
+    def _updateStatus(self, context):
+        done, total = self._step_idx, len(self._steps)
+        elapsed = time.perf_counter() - self._start_time
+        if done == 0:
+            eta = '?'
+        else:
+            eta = f'{elapsed / done * (total - done):.0f}s'
+        context.workspace.status_text_set(
+            f'{self.batch_label}: {done}/{total} ({100 * done // max(total, 1)}%), ETA {eta}. Press Esc to cancel')
+        context.window_manager.progress_update(done)
+
+    def _endBatch(self, context, cancelled: bool):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+        self.finishBatch(context, cancelled)
+        return {'CANCELLED'} if cancelled else {'FINISHED'}
+
+    def finishBatch(self, context, cancelled: bool):
+        done, total = self._step_idx, len(self._steps)
+        elapsed = time.perf_counter() - self._start_time
+        state = 'cancelled' if cancelled else 'finished'
+        failed_cnt = len(self.batch_report.failed_ls)
+        msg = f'{self.batch_label} {state}: {done}/{total} steps in {elapsed:.1f}s, {failed_cnt} failed'
+        details = self.batchDetails()
+        if details:
+            msg += f'. {details}'
+        self.report({'WARNING'} if cancelled or failed_cnt else {'INFO'}, msg)
+        self.batch_report.log()
+        if profiler.enabled:
+            print(profiler.summaryTable())
+
+    def batchDetails(self) -> str:
+        return ''
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            # steps are never interrupted, so this always stops between materials
+            return self._endBatch(context, cancelled=True)
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        # always do at least one step per tick, even if it's slower than the budget
+        deadline = time.perf_counter() + self.time_budget
+        while self._step_idx < len(self._steps):
+            description, step = self._steps[self._step_idx]
+            self.batch_report.run(description, step)
+            self._step_idx += 1
+            if time.perf_counter() >= deadline:
+                break
+
+        if self._step_idx >= len(self._steps):
+            return self._endBatch(context, cancelled=False)
+        self._updateStatus(context)
+        return {'RUNNING_MODAL'}
@@ -2,50 +2,126 @@ import bpy
 from . import config
 from pathlib import Path
 from collections import defaultdict
+from typing import *
+from .image_registry import loadImage
+from .dir_index import splitTextureName
+from .prefetch import getImageInfo
+from .shader_library import getNodeGroup
+from .texture_roles import RoleSpec, compileRoles, group_sockets, packedRole, parsePackedRole
+from .profiler import profiler
+
+# texture path an image node was added for. its image may be one loaded for another file with
+# the same content (ref. `image_registry`), or a proxy (ref. `texture_proxy`)
+TEXTURE_PATH_PROP = 'apex_texture_path'
+# texture role (e.g. `albedoTexture`, or a `packed:` role) a node was added for, on image nodes
+# and the nodes of their sub-graphs
+TEXTURE_ROLE_PROP = 'apex_texture_role'
 
-shader_cache = {}
 def fetchNodeGroupFromCacheOrFile(name: str, blend_fpath: Path, contain_name: str):
     """
-        Get a shader node group from cache (if fetched before), else search from blend file.
-        The cache is `shader_cache`.
+        Get a shader node group from current file (if imported before), else import it from blend file.
+        Only that node group is imported, see `shader_library`.
 
         Args:
-            name: the index for the cache
-            blend_fpath: blend file path if cache miss
+            name: name of the node adder's node group, only for messages
+            blend_fpath: blend file path if not imported yet
             contain_name: will do `contain_name in group.name` when searching from the file
     """
-    blend_fpath = str(blend_fpath)
-
-    # use cached node group for the same file if already loaded from file before
-    if name in shader_cache:
-        print(f'Use cached node group: {name}')
-        # check cache integrity in case of RSAStruct error
-        # (reference will become invalid when creating / reopening a file without closing blender)
-        if 'invalid' in str(shader_cache[name]):
-            print(f'Cache invalid, re-import...')
-        else:
-            return shader_cache[name]
+    try:
+        return getNodeGroup(blend_fpath, contain_name)
+    except Exception as e:
+        raise Exception(f'{name}: {e}')
+
+def addOpacityMix(mat, img_node, cas_node_group, location, color):
+    """
+        Sub-graph of opacity textures: mix the node group's shader with a transparent
+        one, by the opacity image.
+    """
+    transparent_node = mat.node_tree.nodes.new(type='ShaderNodeBsdfTransparent')
+    transparent_node.location = (200, 200)
     
-    print(f'Import node group from file: {blend_fpath}')
-    with bpy.data.libraries.load(blend_fpath) as (data_from, data_to):
-        data_to.node_groups = data_from.node_groups
-
-    # just return any shader matched in there
-    for group in data_to.node_groups:
-        if contain_name in group.name:
-            shader_cache[name] = group
-            return group
-    else:
-        raise Exception(f'No "{contain_name}" node tree in {blend_fpath}.')
+    mix_shader_node = mat.node_tree.nodes.new(type='ShaderNodeMixShader')
+    mix_shader_node.inputs[0].default_value = 1     # so if there's no image node as input it is no-op
+    mix_shader_node.location = (400, 200)
+
+    # find output node
+    output_node = [node for node in mat.node_tree.nodes.values() if node.type == 'OUTPUT_MATERIAL'][0]
+
+    # ref. https://youtu.be/dMqk0jz749U?t=1108
+    mat.node_tree.links.new(color, mix_shader_node.inputs[0])
+    mat.node_tree.links.new(transparent_node.outputs[0], mix_shader_node.inputs[1])
+
+    # should actually take whatever is linked to output_node.inputs['Surface'] as input
+    # but may not be the best to assume that. oh well.
+    mat.node_tree.links.new(cas_node_group.outputs[0], mix_shader_node.inputs[2])
+    mat.node_tree.links.new(mix_shader_node.outputs[0], output_node.inputs['Surface'])
+
+def addEmissionTint(mat, img_node, cas_node_group, location, color):
+    """
+        Sub-graph of Titanfall emission textures, a mix color node between the
+        image and the node group. Returns it, the role's links go from there.
+    """
+    # s.t. if you want pilot emission to shine cyan, just make fac = 1
+    mix_rgb_node = mat.node_tree.nodes.new(type='ShaderNodeMixRGB')
+    mix_rgb_node.blend_type = 'MULTIPLY'
+    mix_rgb_node.inputs['Fac'].default_value = 0
+    mix_rgb_node.inputs['Color2'].default_value = [0, 1, 1, 1]  # cyan color
+    mix_rgb_node.location = (location[0] - 200, location[1])
+    mix_rgb_node.label = 'Emission Mix Node'
+
+    mat.node_tree.links.new(color, mix_rgb_node.inputs['Color1'])
+    return mix_rgb_node
+
+def addPathfinderEmoteUV(mat, img_node, cas_node_group, location, color):
+    """
+        Sub-graph of Pathfinder emote albedo, ref. `PathfinderEmoteNodeAdder`.
+    """
+    path_node_group = mat.node_tree.nodes.new(type='ShaderNodeGroup')
+    path_node_group.node_tree = PathfinderEmoteNodeAdder.getPathfinderUVTransformNodeGroup()
+    path_node_group.hide = True
+    path_node_group.location = (-200 + location[0], location[1])
+
+    texture_coord_node = mat.node_tree.nodes.new(type='ShaderNodeTexCoord')
+    texture_coord_node.hide = True
+    texture_coord_node.location = (-400 + location[0], location[1] + 50)
+
+    value_node = mat.node_tree.nodes.new(type='ShaderNodeValue')
+    value_node.label = 'Value (Click its left & right button to rotate emote)'
+    value_node.width = 300
+    value_node.location = (-590 + location[0], location[1] - 50)
+
+    mat.node_tree.links.new(texture_coord_node.outputs['UV'], path_node_group.inputs[0])
+    mat.node_tree.links.new(value_node.outputs[0], path_node_group.inputs[1])
+
+    mat.node_tree.links.new(path_node_group.outputs[0], img_node.inputs[0])
+
+# Separate Color replaced Separate RGB in blender 3.3
+SEPARATE_COLOR_NODE = 'ShaderNodeSeparateColor' if bpy.app.version >= (3, 3, 0) else 'ShaderNodeSeparateRGB'
+
+# extra sub-graphs of texture roles (`RoleSpec.extra`). Called with (material, image node,
+# shader group node, texture location, color socket) after the image node is added, may return
+# the node the role's links start from instead of the image node. The color socket is where the
+# texture's value comes from: the image's Color output, or a channel of a channel-packed image.
+sub_graphs = {
+    'opacity_mix': addOpacityMix,
+    'emission_tint': addEmissionTint,
+    'pathfinder_emote_uv': addPathfinderEmoteUV,
+}
 
 class NodeAdder:
     """
         The class used for adding image shader nodes
 
+        Which textures are added and how is the `roles` table (suffix -> `RoleSpec`,
+        ref. `texture_roles`), made by `compileRoles()` from a list of specs.
+
         Note that since the image texture might be removed by "Remove Texture",
         you must guarentee that even if the image texture is directly removed,
         the rest of nodes you add won't affect the outcome.
     """
+    roles = {}
+    sub_graphs = sub_graphs
+
     @staticmethod
     def getShaderNodeGroup():
         """
@@ -59,159 +135,184 @@ class NodeAdder:
         raise NotImplementedError()
 
     @classmethod
-    def addImageTexture(cls, img_path: Path, mat, shader_node_group, location=(0.0, 0.0)):
+    def addImageTexture(cls, img_path: Path, mat, shader_node_group, location=(0.0, 0.0), role: Optional[str] = None) -> bool:
         """
             Given an image specified by `img_path`, attach that image to its appropriate position.
-            Need to handle the creation of image node.
+            Returns False if the image is not added (unknown role or not accepted).
 
             shader_node_group is a node that is created by the node tree from getShaderNodeGroup()
             location should be the position of the image node (but not necessarily).
+            role is the texture name suffix, if already known (e.g. from a shading plan).
+            `packed:` roles are channel-packed images (ref. `channel_pack`).
         """
-        raise NotImplementedError()
-        
-class CoresNodeAdder(NodeAdder):
-    """
-        Cores Apex Shader from `Apex Shader.blend`
-        credits `CoReArtZz` 
-        ref. https://www.reddit.com/r/apexlegends/comments/jtg4a7/basic_guide_to_render_apex_legends_models_in/
-    """
+        role = role if role is not None else splitTextureName(img_path.name)[1]
+        if parsePackedRole(role) is None and (role not in cls.roles or not cls.acceptImage(img_path)):
+            return False
+        cls.addTexture(role, img_path, mat, shader_node_group, location)
+        return True
 
-    @staticmethod
-    def _addAlbedo(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Albedo'])
+    @classmethod
+    def addTexture(cls, role: str, img_path: Path, mat, shader_node_group, location=(0.0, 0.0)):
+        """
+            `addImageTexture()` of a texture already known to be added, e.g. from
+            `MaterialPlan.plannedTextures()`: the role is known and the image accepted.
+        """
+        layout = parsePackedRole(role)
+        if layout is not None:
+            cls.addPackedTexture(layout, img_path, mat, shader_node_group, location)
+        else:
+            cls.addRole(cls.roles[role], img_path, mat, shader_node_group, location)
 
-    @staticmethod
-    def _addNormal(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        img_node.image.colorspace_settings.name = 'Non-Color'
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Normal'])
+    @classmethod
+    def addRole(cls, spec: RoleSpec, img_path: Path, mat, shader_node_group, location=(0.0, 0.0)):
+        """
+            Add the image node of one texture and everything its role spec says.
+        """
+        if spec.ignore:
+            return
+        img_node = cls.addImageNode(img_path, mat, (location[0] + spec.offset[0], location[1] + spec.offset[1]),
+                                    spec.colorspace, spec.suffix)
+        cls.linkRole(spec, mat, img_node, img_node.outputs, shader_node_group, location)
 
-    @staticmethod
-    def _addAO(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['AO'])
+    @classmethod
+    def addPackedTexture(cls, layout: Dict[str, str], img_path: Path, mat, shader_node_group, location=(0.0, 0.0)):
+        """
+            Add a channel-packed image (`layout` is channel -> role), and a Separate Color
+            node each packed role is linked from, as if it was its own image.
+        """
+        specs = {channel: cls.roles[role] for channel, role in layout.items()}
+        # channels R / G / B have the same colorspace (ref. `compileRoles()`)
+        colorspace = next((spec.colorspace for channel, spec in specs.items() if channel != 'A'), None)
+        img_node = cls.addImageNode(img_path, mat, (location[0] - 200, location[1]), colorspace, packedRole(layout))
+        img_node.image.alpha_mode = 'CHANNEL_PACKED'
+        cls.linkPacked(specs, mat, img_node, shader_node_group, location)
 
-    @staticmethod
-    def _addGlossy(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Glossy'])
+    @classmethod
+    def linkPacked(cls, specs: Dict[str, RoleSpec], mat, img_node, shader_node_group, location=(0.0, 0.0)):
+        """
+            Everything of a packed image after its image node, `specs` is channel -> role spec.
+        """
+        separate_node = mat.node_tree.nodes.new(type=SEPARATE_COLOR_NODE)
+        separate_node.hide = True
+        separate_node.location = location
+        separate_node[TEXTURE_ROLE_PROP] = img_node[TEXTURE_ROLE_PROP]
+        with profiler.stage('link'):
+            mat.node_tree.links.new(img_node.outputs['Color'], separate_node.inputs[0])
+        for channel, spec in specs.items():
+            output = img_node.outputs['Alpha'] if channel == 'A' else separate_node.outputs['RGB'.index(channel)]
+            cls.linkRole(spec, mat, img_node, [output], shader_node_group, location)
 
-    @staticmethod
-    def _addEmmisive(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Emission'])
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Emission Color'])
-    
-    @staticmethod
-    def _addCavity(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Cavity'])
+    @classmethod
+    def relinkImageNode(cls, img_node, role: str, mat, shader_node_group) -> bool:
+        """
+            Link an image node that is already in the material (e.g. added for another shader)
+            as texture `role`, the image itself is kept. Returns False if there's no such role.
+        """
+        # materials shaded before nodes were tagged don't have it yet
+        img_node[TEXTURE_ROLE_PROP] = role
+        layout = parsePackedRole(role)
+        if layout is not None:
+            specs = {channel: cls.roles[r] for channel, r in layout.items() if r in cls.roles and not cls.roles[r].ignore}
+            if not specs:
+                return False
+            colorspace = next((spec.colorspace for channel, spec in specs.items() if channel != 'A'), None)
+            location = (img_node.location[0] + 200, img_node.location[1])
+            cls.linkPacked(specs, mat, img_node, shader_node_group, location)
+        else:
+            spec = cls.roles.get(role)
+            if spec is None or spec.ignore:
+                return False
+            colorspace = spec.colorspace
+            location = (img_node.location[0] - spec.offset[0], img_node.location[1] - spec.offset[1])
+            cls.linkRole(spec, mat, img_node, img_node.outputs, shader_node_group, location)
+        if colorspace is not None and img_node.image.colorspace_settings.name != colorspace:
+            img_node.image.colorspace_settings.name = colorspace
+        return True
 
     @staticmethod
-    def _addSpec(img_path, mat, cas_node_group, location):
+    def addImageNode(img_path: Path, mat, location, colorspace: Optional[str] = None, role: Optional[str] = None):
         img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
         img_node.hide = True
         img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Specular'])
+        img_node.image = loadImage(img_path)
+        img_node[TEXTURE_PATH_PROP] = str(img_path)
+        img_node[TEXTURE_ROLE_PROP] = role if role is not None else splitTextureName(Path(img_path).name)[1]
+        if colorspace is not None:
+            img_node.image.colorspace_settings.name = colorspace
+        return img_node
 
-    @staticmethod
-    def _addSubsurface(img_path, mat, cas_node_group, location):
-        # scatterThicknessTexture is possibly just subsurface, so that texture will use this function for now
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Subsurface'])
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Subsurface Color'])
-    
-    @staticmethod
-    def _addAnisoSpecDir(img_path, mat, cas_node_group, location):
-        pass
-    
-    @staticmethod
-    def _addTransmittanceTint(img_path, mat, cas_node_group, location):
-        pass
-    
-    @staticmethod
-    def _addOpacityMultiply(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
+    @classmethod
+    def linkRole(cls, spec: RoleSpec, mat, img_node, outputs, shader_node_group, location=(0.0, 0.0)):
+        """
+            Everything of a role after its image node: extra sub-graph, links, defaults, blend method.
+            `outputs` are the sockets the texture's values come from, indexed like `IMAGE_OUTPUTS`
+            (the image node's outputs, or only the channel of a packed image).
+        """
+        if spec.extra is not None:
+            nodes = mat.node_tree.nodes
+            node_names = set(nodes.keys())
+            source_node = cls.sub_graphs[spec.extra](mat, img_node, shader_node_group, location, outputs[0])
+            for node in nodes:
+                if node.name not in node_names:
+                    node[TEXTURE_ROLE_PROP] = spec.suffix
+            if source_node is not None:
+                outputs = source_node.outputs
+        with profiler.stage('link'):
+            for output_idx, group_input in spec.output_links:
+                mat.node_tree.links.new(outputs[output_idx], group_sockets.input(shader_node_group, group_input))
+        for group_input, value in spec.defaults.items():
+            group_sockets.input(shader_node_group, group_input).default_value = value
+        if spec.blend_method is not None:
+            mat.blend_method = spec.blend_method
 
-        transparent_node = mat.node_tree.nodes.new(type='ShaderNodeBsdfTransparent')
-        transparent_node.location = (200, 200)
-        
-        mix_shader_node = mat.node_tree.nodes.new(type='ShaderNodeMixShader')
-        mix_shader_node.inputs[0].default_value = 1     # so if there's no image node as input it is no-op
-        mix_shader_node.location = (400, 200)
-
-        # find output node
-        output_node = [node for node in mat.node_tree.nodes.values() if node.type == 'OUTPUT_MATERIAL'][0]
-
-        # ref. https://youtu.be/dMqk0jz749U?t=1108
-        img_node.image.colorspace_settings.name = 'Non-Color'
-        mat.node_tree.links.new(img_node.outputs['Color'], mix_shader_node.inputs[0])
-        mat.node_tree.links.new(transparent_node.outputs[0], mix_shader_node.inputs[1])
-
-        # should actually take whatever is linked to output_node.inputs['Surface'] as input
-        # but may not be the best to assume that. oh well.
-        mat.node_tree.links.new(cas_node_group.outputs[0], mix_shader_node.inputs[2])
-        mat.node_tree.links.new(mix_shader_node.outputs[0], output_node.inputs['Surface'])
-        mat.blend_method = 'CLIP'
+    @classmethod
+    def addsRole(cls, role: str) -> bool:
+        """
+            Whether a texture of `role` gets an image node: the role is known and not ignored.
+            A packed role does if any of its channels does.
+        """
+        layout = parsePackedRole(role)
+        sub_roles = layout.values() if layout is not None else [role]
+        return any(r in cls.roles and not cls.roles[r].ignore for r in sub_roles)
+
+    @classmethod
+    def acceptImage(cls, img_path: Path) -> bool:
+        """
+            Whether the image should be added at all. By default, missing or broken
+            files are skipped. Header info (resolution, bit depth, channels, ...) from
+            `getImageInfo()` can also be used here.
+        """
+        return getImageInfo(img_path)['error'] is None
         
-    
-    method = {
-        'albedoTexture': _addAlbedo,
-        'aoTexture': _addAO,
-        'cavityTexture': _addCavity,
-        'emissiveTexture': _addEmmisive,
-        'glossTexture': _addGlossy,
-        'normalTexture': _addNormal,
-        'specTexture': _addSpec,
-        'opacityMultiplyTexture': _addOpacityMultiply,
-        'scatterThicknessTexture': _addSubsurface,
+class CoresNodeAdder(NodeAdder):
+    """
+        Cores Apex Shader from `Apex Shader.blend`
+        credits `CoReArtZz` 
+        ref. https://www.reddit.com/r/apexlegends/comments/jtg4a7/basic_guide_to_render_apex_legends_models_in/
+    """
+    role_specs = [
+        RoleSpec('albedoTexture', [('Color', 'Albedo')]),
+        RoleSpec('aoTexture', [('Color', 'AO')], pack_channel='R'),
+        RoleSpec('cavityTexture', [('Color', 'Cavity')], pack_channel='G'),
+        RoleSpec('emissiveTexture', [('Color', 'Emission'), ('Color', 'Emission Color')]),
+        RoleSpec('glossTexture', [('Color', 'Glossy')], pack_channel='B'),
+        RoleSpec('normalTexture', [('Color', 'Normal')], colorspace='Non-Color'),
+        RoleSpec('specTexture', [('Color', 'Specular')]),
+        RoleSpec('opacityMultiplyTexture', colorspace='Non-Color', extra='opacity_mix', blend_method='CLIP', pack_channel='A'),
+        # scatterThicknessTexture is possibly just subsurface, so that texture will use this for now
+        RoleSpec('scatterThicknessTexture', [('Color', 'Subsurface'), ('Color', 'Subsurface Color')]),
 
         # those are things I don't even know how to deal with
         # (or so hard to deal with I just quitted)
-        'anisoSpecDirTexture': _addAnisoSpecDir,
-        'transmittanceTintTexture': _addTransmittanceTint,
-    }
+        RoleSpec('anisoSpecDirTexture', ignore=True),
+        RoleSpec('transmittanceTintTexture', ignore=True),
+    ]
+    roles = compileRoles(role_specs, sub_graphs)
 
     @staticmethod
     def getShaderNodeGroup():
         filepath = config.CORE_APEX_SHADER_BLENDER_FILE
         return fetchNodeGroupFromCacheOrFile('CoresApexShader_cache', filepath, 'Cores Apex Shader')
-
-    @classmethod
-    def addImageTexture(cls, img_path, mat, cas_node_group, location=(0.0, 0.0)):
-        # get name
-        texture_name = img_path.stem[img_path.stem.rindex('_')+1:]
-        if texture_name not in cls.method.keys():
-            return False
-        # add texture
-        cls.method[texture_name](img_path, mat, cas_node_group, location)
-        return True
         
 class PlusNodeAdder(NodeAdder):
     """
@@ -219,128 +320,32 @@ class PlusNodeAdder(NodeAdder):
         credits `unknown` 
         ref. https://github.com/ovlack/apex-info/commit/a9ec3ff2fab88546b8f91c1d62fd399652fe23c2/
     """
-
-    @staticmethod
-    def _addAlbedo(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Albedo'])
-
-    @staticmethod
-    def _addNormal(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        img_node.image.colorspace_settings.name = 'Non-Color'
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Normal Map'])
-
-    @staticmethod
-    def _addAO(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['AO (Ambient Occlussion)'])
-
-    @staticmethod
-    def _addGlossy(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Glossiness'])
-
-    @staticmethod
-    def _addEmmisive(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Emission'])
-    
-    @staticmethod
-    def _addCavity(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Cavity'])
-
-    @staticmethod
-    def _addSpec(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Specular'])
-
-    @staticmethod
-    def _addSubsurface(img_path, mat, cas_node_group, location):
-        # scatterThicknessTexture is possibly just subsurface, so that texture will use this function for now
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['SSS (Subsurface Scattering)'])
-        mat.node_tree.links.new(img_node.outputs['Alpha'], cas_node_group.inputs['SSS Alpha'])
-        cas_node_group.inputs['SSS Strength'].default_value = 0.5
-    
-    @staticmethod
-    def _addAnisoSpecDir(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Anis-SpecDir'])
-    
-    @staticmethod
-    def _addTransmittanceTint(img_path, mat, cas_node_group, location):
-        pass
-    
-    @staticmethod
-    def _addOpacityMultiply(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Alpha//OpacityMult'])
-        
-    
-    method = {
-        'albedoTexture': _addAlbedo,
-        'aoTexture': _addAO,
-        'cavityTexture': _addCavity,
-        'emissiveTexture': _addEmmisive,
-        'glossTexture': _addGlossy,
-        'normalTexture': _addNormal,
-        'specTexture': _addSpec,
-        'opacityMultiplyTexture': _addOpacityMultiply,
-        'scatterThicknessTexture': _addSubsurface,
+    role_specs = [
+        RoleSpec('albedoTexture', [('Color', 'Albedo')]),
+        RoleSpec('aoTexture', [('Color', 'AO (Ambient Occlussion)')], pack_channel='R'),
+        RoleSpec('cavityTexture', [('Color', 'Cavity')], pack_channel='G'),
+        RoleSpec('emissiveTexture', [('Color', 'Emission')]),
+        RoleSpec('glossTexture', [('Color', 'Glossiness')], pack_channel='B'),
+        RoleSpec('normalTexture', [('Color', 'Normal Map')], colorspace='Non-Color'),
+        RoleSpec('specTexture', [('Color', 'Specular')]),
+        # sRGB, so it can't go in alpha of packed images
+        RoleSpec('opacityMultiplyTexture', [('Color', 'Alpha//OpacityMult')]),
+        # scatterThicknessTexture is possibly just subsurface, so that texture will use this for now
+        RoleSpec('scatterThicknessTexture', [('Color', 'SSS (Subsurface Scattering)'), ('Alpha', 'SSS Alpha')],
+                 defaults={'SSS Strength': 0.5}),
+        RoleSpec('anisoSpecDirTexture', [('Color', 'Anis-SpecDir')]),
 
         # those are things I don't even know how to deal with
         # (or so hard to deal with I just quitted)
-        'anisoSpecDirTexture': _addAnisoSpecDir,
-        'transmittanceTintTexture': _addTransmittanceTint,
-    }
+        RoleSpec('transmittanceTintTexture', ignore=True),
+    ]
+    roles = compileRoles(role_specs, sub_graphs)
 
     @staticmethod
     def getShaderNodeGroup():
         filepath = config.PLUS_APEX_SHADER_BLENDER_FILE
         return fetchNodeGroupFromCacheOrFile('PlusNodeAdder_cache', filepath, 'Apex Shader+')
 
-    @classmethod
-    def addImageTexture(cls, img_path, mat, cas_node_group, location=(0.0, 0.0)):
-        # get name
-        texture_name = img_path.stem[img_path.stem.rindex('_')+1:]
-        if texture_name not in cls.method.keys():
-            return False
-        # add texture
-        cls.method[texture_name](img_path, mat, cas_node_group, location)
-        return True
-
 class PathfinderEmoteNodeAdder(CoresNodeAdder):
     """
         Translate UV map for emote's albedo texture to use different emote.
@@ -365,38 +370,12 @@ class PathfinderEmoteNodeAdder(CoresNodeAdder):
         # the node group spec above is from a built-in node.
         filepath = config.PATHFINDER_EMOTE_SHADER_BLENDER_FILE
         return fetchNodeGroupFromCacheOrFile('PathfinderEmoteNodeAdder_cache', filepath, 'Pathfinder Emote UV Transform Node')
-        
-    @staticmethod
-    def _addAlbedo(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Albedo'])
-
-        path_node_group = mat.node_tree.nodes.new(type='ShaderNodeGroup')
-        path_node_group.node_tree = PathfinderEmoteNodeAdder.getPathfinderUVTransformNodeGroup()
-        path_node_group.hide = True
-        path_node_group.location = (-200 + location[0], location[1])
-
-        texture_coord_node = mat.node_tree.nodes.new(type='ShaderNodeTexCoord')
-        texture_coord_node.hide = True
-        texture_coord_node.location = (-400 + location[0], location[1] + 50)
-
-        value_node = mat.node_tree.nodes.new(type='ShaderNodeValue')
-        value_node.label = 'Value (Click its left & right button to rotate emote)'
-        value_node.width = 300
-        value_node.location = (-590 + location[0], location[1] - 50)
-
-        mat.node_tree.links.new(texture_coord_node.outputs['UV'], path_node_group.inputs[0])
-        mat.node_tree.links.new(value_node.outputs[0], path_node_group.inputs[1])
-
-        mat.node_tree.links.new(path_node_group.outputs[0], img_node.inputs[0])
-        return 
-
 
-    method = CoresNodeAdder.method.copy()
-    method['albedoTexture'] = _addAlbedo
+    role_specs = [
+        spec.replace(extra='pathfinder_emote_uv') if spec.suffix == 'albedoTexture' else spec
+        for spec in CoresNodeAdder.role_specs
+    ]
+    roles = compileRoles(role_specs, sub_graphs)
  
 class TitanfallSGNodeAdder(NodeAdder):
     """
@@ -406,127 +385,27 @@ class TitanfallSGNodeAdder(NodeAdder):
             - https://noskill.gitbook.io/titanfall2/r2-ripping/model-ripping
             - https://github.com/Wanty5883/Titanfall2/blob/master/tools/SG_Shader.blend
     """
-
-    @staticmethod
-    def _addDiffuse(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Diffuse map'])
-
-    @staticmethod
-    def _addNormal(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        img_node.image.colorspace_settings.name = 'Non-Color'
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Normal map'])
-
-    @staticmethod
-    def _addAO(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['AO map'])
-
-    @staticmethod
-    def _addGlossy(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Glossiness map'])
-
-    @staticmethod
-    def _addEmmisive(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = (location[0] - 500, location[1])
-        img_node.image = bpy.data.images.load(str(img_path))
-
-        # add mix color node
-        # s.t. if you want pilot emission to shine cyan, just make fac = 1
-        mix_rgb_node = mat.node_tree.nodes.new(type='ShaderNodeMixRGB')
-        mix_rgb_node.blend_type = 'MULTIPLY'
-        mix_rgb_node.inputs['Fac'].default_value = 0
-        mix_rgb_node.inputs['Color2'].default_value = [0, 1, 1, 1]  # cyan color
-        mix_rgb_node.location = (location[0] - 200, location[1])
-        mix_rgb_node.label = 'Emission Mix Node'
-
-        mat.node_tree.links.new(img_node.outputs['Color'], mix_rgb_node.inputs['Color1'])
-        mat.node_tree.links.new(mix_rgb_node.outputs['Color'], cas_node_group.inputs['Emission input'])
-    
-    @staticmethod
-    def _addCavity(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Cavity map'])
-
-    @staticmethod
-    def _addSpec(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-        mat.node_tree.links.new(img_node.outputs['Color'], cas_node_group.inputs['Specular map'])
-
-    @staticmethod
-    def _addOpacityMultiply(img_path, mat, cas_node_group, location):
-        img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-        img_node.hide = True
-        img_node.location = location
-        img_node.image = bpy.data.images.load(str(img_path))
-
-        transparent_node = mat.node_tree.nodes.new(type='ShaderNodeBsdfTransparent')
-        transparent_node.location = (200, 200)
-        
-        mix_shader_node = mat.node_tree.nodes.new(type='ShaderNodeMixShader')
-        mix_shader_node.inputs[0].default_value = 1     # so if there's no image node as input it is no-op
-        mix_shader_node.location = (400, 200)
-
-        # find output node
-        output_node = [node for node in mat.node_tree.nodes.values() if node.type == 'OUTPUT_MATERIAL'][0]
-
-        # ref. https://youtu.be/dMqk0jz749U?t=1108
-        img_node.image.colorspace_settings.name = 'Non-Color'
-        mat.node_tree.links.new(img_node.outputs['Color'], mix_shader_node.inputs[0])
-        mat.node_tree.links.new(transparent_node.outputs[0], mix_shader_node.inputs[1])
-
-        # should actually take whatever is linked to output_node.inputs['Surface'] as input
-        # but may not be the best to assume that. oh well.
-        mat.node_tree.links.new(cas_node_group.outputs[0], mix_shader_node.inputs[2])
-        mat.node_tree.links.new(mix_shader_node.outputs[0], output_node.inputs['Surface'])
-        mat.blend_method = 'CLIP'
-        
-    
-    method = {
-        'col': _addDiffuse,
-        'ao': _addAO,
-        'cav': _addCavity,
-        'ilm': _addEmmisive,
-        'gls': _addGlossy,
-        'nml': _addNormal,
-        'spc': _addSpec,
-        'opa': _addOpacityMultiply,
-    }
+    role_specs = [
+        RoleSpec('col', [('Color', 'Diffuse map')]),
+        RoleSpec('ao', [('Color', 'AO map')], pack_channel='R'),
+        RoleSpec('cav', [('Color', 'Cavity map')], pack_channel='G'),
+        # linked through the emission mix node
+        RoleSpec('ilm', [('Color', 'Emission input')], extra='emission_tint', offset=(-500.0, 0.0)),
+        RoleSpec('gls', [('Color', 'Glossiness map')], pack_channel='B'),
+        RoleSpec('nml', [('Color', 'Normal map')], colorspace='Non-Color'),
+        RoleSpec('spc', [('Color', 'Specular map')]),
+        RoleSpec('opa', colorspace='Non-Color', extra='opacity_mix', blend_method='CLIP', pack_channel='A'),
+    ]
+    roles = compileRoles(role_specs, sub_graphs)
 
     @staticmethod
     def getShaderNodeGroup():
         filepath = config.SG_TITANFALL_SHADER_BLENDER_FILE
         return fetchNodeGroupFromCacheOrFile('TitanfallSGNodeAdder_cache', filepath, 'S/G-Blender')
+        
 
-    @classmethod
-    def addImageTexture(cls, img_path, mat, cas_node_group, location=(0.0, 0.0)):
-        # get name
-        texture_name = img_path.stem[img_path.stem.rindex('_')+1:]
-        if texture_name not in cls.method.keys():
-            return False
-        # add texture
-        cls.method[texture_name](img_path, mat, cas_node_group, location)
-        return True
-        
\ No newline at end of file
+# all node adders by class name, so shading plans can refer to them by name
+node_adder_classes = {
+    cls.__name__: cls
+    for cls in [CoresNodeAdder, PlusNodeAdder, PathfinderEmoteNodeAdder, TitanfallSGNodeAdder]
+}
@@ -0,0 +1,211 @@
+"""
+    Filesystem / image header prefetching.
+
+    A thread pool runs ahead of the main thread while it builds node trees: it stats
+    upcoming texture files, reads their PNG / TGA / DDS headers (resolution, bit depth,
+    channel count) and reads the files once to warm the OS page cache, so when blender
+    loads the image on the main thread the data is already in memory.
+    On network-mounted export folders this overlaps most of the I/O with node building.
+
+    Header info is available to node adders through `getImageInfo()`.
+
+    Doesn't use bpy (worker threads must never touch bpy anyway).
+"""
+
+import os
+import struct
+from . import config
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from typing import *
+
+def _readPNGHeader(f) -> dict:
+    # 8 bytes signature, then IHDR chunk: length, 'IHDR', width, height, bit depth, color type
+    data = f.read(18)
+    if len(data) < 18 or data[4:8] != b'IHDR':
+        raise ValueError('Broken PNG header')
+    width, height, bit_depth, color_type = struct.unpack('>IIBB', data[8:18])
+    # grayscale, -, RGB, palette, grayscale + alpha, -, RGBA
+    channels = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(color_type)
+    if channels is None:
+        raise ValueError(f'Unknown PNG color type {color_type}')
+    return {'format': 'PNG', 'width': width, 'height': height, 'bit_depth': bit_depth, 'channels': channels}
+
+def _readTGAHeader(f) -> dict:
+    data = f.read(18)
+    if len(data) < 18:
+        raise ValueError('Broken TGA header')
+    image_type = data[2]
+    width, height, pixel_depth = struct.unpack('<HHB', data[12:17])
+    if image_type in (3, 11):       # (RLE) grayscale
+        channels = 1
+    elif image_type in (1, 9):      # (RLE) color-mapped
+        channels = 3
+    elif image_type in (2, 10):     # (RLE) true color
+        channels = 4 if pixel_depth == 32 else 3
+    else:
+        raise ValueError(f'Unknown TGA image type {image_type}')
+    return {'format': 'TGA', 'width': width, 'height': height, 'bit_depth': 8, 'channels': channels}
+
+def _readDDSHeader(f) -> dict:
+    # 'DDS ' + DDS_HEADER (124 bytes), pixel format starts at offset 76 of the file
+    data = f.read(128)
+    if len(data) < 128:
+        raise ValueError('Broken DDS header')
+    height, width = struct.unpack('<II', data[12:20])
+    pf_flags, four_cc, rgb_bit_count = struct.unpack('<I4sI', data[80:92])
+    if pf_flags & 0x4:      # DDPF_FOURCC, compressed
+        channels = {b'DXT1': 3, b'ATI1': 1, b'BC4U': 1, b'ATI2': 2, b'BC5U': 2}.get(four_cc, 4)
+        bit_depth = 8
+    else:
+        channels = (4 if pf_flags & 0x1 else 3) if pf_flags & 0x40 else 1   # DDPF_ALPHAPIXELS, DDPF_RGB
+        bit_depth = rgb_bit_count // channels if rgb_bit_count else 8
+    return {'format': 'DDS', 'width': width, 'height': height, 'bit_depth': bit_depth, 'channels': channels}
+
+def readImageHeader(img_path) -> dict:
+    """
+        Read resolution, bit depth and channel count from the image header without decoding it.
+        Formats other than PNG / TGA / DDS are left to blender, only {'format': None} is returned.
+        Raises ValueError for broken headers.
+    """
+    with open(img_path, 'rb') as f:
+        magic = f.read(4)
+        if magic[:4] == b'\x89PNG':
+            f.seek(8)
+            return _readPNGHeader(f)
+        if magic == b'DDS ':
+            return _readDDSHeader(f)
+        if Path(img_path).suffix.lower() == '.tga':
+            f.seek(0)
+            return _readTGAHeader(f)
+    return {'format': None}
+
+def _warmPageCache(img_path, chunk_size=1 << 20):
+    # just read it, the data ends up in page cache. (GIL is released while reading)
+    buf = bytearray(chunk_size)
+    with open(img_path, 'rb', buffering=0) as f:
+        while f.readinto(buf):
+            pass
+
+def _warmPageCacheQuietly(img_path):
+    # best effort, a missing / unreadable file is already reported by its header info
+    try:
+        _warmPageCache(img_path)
+    except OSError:
+        pass
+
+def _isCurrent(info: dict) -> bool:
+    # the file may have changed since it was fetched (e.g. textures exported again)
+    try:
+        stat = os.stat(info['path'])
+    except OSError:
+        return 'size' not in info
+    return info.get('size') == stat.st_size and info.get('mtime_ns') == stat.st_mtime_ns
+
+def fetchImageInfo(img_path, warm_page_cache: bool = False) -> dict:
+    """
+        Stat file and read header. Problems are reported in info['error'] instead of raised,
+        so a bad file doesn't break the batch.
+    """
+    info = {'path': str(img_path), 'error': None}
+    try:
+        stat = os.stat(img_path)
+        info['size'] = stat.st_size
+        info['mtime_ns'] = stat.st_mtime_ns
+        info.update(readImageHeader(img_path))
+        if info['format'] is not None and (info['width'] == 0 or info['height'] == 0):
+            raise ValueError('Image has zero size')
+        if warm_page_cache:
+            _warmPageCache(img_path)
+    except (OSError, ValueError, struct.error) as e:
+        info['error'] = str(e)
+    return info
+
+def decodedMemory(info: dict, level: int = 0) -> int:
+    """
+        Estimated memory of an image decoded by blender (always 4 channels, float if more
+        than 8 bits), from its header info. `level` is for a copy downscaled by 2^level.
+        0 if the header can't tell (broken file, or a format other than PNG / TGA / DDS).
+    """
+    if info['error'] is not None or info.get('format') is None:
+        return 0
+    return (info['width'] >> level) * (info['height'] >> level) * 4 * (4 if info['bit_depth'] > 8 else 1)
+
+class Prefetcher:
+    """
+        Prefetch image info in a thread pool. Results are kept by path, so each file
+        is fetched once, and fetched again if its size / mtime changed since.
+
+        Header and page cache reads are separate jobs: waiting for the info of a file
+        only waits for its header, not for the whole file to be read.
+    """
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self.executor = None
+        self.futures = {}           # path -> future of its info
+        self.warm_futures = []      # page cache reads
+
+    def prefetch(self, img_paths: Iterable):
+        """
+            Start fetching info of those files in background. Returns immediately.
+        """
+        if self.max_workers <= 0:
+            return
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='apex_prefetch')
+        new_keys = []
+        for img_path in img_paths:
+            key = str(img_path)
+            if key not in self.futures:
+                self.futures[key] = self.executor.submit(fetchImageInfo, key)
+                new_keys.append(key)
+        if config.PREFETCH_WARM_PAGE_CACHE:
+            # after all the headers, so they're never queued behind whole files
+            self.warm_futures = [future for future in self.warm_futures if not future.done()]
+            for key in new_keys:
+                self.warm_futures.append(self.executor.submit(_warmPageCacheQuietly, key))
+
+    def peek(self, img_path) -> Optional[dict]:
+        """
+            Info of the file if it is already fetched, None otherwise. Never blocks.
+        """
+        future = self.futures.get(str(img_path))
+        if future is None or not future.done():
+            return None
+        info = future.result()
+        return info if _isCurrent(info) else None
+
+    def get(self, img_path) -> dict:
+        """
+            Info of the file, waiting for the prefetch to finish (or reading only
+            its header now if it was never prefetched).
+        """
+        future = self.futures.get(str(img_path))
+        if future is not None:
+            info = future.result()
+            if _isCurrent(info):
+                return info
+            del self.futures[str(img_path)]
+        return fetchImageInfo(img_path)
+
+    def clear(self):
+        for future in [*self.futures.values(), *self.warm_futures]:
+            future.cancel()
+        self.futures.clear()
+        self.warm_futures.clear()
+
+    def shutdown(self):
+        self.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+prefetcher = Prefetcher(config.PREFETCH_WORKERS)
+
+def getImageInfo(img_path) -> dict:
+    """
+        Header / stat info of the image:
+            {'path', 'error', 'size', 'mtime_ns', 'format', 'width', 'height', 'bit_depth', 'channels'}
+        `error` is not None if the file is missing or broken, other keys may be absent then.
+    """
+    return prefetcher.get(img_path)
@@ -0,0 +1,210 @@
+"""
+    Profiling of the shading pipeline.
+
+    When enabled (Apex Shader menu -> "Profiling", or `headless.py --profile`), records:
+
+    + stages: wall time of each pipeline stage (library load, directory scan, image load,
+      node building, linking, matching, ...), nested stages allowed
+    + bpy call counts (`nodes.new`, `links.new`, `images.load`, ...)
+    + scopes: one material / armature, with its time, bpy call counts and RSS delta
+
+    `summaryTable()` is a text table for the console, `saveChromeTrace()` writes every
+    stage / scope as a Chrome trace (open with `chrome://tracing` or https://ui.perfetto.dev).
+
+    Call counts are added where the addon calls bpy, e.g. nodes / links of a node tree
+    are counted once it's built, since blender's own collection methods can't be wrapped.
+
+    Doesn't use bpy. Stages are only recorded from the main thread.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import nullcontext
+from typing import *
+
+def getRSS() -> Optional[int]:
+    """
+        Resident set size of this process in bytes, None if it can't be read on this platform.
+    """
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    try:
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/statm', 'rb') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + [
+                    (name, ctypes.c_size_t) for name in [
+                        'PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                        'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage']]
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                        ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+    except (OSError, ValueError, AttributeError):
+        pass
+    return None
+
+# returned while disabled, reusable
+_NULL_CONTEXT = nullcontext()
+
+class _Stage:
+    def __init__(self, profiler, name: str, category: str = 'stage', label: Optional[str] = None, args: Optional[dict] = None):
+        self.profiler = profiler
+        self.name = name            # key in `Profiler.stages`
+        self.category = category
+        self.label = label or name  # name of the trace event
+        self.args = args
+
+    def __enter__(self):
+        # [start, seconds of child stages]
+        self.frame = [time.perf_counter(), 0.0]
+        self.profiler._stack.append(self.frame)
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        profiler = self.profiler
+        profiler._stack.pop()
+        self.seconds = end - self.frame[0]
+        if profiler._stack:
+            profiler._stack[-1][1] += self.seconds
+        stat = profiler.stages.get(self.name)
+        if stat is None:
+            stat = profiler.stages[self.name] = [0, 0.0, 0.0]
+        stat[0] += 1
+        stat[1] += self.seconds
+        stat[2] += self.seconds - self.frame[1]
+        profiler.events.append((self.label, self.category, self.frame[0], self.seconds, self.args))
+        return False
+
+class _Scope(_Stage):
+    def __init__(self, profiler, kind: str, name: str):
+        super().__init__(profiler, kind, kind, name, {})
+
+    def __enter__(self):
+        self.counts = self.profiler.counts.copy()
+        self.rss = getRSS()
+        return super().__enter__()
+
+    def __exit__(self, *args):
+        # args are filled before the event is added
+        rss = getRSS()
+        self.args['calls'] = dict(self.profiler.counts - self.counts)
+        self.args['rss_delta'] = rss - self.rss if rss is not None and self.rss is not None else None
+        super().__exit__(*args)
+        self.profiler.scopes.append({'kind': self.category, 'name': self.label, 'seconds': self.seconds, **self.args})
+        return False
+
+class Profiler:
+    """
+        Collects stages, scopes and call counts while `enabled`. Does nothing
+        (one attribute check per call) when disabled.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.reset()
+
+    def reset(self):
+        self.events = []        # (name, category, start, seconds, args)
+        self.stages = {}        # stage name -> [count, total seconds, self seconds]
+        self.scopes = []        # finished scopes, {'kind', 'name', 'seconds', 'calls', 'rss_delta'}
+        self.counts = Counter() # bpy call -> count
+        self._stack = []
+        self.start_time = time.perf_counter()
+        self.start_rss = getRSS()
+
+    def enable(self, enabled: bool = True):
+        if enabled and not self.enabled:
+            self.reset()
+        self.enabled = enabled
+
+    def stage(self, name: str, **args):
+        """
+            `with profiler.stage('image_load'): ...`
+        """
+        if not self.enabled or threading.current_thread() is not threading.main_thread():
+            return _NULL_CONTEXT
+        return _Stage(self, name, args=args or None)
+
+    def scope(self, kind: str, name: str):
+        """
+            `with profiler.scope('material', mat.name): ...`, also a stage named `kind`.
+        """
+        if not self.enabled or threading.current_thread() is not threading.main_thread():
+            return _NULL_CONTEXT
+        return _Scope(self, kind, name)
+
+    def count(self, call: str, n: int = 1):
+        if self.enabled:
+            self.counts[call] += n
+
+    def stats(self, top: int = 5) -> Dict[str, Any]:
+        """
+            Json-able summary: stages, call counts, and the slowest scopes of each kind.
+        """
+        rss = getRSS()
+        slowest = {}
+        for kind in sorted(set(scope['kind'] for scope in self.scopes)):
+            scopes = sorted((s for s in self.scopes if s['kind'] == kind), key=lambda s: s['seconds'], reverse=True)
+            slowest[kind] = scopes[:top]
+        return {
+            'seconds': round(time.perf_counter() - self.start_time, 6),
+            'rss_delta': rss - self.start_rss if rss is not None and self.start_rss is not None else None,
+            'stages': {name: {'count': cnt, 'seconds': round(total, 6), 'self_seconds': round(self_total, 6)}
+                       for name, (cnt, total, self_total) in self.stages.items()},
+            'calls': dict(sorted(self.counts.items())),
+            'slowest': slowest,
+        }
+
+    def summaryTable(self, top: int = 5) -> str:
+        stats = self.stats(top)
+        lines = [f'Profile: {stats["seconds"]:.3f}s since enabled, RSS {_formatBytes(stats["rss_delta"])}']
+        lines.append(f'    {"stage":<24}{"count":>8}{"seconds":>12}{"self":>12}')
+        for name, stat in sorted(stats['stages'].items(), key=lambda x: x[1]['self_seconds'], reverse=True):
+            lines.append(f'    {name:<24}{stat["count"]:>8}{stat["seconds"]:>12.4f}{stat["self_seconds"]:>12.4f}')
+        if stats['calls']:
+            lines.append('    bpy calls: ' + ', '.join(f'{call} {cnt}' for call, cnt in stats['calls'].items()))
+        for kind, scopes in stats['slowest'].items():
+            lines.append(f'    slowest {kind}:')
+            for scope in scopes:
+                calls = ', '.join(f'{call} {cnt}' for call, cnt in sorted(scope['calls'].items()))
+                lines.append(f'        {scope["seconds"]:.4f}s  RSS {_formatBytes(scope["rss_delta"]):>10}  '
+                             f'{scope["name"]}' + (f'  ({calls})' if calls else ''))
+        return '\n'.join(lines)
+
+    def toChromeTrace(self) -> dict:
+        pid = os.getpid()
+        tid = threading.main_thread().ident
+        events = []
+        for name, category, start, seconds, args in self.events:
+            event = {'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                     'ts': round((start - self.start_time) * 1e6, 3), 'dur': round(seconds * 1e6, 3)}
+            if args:
+                event['args'] = args
+            events.append(event)
+        events.sort(key=lambda event: event['ts'])
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'summary': self.stats()}}
+
+    def saveChromeTrace(self, fpath):
+        with open(fpath, 'w', encoding='utf-8') as f:
+            json.dump(self.toChromeTrace(), f)
+
+def _formatBytes(n: Optional[int]) -> str:
+    if n is None:
+        return '-'
+    return f'{n / 2**20:+.1f} MiB'
+
+profiler = Profiler()
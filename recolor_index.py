@@ -0,0 +1,54 @@
+"""
+    Recolor index of a Legion+ `materials/` folder.
+
+    Legion+ exports one folder per material, named `<skin>[_rt<NN>]_<mesh>`, e.g.
+
+        bloodhound_lgnd_v21_heroknight_body         (the skin itself)
+        bloodhound_lgnd_v21_heroknight_rt01_body    (recolor `rt01` of it)
+        bloodhound_lgnd_v21_heroknight_rt01_body_colpass
+
+    plus render pass folders (`colpass`, `prepass`, `shadow`, ...) that aren't materials
+    at all. The folder is listed once (ref. `dir_index`) and grouped by skin and recolor,
+    so every recolor of a skin can be made in one batch.
+
+    Doesn't use bpy.
+"""
+
+import re
+from . import config
+from pathlib import Path
+from typing import *
+from .dir_index import dir_index
+
+BASE_RECOLOR = ''   # recolor id of the skin itself (folders without `_rt<NN>`)
+
+_MATERIAL_FOLDER_RE = re.compile(r'^(?P<skin>.+?)(?:_(?P<recolor>rt\d+))?_(?P<mesh>[^_]+)$')
+
+def parseMaterialFolder(name: str, ignored_passes: Iterable[str] = ()) -> Optional[Tuple[str, str, str]]:
+    """
+        "bloodhound_lgnd_v21_heroknight_rt01_body" -> ("bloodhound_lgnd_v21_heroknight", "rt01", "body")
+        "bloodhound_lgnd_v21_heroknight_body" -> ("bloodhound_lgnd_v21_heroknight", "", "body")
+
+        None for pass folders (name ends with one of `ignored_passes`) and names without `_`.
+    """
+    if name.rsplit('_', 1)[-1] in ignored_passes:
+        return None
+    match = _MATERIAL_FOLDER_RE.match(name)
+    if match is None:
+        return None
+    return match['skin'], match['recolor'] or BASE_RECOLOR, match['mesh']
+
+def indexRecolors(materials_dir, ignored_passes: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Dict[str, Path]]]:
+    """
+        skin -> recolor id -> mesh name -> material folder, of every material folder in `materials_dir`.
+        Recolor ids are sorted, the skin itself (`BASE_RECOLOR`) first.
+    """
+    ignored_passes = set(config.RECOLOR_IGNORED_PASSES if ignored_passes is None else ignored_passes)
+    skins = {}
+    for subdir_path in dir_index.getSubdirs(materials_dir):
+        parsed = parseMaterialFolder(subdir_path.name, ignored_passes)
+        if parsed is None:
+            continue
+        skin, recolor, mesh_name = parsed
+        skins.setdefault(skin, {}).setdefault(recolor, {})[mesh_name] = subdir_path
+    return {skin: dict(sorted(recolors.items())) for skin, recolors in skins.items()}
@@ -0,0 +1,71 @@
+"""
+    Fingerprints of shaded materials, for incremental re-shading.
+
+    A material is stamped with a hash of everything its node tree is built from:
+
+    + the node adder and the version of its shader node group (asset mtime, ref. `shader_library`)
+    + texture proxy (level, per role levels, memory budget), channel packing and image dedup
+      settings, they change which images are used
+    + every texture of its plan the node adder adds (ref. `MaterialPlan.plannedTextures()`):
+      path, role, file size and mtime
+
+    Shading it again with the same fingerprint would build the same node tree, so it's
+    skipped. Touching a texture (or editing the asset .blend) changes the fingerprint.
+    Editing the nodes by hand doesn't, "Remove Texture" clears it.
+"""
+
+import os
+import hashlib
+import bpy
+from typing import *
+from .shade_plan import MaterialPlan
+from .shader_library import FINGERPRINT_PROP as ASSET_MTIME_PROP
+from .texture_proxy import texture_proxies
+from .channel_pack import channel_packer
+from .image_registry import image_registry
+
+FINGERPRINT_PROP = 'apex_shading_fingerprint'
+
+def shaderVersion(shader_node_tree) -> str:
+    # linked groups are read from their library, appended ones remember the asset mtime
+    if shader_node_tree.library is not None:
+        return f'{shader_node_tree.name}@{shader_node_tree.library.filepath}'
+    return f'{shader_node_tree.name}@{shader_node_tree.get(ASSET_MTIME_PROP, "")}'
+
+def makeFingerprint(mat_plan: MaterialPlan, node_adder_cls, shader_node_tree) -> Optional[str]:
+    """
+        Fingerprint of shading `mat_plan` (before channel packing), None if a texture can't be read.
+    """
+    h = hashlib.sha1()
+    h.update(f'{node_adder_cls.__name__};{shaderVersion(shader_node_tree)};'.encode())
+    role_levels = sorted(texture_proxies.role_levels.items())
+    h.update(f'proxy={texture_proxies.enabled}:{texture_proxies.level}:{role_levels}:{texture_proxies.memory_budget};'
+             f'pack={channel_packer.enabled};dedup={image_registry.dedup};'.encode())
+    # headers aren't needed, a texture that can't be read changes its stat anyway
+    for texture in sorted(mat_plan.plannedTextures(node_adder_cls, check_images=False), key=lambda t: t.path):
+        try:
+            stat = os.stat(texture.path)
+        except OSError:
+            return None
+        h.update(f'{texture.path}|{texture.role}|{texture.supported}|{stat.st_size}|{stat.st_mtime_ns};'.encode())
+    return h.hexdigest()
+
+def setFingerprint(mat: bpy.types.Material, fingerprint: Optional[str]):
+    if fingerprint is not None:
+        mat[FINGERPRINT_PROP] = fingerprint
+    elif FINGERPRINT_PROP in mat:
+        del mat[FINGERPRINT_PROP]
+
+def clearFingerprint(mat: bpy.types.Material):
+    setFingerprint(mat, None)
+
+def isUpToDate(mat: bpy.types.Material, mat_plan: MaterialPlan, node_adder_cls, shader_node_tree) -> bool:
+    """
+        Whether `mat` was shaded from the same inputs as `mat_plan` would, and still uses the shader.
+    """
+    fingerprint = mat.get(FINGERPRINT_PROP)
+    if fingerprint is None or not mat_plan.ok or mat.node_tree is None:
+        return False
+    if fingerprint != makeFingerprint(mat_plan, node_adder_cls, shader_node_tree):
+        return False
+    return any(node.type == 'GROUP' and node.node_tree == shader_node_tree for node in mat.node_tree.nodes)
@@ -0,0 +1,161 @@
+"""
+    Planning stage of shading.
+
+    Shading is done in two phases:
+        1. planning (this file): from material names and a texture path / directory,
+           find all textures of the material and their roles (texture names,
+           e.g. `albedoTexture`). Only touches the filesystem, never bpy.
+        2. applying (`utils.applyShadingPlan`): actually clear and build node trees.
+
+    Since the plan is made before any node is touched, a material that can't be
+    planned is left as it is instead of being half destroyed.
+
+    Plans are plain data and can be exported as json for dry runs, e.g. to see
+    what would be shaded without opening blender at all.
+"""
+
+import json
+from pathlib import Path
+from typing import *
+from .dir_index import dir_index, splitTextureName
+
+class TexturePlan:
+    """
+        A texture file and its role (texture name, e.g. `albedoTexture`, `col`).
+        `supported` is whether the node adder knows how to add this role.
+    """
+    def __init__(self, path: str, role: str, supported: bool):
+        self.path = path
+        self.role = role
+        self.supported = supported
+
+    def toDict(self) -> dict:
+        return {'path': self.path, 'role': self.role, 'supported': self.supported}
+
+    @classmethod
+    def fromDict(cls, d: dict):
+        return cls(d['path'], d['role'], d['supported'])
+
+class MaterialPlan:
+    """
+        Everything needed to shade one material.
+        If `error` is not None, the material cannot be shaded and should be left untouched.
+    """
+    def __init__(self, material: str, node_adder: str, directory: Optional[str] = None,
+                 mesh_name: Optional[str] = None, textures: Optional[List[TexturePlan]] = None,
+                 error: Optional[str] = None):
+        self.material = material
+        self.node_adder = node_adder
+        self.directory = directory
+        self.mesh_name = mesh_name
+        self.textures = textures if textures is not None else []
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    def supportedTextures(self) -> List[TexturePlan]:
+        return [t for t in self.textures if t.supported]
+
+    def plannedTextures(self, node_adder_cls, check_images: bool = True) -> List[TexturePlan]:
+        """
+            Textures the node adder will actually add: supported, not of a role it ignores
+            (ref. `NodeAdder.addsRole()`), and if `check_images`, accepted by `NodeAdder.acceptImage()`
+            (that reads the image header). Only these should ever be loaded.
+        """
+        return [t for t in self.supportedTextures() if node_adder_cls.addsRole(t.role)
+                and (not check_images or node_adder_cls.acceptImage(Path(t.path)))]
+
+    def toDict(self) -> dict:
+        return {
+            'material': self.material,
+            'node_adder': self.node_adder,
+            'directory': self.directory,
+            'mesh_name': self.mesh_name,
+            'textures': [t.toDict() for t in self.textures],
+            'error': self.error,
+        }
+
+    @classmethod
+    def fromDict(cls, d: dict):
+        return cls(d['material'], d['node_adder'], d['directory'], d['mesh_name'],
+                   [TexturePlan.fromDict(t) for t in d['textures']], d['error'])
+
+class ShadingPlan:
+    """
+        Plans for a batch of materials.
+    """
+    def __init__(self, materials: Optional[List[MaterialPlan]] = None):
+        self.materials = materials if materials is not None else []
+
+    def __len__(self):
+        return len(self.materials)
+
+    def __iter__(self):
+        return iter(self.materials)
+
+    def append(self, mat_plan: MaterialPlan):
+        self.materials.append(mat_plan)
+
+    def summary(self) -> str:
+        ok_ls = [p for p in self.materials if p.ok]
+        texture_cnt = sum(len(p.supportedTextures()) for p in ok_ls)
+        return f'{len(ok_ls)}/{len(self.materials)} materials plannable, {texture_cnt} textures'
+
+    def toJson(self, **kwargs) -> str:
+        return json.dumps({'materials': [p.toDict() for p in self.materials]}, **kwargs)
+
+    @classmethod
+    def fromJson(cls, s: str):
+        return cls([MaterialPlan.fromDict(d) for d in json.loads(s)['materials']])
+
+    def save(self, fpath):
+        with open(fpath, 'w', encoding='utf-8') as f:
+            f.write(self.toJson(indent=2))
+
+    @classmethod
+    def load(cls, fpath):
+        with open(fpath, 'r', encoding='utf-8') as f:
+            return cls.fromJson(f.read())
+
+def planMaterialFromTexture(mat_name: str, img_path, node_adder_name: str,
+                            supported_roles: Iterable[str]) -> MaterialPlan:
+    """
+        Plan a material from one of its textures, by finding all similarly named textures
+        (`<meshName>_*`) in the same directory.
+
+        img_path should be an absolute path, e.g. .../<model_name>_<mesh_name>_<texture_name>.png
+    """
+    img_path = Path(img_path)
+    mesh_name, _ = splitTextureName(img_path.name)
+    if not mesh_name:
+        return MaterialPlan(mat_name, node_adder_name, str(img_path.parent),
+                            error=f'Texture name not in <meshName>_<textureName> format: {img_path.name}')
+    try:
+        texture_paths = dir_index.getTextures(img_path.parent, mesh_name)
+    except OSError as e:
+        return MaterialPlan(mat_name, node_adder_name, str(img_path.parent), mesh_name, error=str(e))
+
+    supported_roles = set(supported_roles)
+    textures = []
+    for texture_path in texture_paths:
+        _, role = splitTextureName(texture_path.name)
+        textures.append(TexturePlan(str(texture_path), role, role in supported_roles))
+    if not any(t.supported for t in textures):
+        return MaterialPlan(mat_name, node_adder_name, str(img_path.parent), mesh_name, textures,
+                            error=f'No supported texture for {mesh_name}')
+    return MaterialPlan(mat_name, node_adder_name, str(img_path.parent), mesh_name, textures)
+
+def planMaterialFromDirectory(mat_name: str, dir_path, node_adder_name: str,
+                              supported_roles: Iterable[str]) -> MaterialPlan:
+    """
+        Plan a material from a material folder (e.g. Legion+ `materials/<material_name>/`).
+    """
+    try:
+        img_path = dir_index.getAnyFile(dir_path)
+    except OSError as e:
+        return MaterialPlan(mat_name, node_adder_name, str(dir_path), error=str(e))
+    if img_path is None:
+        return MaterialPlan(mat_name, node_adder_name, str(dir_path), error=f'No texture in {dir_path}')
+    return planMaterialFromTexture(mat_name, Path(img_path).absolute(), node_adder_name, supported_roles)
@@ -0,0 +1,162 @@
+"""
+    Shader node groups from the asset .blend files.
+
+    Each .blend file has one `ShaderLibrary`, shared by every node adder using that
+    file (e.g. Cores and the Pathfinder emote node group are both in `Apex Shader.blend`).
+    Only the requested node group is imported (blender brings in what it depends on,
+    like nested node groups), instead of every node group in the file.
+
+    Imported node groups are keyed by (asset path, asset mtime, group name): appended
+    groups remember the mtime of the asset file they came from, so editing the asset
+    .blend (or pointing `config.*_BLENDER_FILE` somewhere else) imports it again.
+    `handlers.py` forgets everything when another file is opened.
+"""
+
+import os
+import bpy
+from . import config
+from .texture_roles import group_sockets
+from .profiler import profiler
+from .log import logger
+from pathlib import Path
+from typing import *
+
+# custom property on appended node groups, mtime of the asset file they came from
+FINGERPRINT_PROP = 'apex_shader_asset_mtime'
+
+class ShaderLibrary:
+    """
+        Node groups of one .blend file.
+
+        Like the image registry, only datablock names are kept, so nothing goes
+        stale when a new file is opened (ref. the RSAStruct bug in TODO.md).
+    """
+    def __init__(self, blend_fpath: str):
+        self.blend_fpath = blend_fpath
+        self.catalog = None         # node group names in the file
+        self.catalog_mtime = None   # mtime of the file when catalog was read
+        self.loaded = {}            # (node group name in the file, link) -> local datablock name
+        self.load_count = 0
+
+    def getMtime(self) -> int:
+        return os.stat(self.blend_fpath).st_mtime_ns
+
+    def _isSameFile(self, fpath: str) -> bool:
+        return Path(bpy.path.abspath(fpath)).resolve() == Path(self.blend_fpath).resolve()
+
+    def _isFromHere(self, group, link: bool) -> bool:
+        if not link:
+            return group.library is None
+        return group.library is not None and self._isSameFile(group.library.filepath)
+
+    @staticmethod
+    def _isCurrent(group, mtime: int) -> bool:
+        # linked groups are read from the file itself (see `_reloadLinked()` for edits in this session).
+        # appended groups without fingerprint are from older versions of the addon, trust them
+        if group.library is not None:
+            return True
+        fingerprint = group.get(FINGERPRINT_PROP)
+        return fingerprint is None or fingerprint == str(mtime)
+
+    def _reloadLinked(self):
+        for library in bpy.data.libraries:
+            if self._isSameFile(library.filepath):
+                logger.summary('Asset file changed, reload library: %s', self.blend_fpath)
+                library.reload()
+        # reloaded in place, sockets of the node groups may have changed
+        group_sockets.clear()
+
+    def _getLoaded(self, name: str, link: bool):
+        # a file saved with the shader already has it, so also look for the original name
+        # instead of appending another `.001` copy
+        for local_name in [self.loaded.get((name, link)), name]:
+            for group in bpy.data.node_groups:
+                if group.name == local_name and self._isFromHere(group, link):
+                    self.loaded[(name, link)] = group.name
+                    return group
+        self.loaded.pop((name, link), None)
+        return None
+
+    @staticmethod
+    def _findName(catalog: List[str], contain_name: str) -> Optional[str]:
+        return next((name for name in catalog if contain_name in name), None)
+
+    def getNodeGroup(self, contain_name: str, link: bool = False):
+        """
+            Node group whose name contains `contain_name`, imported from the file if it's
+            not in the current file yet, or only an older version of it is. `link` to link
+            instead of append.
+        """
+        mtime = self.getMtime()
+        if self.catalog_mtime is not None and mtime != self.catalog_mtime:
+            # asset file edited, node groups in it may be renamed / added too
+            if link:
+                self._reloadLinked()
+            self.catalog = None
+
+        if self.catalog is not None:
+            name = self._findName(self.catalog, contain_name)
+            if name is None:
+                raise Exception(f'No "{contain_name}" node tree in {self.blend_fpath}.')
+            group = self._getLoaded(name, link)
+            if group is not None and self._isCurrent(group, mtime):
+                return group
+
+        # reading the catalog and importing the group is one open of the file
+        profiler.count('libraries.load')
+        with profiler.stage('library_load'), bpy.data.libraries.load(self.blend_fpath, link=link) as (data_from, data_to):
+            self.catalog = list(data_from.node_groups)
+            self.catalog_mtime = mtime
+            name = self._findName(self.catalog, contain_name)
+            group = self._getLoaded(name, link) if name is not None else None
+            if name is not None and (group is None or not self._isCurrent(group, mtime)):
+                logger.summary('Import node group "%s" from file: %s', name, self.blend_fpath)
+                data_to.node_groups = [name]
+        if name is None:
+            raise Exception(f'No "{contain_name}" node tree in {self.blend_fpath}.')
+        if not data_to.node_groups:
+            return group
+
+        new_group = data_to.node_groups[0]
+        if not link:
+            new_group[FINGERPRINT_PROP] = str(mtime)
+        if group is not None:
+            # older version of the asset, materials using it get the new one
+            logger.summary('Asset file changed, replace node group: %s', group.name)
+            group.user_remap(new_group)
+            old_name = group.name
+            bpy.data.node_groups.remove(group)
+            new_group.name = old_name
+        self.loaded[(name, link)] = new_group.name
+        self.load_count += 1
+        return new_group
+
+    def forgetLoaded(self):
+        # the catalog only depends on the asset file, so it stays
+        self.loaded.clear()
+
+    def clear(self):
+        self.catalog = None
+        self.catalog_mtime = None
+        self.loaded.clear()
+
+shader_libraries = {}
+def getShaderLibrary(blend_fpath) -> ShaderLibrary:
+    """
+        The shared `ShaderLibrary` of a .blend file.
+    """
+    key = str(Path(blend_fpath).resolve())
+    if key not in shader_libraries:
+        shader_libraries[key] = ShaderLibrary(str(blend_fpath))
+    return shader_libraries[key]
+
+def getNodeGroup(blend_fpath, contain_name: str):
+    return getShaderLibrary(blend_fpath).getNodeGroup(contain_name, link=config.SHADER_LIBRARY_LINK)
+
+def forgetLoadedShaderLibraries():
+    for library in shader_libraries.values():
+        library.forgetLoaded()
+
+def clearShaderLibraries():
+    for library in shader_libraries.values():
+        library.clear()
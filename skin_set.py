@@ -0,0 +1,110 @@
+"""
+    Skin sets: the material of each mesh for every skin / recolor imported for an armature.
+
+    Kept on the armature as a custom property, by name (not reference) like the image registry:
+
+        armature['apex_skin_sets'] = {
+            'base': {'<mesh object name>': '<material name>', ...},
+            'rt01': {...},
+        }
+
+    Switching skins only swaps the first material slot of each mesh, no file is read
+    and no node is built, so every recolor of a skin can be rendered one after another.
+    Sets are recorded by `utils.recolorArmature()` / `utils.recolorArmatureVariants()`.
+"""
+
+import bpy
+from typing import *
+from .log import logger
+
+SKIN_SETS_PROP = 'apex_skin_sets'       # on armatures, ref. above
+ACTIVE_SKIN_PROP = 'apex_active_skin'   # on armatures, name of the skin set in use
+BASE_SKIN = 'base'                      # the skin the model was imported with
+
+def getArmature(obj) -> Optional[bpy.types.Object]:
+    """
+        The armature itself, or the armature of a mesh.
+    """
+    if obj is None:
+        return None
+    if obj.type == 'ARMATURE':
+        return obj
+    if obj.parent is not None and obj.parent.type == 'ARMATURE':
+        return obj.parent
+    return None
+
+def getSkinSets(armature: bpy.types.Object) -> Dict[str, Dict[str, str]]:
+    """
+        skin set name -> {mesh object name: material name}, base skin first.
+    """
+    sets = {name: dict(meshes.items()) for name, meshes in armature.get(SKIN_SETS_PROP, {}).items()}
+    return dict(sorted(sets.items(), key=lambda x: (x[0] != BASE_SKIN, x[0])))
+
+def getActiveSkin(armature: bpy.types.Object) -> Optional[str]:
+    return armature.get(ACTIVE_SKIN_PROP)
+
+def currentSkin(armature: bpy.types.Object) -> Dict[str, str]:
+    """
+        {mesh object name: material name} of the armature's meshes as they are now.
+    """
+    return {mesh.name: mesh.data.materials[0].name for mesh in armature.children
+            if mesh.type == 'MESH' and mesh.data.materials and mesh.data.materials[0] is not None}
+
+def recordSkinSet(armature: bpy.types.Object, name: str, materials: Dict[str, str], active: bool = False):
+    """
+        Add (or update) skin set `name`, meshes not in `materials` keep what they had in it.
+        Its materials get a fake user, so they are kept in the file while another skin is on.
+    """
+    for mat_name in materials.values():
+        mat = bpy.data.materials.get(mat_name)
+        if mat is not None:
+            mat.use_fake_user = True
+    sets = getSkinSets(armature)
+    sets.setdefault(name, {}).update(materials)
+    armature[SKIN_SETS_PROP] = sets
+    if active:
+        armature[ACTIVE_SKIN_PROP] = name
+
+def skinSetName(recolor: str) -> str:
+    """
+        Skin set of a recolor id (ref. `recolor_index`), "rt01" -> "rt01", "" -> "base".
+    """
+    return recolor or BASE_SKIN
+
+def recordBaseSkin(armature: bpy.types.Object):
+    """
+        Record the current materials as the base skin, before they are replaced by a recolor.
+        No-op if the base skin is already recorded.
+    """
+    if BASE_SKIN in getSkinSets(armature):
+        return
+    recordSkinSet(armature, BASE_SKIN, currentSkin(armature), active=getActiveSkin(armature) is None)
+
+def switchSkin(armature: bpy.types.Object, name: str) -> int:
+    """
+        Put skin set `name` on the armature's meshes. Meshes or materials that were removed
+        or renamed since are skipped. Returns the number of meshes switched.
+    """
+    sets = getSkinSets(armature)
+    if name not in sets:
+        raise Exception(f'{armature.name} has no skin set {name}, only: {list(sets)}')
+    switched = 0
+    for mesh_name, mat_name in sets[name].items():
+        mesh = bpy.data.objects.get(mesh_name)
+        mat = bpy.data.materials.get(mat_name)
+        if mesh is None or mat is None or mesh.type != 'MESH' or not mesh.data.materials:
+            logger.material('    Skin %s: skipped %s (%s)', name, mesh_name, mat_name)
+            continue
+        if mesh.data.materials[0] != mat:
+            mesh.data.materials[0] = mat
+        switched += 1
+    armature[ACTIVE_SKIN_PROP] = name
+    logger.summary('[*] switchSkin(%s, %s): %d meshes', armature.name, name, switched)
+    return switched
+
+def removeSkinSet(armature: bpy.types.Object, name: str):
+    sets = getSkinSets(armature)
+    sets.pop(name, None)
+    armature[SKIN_SETS_PROP] = sets
+    if getActiveSkin(armature) == name:
+        del armature[ACTIVE_SKIN_PROP]
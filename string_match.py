@@ -0,0 +1,192 @@
+"""
+    Fast material name -> folder name matching.
+
+    Same result as picking, for every name, the target with the smallest
+    Levenshtein distance (first one on ties), but without computing the
+    distance to every target:
+
+        + exact names are matched directly (distance 0)
+        + only targets that can be within distance k are looked at: a similar
+          length, and sharing one of the rarest q-grams (short substrings) of the
+          name, found with an inverted index of the targets. k starts small and
+          doubles until something is found
+        + distances are computed with bit-parallel Myers' algorithm (python ints
+          as bit vectors, no numpy needed), and given up as soon as a target
+          can't beat the best one found so far
+
+    Doesn't use bpy, so it can be used outside of blender.
+"""
+
+import re
+import heapq
+from typing import *
+
+# length of substrings in the candidate index
+Q = 3
+
+def normalizeName(name: str) -> str:
+    """
+        "Hero_Body.001" -> "hero_body"
+        Blender appends `.001`, `.002`... to duplicated names, and case doesn't matter for folders.
+    """
+    return re.sub(r'\.\d{3}$', '', name).lower()
+
+def qgrams(s: str) -> Set[str]:
+    return {s[i:i+Q] for i in range(len(s) - Q + 1)}
+
+def makePeq(s: str) -> Dict[str, int]:
+    # bit i of peq[c] is set if s[i] == c
+    peq = {}
+    for i, c in enumerate(s):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    return peq
+
+def myersDistance(peq: Dict[str, int], m: int, t: str, limit: Optional[int] = None) -> int:
+    """
+        Levenshtein distance between s (length `m`, `peq = makePeq(s)`) and `t`,
+        Myers' bit-vector algorithm (Hyyro's formulation for global distance).
+        If `limit` is given, returns `limit + 1` as soon as the distance is known to be larger.
+    """
+    n = len(t)
+    if m == 0:
+        return n if limit is None else min(n, limit + 1)
+    mask = (1 << m) - 1
+    high = 1 << (m - 1)
+    pv = mask
+    mv = 0
+    score = m
+    for j, c in enumerate(t):
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = ((((eq & pv) + pv) & mask) ^ pv) | eq
+        ph = mv | (~(xh | pv) & mask)
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+        # each remaining char of t lowers the score by at most 1
+        if limit is not None and score - (n - j - 1) > limit:
+            return limit + 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = mh | (~(xv | ph) & mask)
+        mv = ph & xv
+    if limit is not None and score > limit:
+        return limit + 1
+    return score
+
+class StringMatcher:
+    """
+        Index of target strings, `match(s)` finds the closest target of `s`.
+    """
+    def __init__(self, to_ls: List[str]):
+        self.to_ls = list(to_ls)
+        self.exact = {}
+        self.postings = {}  # q-gram -> {target index}
+        self.gram_sets = [] # q-grams of each target
+        for i, t in enumerate(self.to_ls):
+            self.exact.setdefault(t, i)
+            grams = qgrams(t)
+            for gram in grams:
+                self.postings.setdefault(gram, set()).add(i)
+            self.gram_sets.append(grams)
+        self.distance_cnt = 0
+
+    def _candidates(self, grams: List[str], k: int) -> Optional[Set[int]]:
+        # k edits destroy at most k * Q q-grams of s, so a target within distance k
+        # shares at least one of any k * Q + 1 q-grams of s. Use the rarest ones.
+        # None if that doesn't narrow anything down.
+        if k * Q >= len(grams):
+            return None
+        cand = set()
+        for gram in grams[:k * Q + 1]:
+            cand |= self.postings.get(gram, set())
+        return cand
+
+    def match(self, s: str, excluded: Optional[Set[int]] = None) -> Tuple[int, int]:
+        """
+            (index, distance) of the closest target not in `excluded`, (-1, -1) if there is none.
+        """
+        excluded = excluded or set()
+        i = self.exact.get(s)
+        if i is not None and i not in excluded:
+            return i, 0
+
+        ls = len(s)
+        gram_set = qgrams(s)
+        grams = sorted(gram_set, key=lambda g: (len(self.postings.get(g, ())), g))
+        peq = makePeq(s)
+        # look for targets within distance k, doubling k until there is one
+        k = 2
+        while True:
+            cand = self._candidates(grams, k)
+            if cand is None:
+                cand, k = range(len(self.to_ls)), None
+            cand = [i for i in cand if i not in excluded
+                    and (k is None or abs(len(self.to_ls[i]) - ls) <= k)]
+            # most similar first, so the limit below gets small early
+            cand = sorted(((len(gram_set & self.gram_sets[i]), i) for i in cand), key=lambda x: -x[0])
+            best_i, best_d = -1, -1
+            for shared, i in cand:
+                limit = best_d if best_i >= 0 else k
+                t = self.to_ls[i]
+                if limit is not None:
+                    if abs(len(t) - ls) > limit:
+                        continue
+                    # same reason as in `_candidates`, for all q-grams
+                    if shared < len(gram_set) - limit * Q:
+                        continue
+                d = myersDistance(peq, ls, t, limit)
+                self.distance_cnt += 1
+                if limit is not None and d > limit:
+                    continue
+                if best_i < 0 or (d, i) < (best_d, best_i):
+                    best_i, best_d = i, d
+            if best_i >= 0 or k is None:
+                return best_i, best_d
+            k *= 2
+
+def matchString(from_ls: List[str], to_ls: List[str], normalize: bool = False,
+                one_to_one: bool = False) -> Dict[str, str]:
+    """
+        Map every string of `from_ls` to the closest (Levenshtein distance) string of `to_ls`.
+
+        normalize: compare `normalizeName()` of both sides, e.g. `Body.001` matches `body`
+        one_to_one: no target is used twice (while there are unused ones left). Assigned
+            greedily, the closest pairs first, so it's not guaranteed to be the optimal assignment.
+    """
+    if not to_ls:
+        raise Exception('No string to match to')
+    key = normalizeName if normalize else (lambda s: s)
+    matcher = StringMatcher([key(t) for t in to_ls])
+    from_ls = list(dict.fromkeys(from_ls))
+
+    result = {}
+    if not one_to_one:
+        for f_s in from_ls:
+            i, _ = matcher.match(key(f_s))
+            result[f_s] = to_ls[i]
+        return result
+
+    # closest pairs first, a taken target means searching again for that string
+    heap = []
+    for order, f_s in enumerate(from_ls):
+        i, d = matcher.match(key(f_s))
+        heap.append((d, order, i))
+    heapq.heapify(heap)
+    used = set()
+    while heap:
+        d, order, i = heapq.heappop(heap)
+        f_s = from_ls[order]
+        if i in used:
+            if len(used) == len(to_ls):
+                # more strings than targets, the rest may share
+                i, d = matcher.match(key(f_s))
+            else:
+                i, d = matcher.match(key(f_s), used)
+                heapq.heappush(heap, (d, order, i))
+                continue
+        used.add(i)
+        result[f_s] = to_ls[i]
+    return {f_s: result[f_s] for f_s in from_ls}
@@ -0,0 +1,344 @@
+"""
+    Downscaled texture proxies.
+
+    4K textures of a whole squad of legends don't fit in RAM in the viewport. In proxy mode
+    (`config.TEXTURE_PROXY`, Apex Shader menu -> "Texture Proxies"), `loadImage()` gives a
+    downscaled copy (½, ¼ or ⅛ of width / height) of each texture instead:
+
+    + proxies are written once to a content-addressed disk cache (`config.TEXTURE_PROXY_CACHE_DIR`,
+      file name is the hash of the source file + level), so the same texture exported to
+      several folders, or shaded again in another session, reuses the same proxy
+    + the level is per texture role (`config.TEXTURE_PROXY_ROLE_LEVELS`, e.g. AO / cavity smaller
+      than albedo / normal). With `config.TEXTURE_PROXY_MEMORY_BUDGET_MB`, textures of a shading
+      batch are downscaled further until they fit, least important roles first
+    + proxy images remember their source file (custom properties), so "Full Resolution Textures"
+      and final renders (ref. `handlers`) swap them to the source file and back in place,
+      every material using them follows
+
+    Resampling is a box filter with numpy (bundled with blender).
+"""
+
+import os
+import bpy
+from . import config
+from pathlib import Path
+from typing import *
+from .image_registry import image_registry, LOADED_FILEPATH_PROP
+from .dir_index import splitTextureName
+from .prefetch import prefetcher, fetchImageInfo, decodedMemory
+from .content_hash import content_hashes
+from .profiler import profiler
+from .log import logger
+
+# custom properties of proxy images
+PROXY_SOURCE_PROP = 'apex_proxy_source'     # absolute path of the full resolution texture
+PROXY_LEVEL_PROP = 'apex_proxy_level'
+PROXY_STAMP_PROP = 'apex_proxy_stamp'       # size / mtime of the source when the proxy was made
+
+MAX_LEVEL = 3
+# textures are never downscaled below this (width or height)
+MIN_SIZE = 64
+
+def sourceFilepath(image) -> str:
+    """
+        File path of the texture an image shows, the source texture for proxies.
+    """
+    return image.get(PROXY_SOURCE_PROP, image.filepath)
+
+def sourceStamp(src_path: str) -> str:
+    stat = os.stat(src_path)
+    return f'{stat.st_size}:{stat.st_mtime_ns}'
+
+def pickLevels(textures: Iterable[Tuple[str, str, int]], default_level: int, role_levels: Dict[str, int],
+               budget: Optional[int] = None) -> Dict[str, int]:
+    """
+        Proxy level of each texture. `textures` is (path, role, full resolution memory in bytes).
+
+        Each starts at the level of its role. While the total is over `budget`, textures are
+        downscaled one more level each round, roles with the smallest proxies (least important)
+        first and larger textures first within a role.
+    """
+    levels = {}
+    sizes = {}
+    for path, role, nbytes in textures:
+        if path not in levels:
+            levels[path] = min(role_levels.get(role, default_level), MAX_LEVEL)
+            sizes[path] = nbytes
+    if budget is None:
+        return levels
+
+    total = sum(sizes[path] >> (2 * level) for path, level in levels.items())
+    order = sorted(levels, key=lambda path: (-levels[path], -sizes[path]))
+    while total > budget:
+        changed = False
+        for path in order:
+            if levels[path] >= MAX_LEVEL:
+                continue
+            total -= (sizes[path] >> (2 * levels[path])) - (sizes[path] >> (2 * levels[path] + 2))
+            levels[path] += 1
+            changed = True
+            if total <= budget:
+                break
+        if not changed:
+            break
+    return levels
+
+def readPixels(img_path: str):
+    """
+        Decode an image with blender, as a float32 (height, width, 4) numpy array of the image's
+        own values (8 bit images aren't color managed). Returns (pixels, is_float).
+    """
+    import numpy as np
+
+    image = bpy.data.images.load(img_path, check_existing=False)
+    try:
+        width, height = image.size
+        channels = image.channels
+        is_float = image.is_float
+        pixels = np.empty(width * height * channels, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+    finally:
+        bpy.data.images.remove(image)
+
+    pixels = pixels.reshape(height, width, channels)
+    if channels != 4:
+        rgba = np.ones((height, width, 4), dtype=np.float32)
+        rgba[..., :3] = pixels[..., :3] if channels >= 3 else pixels[..., :1]
+        if channels == 2:
+            rgba[..., 3] = pixels[..., 1]
+        pixels = rgba
+    return pixels, is_float
+
+def savePixels(pixels, path: Path, float_buffer: bool = False):
+    """
+        Save a (height, width, 4) array as PNG. Written to a temporary file first,
+        so a cancelled build never leaves a broken file in a cache.
+    """
+    height, width = pixels.shape[:2]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'{path.stem}.{os.getpid()}.tmp.png')
+    image = bpy.data.images.new(path.stem, width, height, alpha=True, float_buffer=float_buffer)
+    try:
+        image.pixels.foreach_set(pixels.ravel())
+        image.filepath_raw = str(tmp_path)
+        image.file_format = 'PNG'
+        image.save()
+    finally:
+        bpy.data.images.remove(image)
+    os.replace(tmp_path, path)
+
+def writeProxy(src_path: str, proxy_path: Path, level: int):
+    """
+        Box filter `src_path` down by 2^level and save it as PNG.
+    """
+    import numpy as np
+
+    pixels, is_float = readPixels(src_path)
+    height, width = pixels.shape[:2]
+    factor = 1 << level
+    w, h = width // factor, height // factor
+    pixels = pixels[:h * factor, :w * factor]
+    pixels = pixels.reshape(h, factor, w, factor, 4).mean(axis=(1, 3), dtype=np.float32)
+    savePixels(pixels, proxy_path, is_float)
+
+class TextureProxies:
+    """
+        Loads proxies of textures, keeps the disk cache, swaps proxy images to full resolution and back.
+
+        Like the image registry, only names and paths are kept (proxy image names and planned
+        levels), proxy images are checked / found by their custom properties.
+    """
+    def __init__(self, enabled: bool = False, cache_dir=None, level: int = 1,
+                 role_levels: Optional[Dict[str, int]] = None, memory_budget: Optional[int] = None):
+        self.enabled = enabled
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.level = level
+        self.role_levels = dict(role_levels or {})
+        self.memory_budget = memory_budget
+        self.levels = {}    # source path -> level picked for the memory budget
+        self.images = {}    # source path -> names of its proxy images (one per level, usually one)
+        self.images_count = -1  # len(bpy.data.images) when `images` was last up-to-date
+        self.full_resolution = False
+        self.built = 0
+        self.reused = 0
+
+    def proxyPath(self, src_path: str, level: int) -> Path:
+        digest = content_hashes.full(src_path)
+        return self.cache_dir / digest[:2] / f'{digest}_{level}.png'
+
+    def levelOf(self, src_path: str) -> int:
+        """
+            Level of the texture, clamped so the proxy isn't smaller than `MIN_SIZE`.
+            0 means the texture itself is used.
+        """
+        level = self.levels.get(src_path)
+        if level is None:
+            role = splitTextureName(Path(src_path).name)[1]
+            level = min(self.role_levels.get(role, self.level), MAX_LEVEL)
+        info = prefetcher.peek(src_path) or fetchImageInfo(src_path)
+        if info['error'] is not None or info.get('format') is None:
+            # unknown size (format blender reads but we can't), still fine to downscale
+            return level
+        while level > 0 and min(info['width'], info['height']) >> level < MIN_SIZE:
+            level -= 1
+        return level
+
+    def planLevels(self, textures: Iterable[Tuple[str, str]]):
+        """
+            Pick levels of the (path, role) textures of a shading batch so their
+            proxies fit in the memory budget. Nothing to do without a budget.
+        """
+        self.levels.clear()
+        if self.memory_budget is None:
+            return
+        sized = []
+        for path, role in textures:
+            path = os.path.realpath(path)
+            sized.append((path, role, decodedMemory(prefetcher.peek(path) or fetchImageInfo(path))))
+        self.levels = pickLevels(sized, self.level, self.role_levels, self.memory_budget)
+
+    def load(self, img_path):
+        """
+            Proxy image of `img_path` (building the proxy file if it isn't cached yet),
+            or the texture itself if it's too small to downscale.
+        """
+        src_path = os.path.realpath(img_path)
+        level = self.levelOf(src_path)
+        if level == 0:
+            return image_registry.load(src_path)
+
+        # the proxy path is a hash of the whole source file, only needed if there's no image yet
+        stamp = sourceStamp(src_path)
+        image = self._getImage(src_path, level, lambda image: image.get(PROXY_STAMP_PROP) == stamp)
+        if image is not None:
+            return image
+        proxy_path = self.proxyPath(src_path, level)
+        # source touched but not changed, or an image made before stamps
+        image = self._getImage(src_path, level, lambda image: image[LOADED_FILEPATH_PROP] == str(proxy_path))
+        if image is not None:
+            image[PROXY_STAMP_PROP] = stamp
+            return image
+
+        if proxy_path.is_file():
+            self.reused += 1
+        else:
+            with profiler.stage('proxy_build'):
+                writeProxy(src_path, proxy_path, level)
+            profiler.count('proxy.build')
+            self.built += 1
+            logger.texture('     Built 1/%d proxy of %s', 1 << level, src_path)
+
+        with profiler.stage('image_load'):
+            image = bpy.data.images.load(str(proxy_path), check_existing=False)
+        profiler.count('images.load')
+        image.name = f'{Path(src_path).name} (1/{1 << level})'
+        image[PROXY_SOURCE_PROP] = src_path
+        image[PROXY_LEVEL_PROP] = level
+        image[PROXY_STAMP_PROP] = stamp
+        image[LOADED_FILEPATH_PROP] = str(proxy_path)
+        if self.full_resolution:
+            # other images are swapped to full resolution right now, this one too
+            self._swap(image, True)
+        self.images.setdefault(src_path, []).append(image.name)
+        self.images_count = len(bpy.data.images)
+        return image
+
+    def _getImage(self, src_path: str, level: int, is_current: Callable[[Any], bool]):
+        # one datablock per source texture even if the proxy file is shared (same content),
+        # so each knows which texture (and folder) it stands for
+        if len(bpy.data.images) != self.images_count:
+            # images added / removed behind our back, e.g. a file saved with proxies was opened
+            self.images = {}
+            for image in self.proxyImages():
+                self.images.setdefault(image[PROXY_SOURCE_PROP], []).append(image.name)
+            self.images_count = len(bpy.data.images)
+        for name in self.images.get(src_path, ()):
+            image = bpy.data.images.get(name)
+            if (image is not None and image.get(PROXY_SOURCE_PROP) == src_path
+                    and image.get(PROXY_LEVEL_PROP) == level and is_current(image)):
+                return image
+        return None
+
+    @staticmethod
+    def proxyImages() -> List:
+        return [image for image in bpy.data.images if PROXY_SOURCE_PROP in image]
+
+    @staticmethod
+    def _swap(image, full_resolution: bool) -> bool:
+        filepath = image[PROXY_SOURCE_PROP] if full_resolution else image[LOADED_FILEPATH_PROP]
+        if image.filepath == filepath:
+            return False
+        if full_resolution and not os.path.isfile(filepath):
+            logger.error('[!] %s: source texture %s is missing, keeping the proxy', image.name, filepath)
+            return False
+        # setting the path reloads the image, colorspace and users stay
+        image.filepath = filepath
+        return True
+
+    def isFullResolution(self) -> bool:
+        """
+            Whether any proxy image shows its source file, e.g. in a file saved while swapped.
+        """
+        return any(image.filepath == image[PROXY_SOURCE_PROP] for image in self.proxyImages())
+
+    def setFullResolution(self, full_resolution: bool) -> int:
+        """
+            Swap every proxy image to its source file (or back). Returns the number of images swapped.
+        """
+        with profiler.stage('proxy_swap'):
+            count = sum(self._swap(image, full_resolution) for image in self.proxyImages())
+        self.full_resolution = full_resolution
+        logger.summary('[*] Swapped %d textures to %s', count, 'full resolution' if full_resolution else 'proxies')
+        logger.flush()
+        return count
+
+    def repair(self) -> int:
+        """
+            Build the proxies of proxy images whose cache file is gone (e.g. a file saved
+            in proxy mode opened on another machine). Returns the number of images repaired.
+        """
+        count = 0
+        for image in self.proxyImages():
+            proxy_path = image[LOADED_FILEPATH_PROP]
+            src_path = image[PROXY_SOURCE_PROP]
+            if os.path.isfile(proxy_path) or not os.path.isfile(src_path):
+                continue
+            try:
+                new_path = self.proxyPath(src_path, image[PROXY_LEVEL_PROP])
+                if not new_path.is_file():
+                    writeProxy(src_path, new_path, image[PROXY_LEVEL_PROP])
+                    self.built += 1
+            except Exception as e:
+                logger.error('[!] Cannot rebuild proxy of %s: %s', src_path, e)
+                continue
+            showing_proxy = image.filepath == proxy_path
+            image[LOADED_FILEPATH_PROP] = str(new_path)
+            if showing_proxy:
+                image.filepath = str(new_path)
+            count += 1
+        if count:
+            logger.summary('[*] Rebuilt %d missing texture proxies', count)
+            logger.flush()
+        return count
+
+    def clear(self):
+        # proxy images belong to the file, only forget their names, the batch's levels and swap state
+        self.levels.clear()
+        self.images.clear()
+        self.images_count = -1
+        self.full_resolution = False
+
+    def resetStats(self):
+        self.built = 0
+        self.reused = 0
+
+    def stats(self) -> dict:
+        return {'built': self.built, 'reused': self.reused, 'images': len(self.proxyImages())}
+
+def _memoryBudget():
+    if config.TEXTURE_PROXY_MEMORY_BUDGET_MB is None:
+        return None
+    return config.TEXTURE_PROXY_MEMORY_BUDGET_MB * 2**20
+
+texture_proxies = TextureProxies(config.TEXTURE_PROXY, config.TEXTURE_PROXY_CACHE_DIR, config.TEXTURE_PROXY_LEVEL,
+                                 config.TEXTURE_PROXY_ROLE_LEVELS, _memoryBudget())
@@ -0,0 +1,170 @@
+"""
+    Texture roles of each shader, as data.
+
+    A role is a texture name suffix (e.g. `albedoTexture`, `col`), and its `RoleSpec` says
+    what adding a texture of that role does: which outputs of the image node go to which
+    inputs of the shader node group, the colorspace of the image, default values to set
+    on the node group, the blend method of the material, and an optional extra sub-graph
+    (e.g. the transparent / mix shader nodes of opacity textures).
+
+    Node adders compile their table once (`compileRoles()`), so adding a texture is one
+    dict lookup by suffix and the same generic code for every role (`NodeAdder.addImageTexture()`),
+    instead of an `_addX` method per role per shader. Socket names are resolved to indices
+    once per node group (`GroupSockets`).
+
+    Roles of single-channel textures can say which channel they take in a channel-packed
+    image (`pack_channel`, ref. `channel_pack`). A packed image is a texture with a `packed:`
+    role naming the role of each channel (`packedRole()`).
+
+    Nothing here touches bpy, sub-graphs are only referred to by name
+    (ref. `NodeAdder.sub_graphs`).
+"""
+
+from typing import *
+
+# outputs of `ShaderNodeTexImage`, in blender's order
+IMAGE_OUTPUTS = {'Color': 0, 'Alpha': 1}
+
+# channels of packed images, R / G / B are read through a Separate Color node, A from the Alpha output
+PACK_CHANNELS = 'RGBA'
+PACKED_ROLE_PREFIX = 'packed:'
+
+class RoleSpec:
+    """
+        What to do with a texture of one role.
+
+        Args:
+            suffix: texture name suffix, e.g. `albedoTexture`
+            links: (image output, node group input) pairs
+            colorspace: colorspace of the image, None to leave it as loaded
+            defaults: node group input -> default value, set when the role is added
+            blend_method: material blend method, e.g. `CLIP` for alpha clipping
+            extra: name of the sub-graph to build after the image node, ref. `NodeAdder.sub_graphs`
+            offset: image node location relative to the location of the texture
+            ignore: known role, but nothing is added (no image node either)
+            pack_channel: channel (`R`, `G`, `B` or `A`) of the role in channel-packed images,
+                None if it's never packed. Only for grayscale textures linked from `Color`
+    """
+    def __init__(self, suffix: str, links: Sequence[Tuple[str, str]] = (), colorspace: Optional[str] = None,
+                 defaults: Optional[Dict[str, Any]] = None, blend_method: Optional[str] = None,
+                 extra: Optional[str] = None, offset: Tuple[float, float] = (0.0, 0.0), ignore: bool = False,
+                 pack_channel: Optional[str] = None):
+        self.suffix = suffix
+        self.links = tuple(links)
+        self.colorspace = colorspace
+        self.defaults = dict(defaults or {})
+        self.blend_method = blend_method
+        self.extra = extra
+        self.offset = offset
+        self.ignore = ignore
+        self.pack_channel = pack_channel
+        # filled by compileRoles()
+        self.output_links = ()
+
+    def replace(self, **kwargs) -> 'RoleSpec':
+        """
+            Copy of this spec with some fields changed, for shaders that differ by a role or two.
+        """
+        fields = dict(links=self.links, colorspace=self.colorspace, defaults=self.defaults,
+                      blend_method=self.blend_method, extra=self.extra, offset=self.offset, ignore=self.ignore,
+                      pack_channel=self.pack_channel)
+        fields.update(kwargs)
+        return RoleSpec(self.suffix, **fields)
+
+    def __repr__(self):
+        return f'<RoleSpec {self.suffix}>'
+
+def compileRoles(specs: Sequence[RoleSpec], sub_graphs: Optional[Dict[str, Callable]] = None) -> Dict[str, RoleSpec]:
+    """
+        suffix -> spec, with image outputs of the links resolved to socket indices.
+        Mistakes in the table (repeated suffix, unknown output / sub-graph) fail here,
+        when the node adder is defined, instead of in the middle of shading.
+    """
+    sub_graphs = sub_graphs or {}
+    roles = {}
+    channels = {}
+    for spec in specs:
+        if spec.suffix in roles:
+            raise ValueError(f'Texture role "{spec.suffix}" is defined twice')
+        for output, _ in spec.links:
+            if output not in IMAGE_OUTPUTS:
+                raise ValueError(f'Texture role "{spec.suffix}": image node has no "{output}" output')
+        if spec.extra is not None and spec.extra not in sub_graphs:
+            raise ValueError(f'Texture role "{spec.suffix}": unknown sub-graph "{spec.extra}"')
+        if spec.pack_channel is not None:
+            _checkPackChannel(spec, channels)
+        spec.output_links = tuple((IMAGE_OUTPUTS[output], group_input) for output, group_input in spec.links)
+        roles[spec.suffix] = spec
+    return roles
+
+def _checkPackChannel(spec: RoleSpec, channels: Dict[str, RoleSpec]):
+    if spec.pack_channel not in PACK_CHANNELS:
+        raise ValueError(f'Texture role "{spec.suffix}": unknown pack channel "{spec.pack_channel}"')
+    if spec.pack_channel in channels:
+        raise ValueError(f'Texture roles "{channels[spec.pack_channel].suffix}" and "{spec.suffix}" '
+                         f'are packed in the same channel')
+    if spec.ignore or any(output != 'Color' for output, _ in spec.links):
+        raise ValueError(f'Texture role "{spec.suffix}": only roles linked from "Color" can be packed')
+    # colorspace is of the whole packed image, and alpha is never color managed
+    if spec.pack_channel == 'A':
+        if spec.colorspace != 'Non-Color':
+            raise ValueError(f'Texture role "{spec.suffix}": only Non-Color roles can be packed in alpha')
+    else:
+        for other in channels.values():
+            if other.pack_channel != 'A' and other.colorspace != spec.colorspace:
+                raise ValueError(f'Texture roles "{other.suffix}" and "{spec.suffix}" are packed '
+                                 f'together but have different colorspaces')
+    channels[spec.pack_channel] = spec
+
+def packChannels(roles: Dict[str, RoleSpec]) -> Dict[str, str]:
+    """
+        role -> pack channel, of roles that can be packed.
+    """
+    return {suffix: spec.pack_channel for suffix, spec in roles.items() if spec.pack_channel is not None}
+
+def packedRole(layout: Dict[str, str]) -> str:
+    """
+        {'R': 'aoTexture', 'G': 'cavityTexture'} -> 'packed:R=aoTexture,G=cavityTexture'
+    """
+    return PACKED_ROLE_PREFIX + ','.join(f'{channel}={layout[channel]}' for channel in PACK_CHANNELS if channel in layout)
+
+def parsePackedRole(role: str) -> Optional[Dict[str, str]]:
+    """
+        channel -> role of a `packed:` role, None for other roles.
+    """
+    if not role.startswith(PACKED_ROLE_PREFIX):
+        return None
+    return dict(item.split('=', 1) for item in role[len(PACKED_ROLE_PREFIX):].split(','))
+
+class GroupSockets:
+    """
+        Input socket name -> index of shader node groups. Every group node of the
+        same node tree has the same sockets, so names are looked up once per tree.
+
+        Keyed by the node tree's pointer and name, a node group replaced by a newer
+        version of the asset (ref. `shader_library`) is a new datablock.
+    """
+    def __init__(self):
+        self.indices = {}   # (node tree pointer, node tree name) -> {input name: index}
+
+    def inputIndex(self, group_node, name: str) -> int:
+        tree = group_node.node_tree
+        key = (tree.as_pointer(), tree.name)
+        indices = self.indices.get(key)
+        if indices is None:
+            indices = self.indices[key] = {}
+        idx = indices.get(name)
+        if idx is None:
+            idx = group_node.inputs.find(name)
+            if idx < 0:
+                raise KeyError(f'Node group "{tree.name}" has no input "{name}"')
+            indices[name] = idx
+        return idx
+
+    def input(self, group_node, name: str):
+        return group_node.inputs[self.inputIndex(group_node, name)]
+
+    def clear(self):
+        self.indices.clear()
+
+group_sockets = GroupSockets()
@@ -60,93 +60,485 @@ from bpy import context
 from collections import defaultdict
 from typing import *
 from .node_adder import *
+from .image_registry import image_registry, loadImage
+from .texture_proxy import texture_proxies, sourceFilepath
+from .channel_pack import channel_packer, removePackedRole, PACKED_SOURCE_PROP, PACKED_ROLE_PROP
+from .prefetch import prefetcher
+from .dir_index import dir_index, splitTextureName
+from .recolor_index import parseMaterialFolder, indexRecolors
+from .skin_set import BASE_SKIN, getSkinSets, recordSkinSet, recordBaseSkin, skinSetName, switchSkin
+from .string_match import matchString
+from .material_template import material_templates, getSignature
+from .texture_roles import parsePackedRole
+from .shade_fingerprint import FINGERPRINT_PROP, makeFingerprint, setFingerprint, clearFingerprint, isUpToDate
+from .shade_plan import *
+from .profiler import profiler
+from .log import logger, BatchReport
+
+# on shaded materials, role -> names of its image nodes (ref. indexRoles)
+ROLE_INDEX_PROP = 'apex_role_index'
+
+def getNodeTexturePath(node) -> Path:
+    """
+        Absolute path of the texture an Image Texture node is for.
+    """
+    # (blender use leading double slash `//` as relpath. use bpy first to make it absolute for pathlib)
+    return Path(bpy.path.abspath(node.get(TEXTURE_PATH_PROP) or sourceFilepath(node.image)))
 
-def shadeMaterial(mat: bpy.types.Material, node_adder_cls: NodeAdder):
+def getNodeRole(node) -> str:
     """
-        Shade material with information from Image Texture within the 
-        active material of mesh. Assumes there is at least one image texture
-        in this material!
-        
-        Will delete all existing nodes first.
+        Texture role of an Image Texture node, e.g. `albedoTexture`, or a `packed:` role.
+        Empty if it can't be told from the texture name.
     """
+    if TEXTURE_ROLE_PROP in node:
+        return node[TEXTURE_ROLE_PROP]
+    if node.image is not None and PACKED_ROLE_PROP in node.image:
+        return node.image[PACKED_ROLE_PROP]
+    return splitTextureName(getNodeTexturePath(node).name)[1]
 
+def indexRoles(mat: bpy.types.Material) -> Dict[str, List[str]]:
+    """
+        Index the material's image nodes by role (role -> node names), kept on the material
+        as ROLE_INDEX_PROP so removing textures doesn't have to look at every node.
+    """
+    index = defaultdict(list)
+    for node in mat.node_tree.nodes:
+        if node.type == 'TEX_IMAGE' and node.image is not None:
+            role = getNodeRole(node)
+            if role:
+                index[role].append(node.name)
+    mat[ROLE_INDEX_PROP] = dict(index)
+    return dict(index)
+
+def getRoleIndex(mat: bpy.types.Material) -> Dict[str, List[str]]:
+    """
+        Role -> image node names of the material (ref. indexRoles). Indexed again if it's
+        missing (shaded by an older version) or nodes were removed / renamed by hand since.
+    """
+    index = mat.get(ROLE_INDEX_PROP)
+    if index is None:
+        return indexRoles(mat)
+    index = {role: list(names) for role, names in index.items()}
     nodes = mat.node_tree.nodes
-    links = mat.node_tree.links
+    for names in index.values():
+        for name in names:
+            node = nodes.get(name)
+            if node is None or node.type != 'TEX_IMAGE':
+                return indexRoles(mat)
+    return index
+
+def getTexturePath(mat: bpy.types.Material) -> Optional[Path]:
+    """
+        Absolute path of any Image Texture's image in the material, None if there's none.
+        Channel-packed images (ref. `channel_pack`) are only used if there's nothing else.
+    """
+    if mat is None or mat.node_tree is None:
+        return None
+    packed_path = None
+    for node in mat.node_tree.nodes:
+        if node.type == 'TEX_IMAGE' and node.image is not None:
+            if PACKED_SOURCE_PROP in node.image:
+                packed_path = packed_path or Path(node.image[PACKED_SOURCE_PROP])
+                continue
+            return getNodeTexturePath(node)
+    return packed_path
+
+def planMaterial(mat: bpy.types.Material, node_adder_cls: NodeAdder) -> MaterialPlan:
+    """
+        Make shading plan for a material from the Image Texture within it.
+        Only reads the material, the planning itself is done by `shade_plan`.
+    """
+    img_path = getTexturePath(mat)
+    if img_path is None:
+        return MaterialPlan(mat.name, node_adder_cls.__name__, error='No image texture in material')
+    return planMaterialFromTexture(mat.name, img_path, node_adder_cls.__name__, node_adder_cls.roles.keys())
 
-    # take any Image Texture available
-    img_texture = [node for node in nodes.values() if node.type == 'TEX_IMAGE'][0]
-    # (blender use leading double slash `//` as relpath. use bpy first to make it absolute for pathlib)
-    img_path = Path(bpy.path.abspath(img_texture.image.filepath))
+def planMaterials(mat_ls: List[bpy.types.Material], node_adder_cls: NodeAdder) -> ShadingPlan:
+    with profiler.stage('plan'):
+        return ShadingPlan([planMaterial(mat, node_adder_cls) for mat in mat_ls])
 
-    # clear field
-    nodes.clear()
-    
-    # make some nodes
+def applyMaterialPlan(mat: bpy.types.Material, mat_plan: MaterialPlan, node_adder_cls: NodeAdder) -> bpy.types.Material:
+    """
+        Build the material's node tree from its plan.
+        Will delete all existing nodes first.
+
+        All images are loaded before the node tree is touched, so if any texture
+        can't be loaded the material is left as it was.
+
+        If another material with the same texture roles was shaded before, the nodes
+        are a copy of that one's (ref. `material_template`). Returns `mat`.
+    """
+    # textures are loaded before the nodes using them, they must not be evicted in between
+    with profiler.scope('material', mat_plan.material), image_registry.keepLoaded():
+        return _applyMaterialPlan(mat, mat_plan, node_adder_cls)
+
+def _applyMaterialPlan(mat: bpy.types.Material, mat_plan: MaterialPlan, node_adder_cls: NodeAdder) -> bpy.types.Material:
+    if not mat_plan.ok:
+        raise Exception(f'Cannot shade material {mat_plan.material}: {mat_plan.error}')
+    # of the textures as found, packed images are made from them
+    source_plan = mat_plan
+    if channel_packer.enabled:
+        mat_plan = channel_packer.pack(mat_plan, node_adder_cls)
+    textures = mat_plan.plannedTextures(node_adder_cls)
+    for texture in textures:
+        loadImage(texture.path)
+    shader_node_tree = node_adder_cls.getShaderNodeGroup()
+    fingerprint = makeFingerprint(source_plan, node_adder_cls, shader_node_tree)
+
+    use_template = config.MATERIAL_TEMPLATES and mat.library is None
+    if use_template:
+        signature = getSignature(textures, node_adder_cls)
+        template = material_templates.get(signature, shader_node_tree)
+        if template is not None:
+            with profiler.stage('template_clone'):
+                material_templates.clone(template, mat, textures, node_adder_cls)
+            # copied node by node, like building it
+            profiler.count('nodes.new', len(mat.node_tree.nodes))
+            profiler.count('links.new', len(mat.node_tree.links))
+            setFingerprint(mat, fingerprint)
+            indexRoles(mat)
+            return mat
+
+    with profiler.stage('build_nodes'):
+        mat.use_nodes = True   # to make node tree, or else mat.node_tree is None
+        nodes = mat.node_tree.nodes
+        links = mat.node_tree.links
+
+        # clear field
+        nodes.clear()
+        
+        # make some nodes
+        cas_node_group = addShaderNodes(mat, shader_node_tree)
+
+        # add all textures, they are already checked
+        for i, texture in enumerate(textures):
+            node_adder_cls.addTexture(texture.role, Path(texture.path), mat, cas_node_group, (0.0, -70.0 * i))
+            logger.texture('     Adding texture %s... O', texture.path)
+    # the tree was empty, so everything in it was just added
+    profiler.count('nodes.new', len(nodes))
+    profiler.count('links.new', len(links))
+
+    if use_template:
+        profiler.count('materials.copy')
+        with profiler.stage('template_add'):
+            material_templates.add(signature, mat, textures)
+    setFingerprint(mat, fingerprint)
+    indexRoles(mat)
+    return mat
+
+def addShaderNodes(mat: bpy.types.Material, shader_node_tree):
+    """
+        Add the shader node group linked to a material output, returns the group node.
+    """
+    nodes = mat.node_tree.nodes
     cas_node_group = nodes.new(type='ShaderNodeGroup')
-    cas_node_group.node_tree = node_adder_cls.getShaderNodeGroup()
+    cas_node_group.node_tree = shader_node_tree
     cas_node_group.location = (400.0, 0.0)
     output_node = nodes.new(type='ShaderNodeOutputMaterial')
     output_node.location = (700.0, 0.0)
-    links.new(cas_node_group.outputs[0], output_node.inputs[0])
+    with profiler.stage('link'):
+        mat.node_tree.links.new(cas_node_group.outputs[0], output_node.inputs[0])
+    return cas_node_group
 
-    # get path from image texture (should be .../<model_name>_<mesh_name>_<texture_name>.png)
-    # (currently assume path.count("_") is the same for all texture in directory)
-    mesh_name = img_path.name[:img_path.name.rindex('_')]
-    texture_paths = img_path.parent.glob(mesh_name + '_*')
+def prefetchPlan(plan: ShadingPlan):
+    """
+        Start reading all textures of the plan in background (ref. `prefetch`),
+        so file I/O overlaps with building node trees on the main thread.
+        In proxy mode, also picks proxy levels for the memory budget (ref. `texture_proxy`).
+    """
+    textures = []
+    for mat_plan in plan:
+        node_adder_cls = node_adder_classes.get(mat_plan.node_adder)
+        # headers aren't read yet, that's what the prefetcher is for
+        if mat_plan.ok and node_adder_cls is not None:
+            textures.extend(mat_plan.plannedTextures(node_adder_cls, check_images=False))
+    prefetcher.clear()
+    prefetcher.prefetch(texture.path for texture in textures)
+    if texture_proxies.enabled:
+        texture_proxies.planLevels((texture.path, texture.role) for texture in textures)
+
+def applyShadingPlan(plan: ShadingPlan, materials: Optional[Dict[str, bpy.types.Material]] = None) -> List[MaterialPlan]:
+    """
+        Apply all material plans in bulk. Node adders are resolved by name
+        (ref. `node_adder_classes`), materials by name from `materials` or `bpy.data.materials`.
 
-    # add all textures
-    for i, texture_path in enumerate(texture_paths):
-        ret = node_adder_cls.addImageTexture(texture_path, mat, cas_node_group, (0.0, -70.0 * i))
-        print(f'     Adding texture {str(texture_path)}... {"O" if ret else "X"}')
-    
-    return
+        Plans with error, or that failed to apply, are skipped without touching
+        their material. Returns the list of those plans.
+    """
+    failed_ls = [mat_plan for mat_plan in plan if not mat_plan.ok]
+    mat_plan_ls = [mat_plan for mat_plan in plan if mat_plan.ok]
+    prefetchPlan(plan)
+    for i, mat_plan in enumerate(mat_plan_ls):
+        mat = materials[mat_plan.material] if materials is not None else bpy.data.materials.get(mat_plan.material)
+        node_adder_cls = node_adder_classes.get(mat_plan.node_adder)
+        if mat is None or node_adder_cls is None:
+            mat_plan.error = f'No material {mat_plan.material}' if mat is None else f'No node adder {mat_plan.node_adder}'
+            failed_ls.append(mat_plan)
+            continue
+        logger.material('[Material %d/%d] shading material %s...', i, len(mat_plan_ls), mat.name)
+        try:
+            applyMaterialPlan(mat, mat_plan, node_adder_cls)
+        except Exception as e:
+            logger.material('     Failed: %s', e)
+            mat_plan.error = str(e)
+            failed_ls.append(mat_plan)
+    return failed_ls
+
+def applyMaterialPlanByName(mat_plan: MaterialPlan):
+    """
+        Apply plan to the material and with the node adder named in the plan.
+        Useful when the plan is applied later, e.g. from a modal operator.
+    """
+    mat = bpy.data.materials.get(mat_plan.material)
+    if mat is None:
+        raise Exception(f'No material {mat_plan.material}')
+    if mat_plan.node_adder not in node_adder_classes:
+        raise Exception(f'No node adder {mat_plan.node_adder}')
+    return applyMaterialPlan(mat, mat_plan, node_adder_classes[mat_plan.node_adder])
+
+def shadeMaterial(mat: bpy.types.Material, node_adder_cls: NodeAdder):
+    """
+        Shade material with information from Image Texture within the 
+        material. Raises if no texture can be found from this material.
+        
+        Will delete all existing nodes first. Returns the shaded material (ref. `applyMaterialPlan`).
+    """
+    return applyMaterialPlan(mat, planMaterial(mat, node_adder_cls), node_adder_cls)
+
+def getObjectMeshes(obj: bpy.types.Object) -> List[bpy.types.Object]:
+    """
+        Mesh itself, or all meshes of an armature. Other types of object have no meshes.
+    """
+    if obj.type == 'MESH':
+        return [obj]
+    if obj.type == 'ARMATURE':
+        return [child for child in obj.children if child.type == 'MESH']
+    return []
+
+def collectMaterials(objs: List[bpy.types.Object]) -> Tuple[List[bpy.types.Material], int]:
+    """
+        Collect the unique materials in every material slot of the given meshes
+        (or armatures' meshes), keeping the order they are first seen.
+
+        Returns (materials, number of material slots referencing them), so
+        `slot_count - len(materials)` is the number of rebuilds avoided.
+    """
+    mat_ls = []
+    seen = set()
+    slot_count = 0
+    for obj in objs:
+        for mesh in getObjectMeshes(obj):
+            for slot in mesh.material_slots:
+                if slot.material is None:
+                    continue
+                slot_count += 1
+                if slot.material not in seen:
+                    seen.add(slot.material)
+                    mat_ls.append(slot.material)
+    return mat_ls, slot_count
+
+def splitUnchanged(plan: ShadingPlan, node_adder_cls: NodeAdder) -> Tuple[ShadingPlan, List[MaterialPlan]]:
+    """
+        Split off plans of materials that were already shaded from the same textures and shader
+        (ref. `shade_fingerprint`), shading them again would build the same node tree.
+        Returns (plan of the rest, unchanged plans).
+    """
+    mat_ls = [bpy.data.materials.get(mat_plan.material) for mat_plan in plan]
+    if not any(mat is not None and FINGERPRINT_PROP in mat for mat in mat_ls):
+        # nothing shaded before, no need to get the shader
+        return plan, []
+    try:
+        shader_node_tree = node_adder_cls.getShaderNodeGroup()
+    except Exception:
+        # can't tell, applying will report why
+        return plan, []
+    changed = ShadingPlan()
+    unchanged_ls = []
+    with profiler.stage('fingerprint'):
+        for mat, mat_plan in zip(mat_ls, plan):
+            if mat is not None and isUpToDate(mat, mat_plan, node_adder_cls, shader_node_tree):
+                unchanged_ls.append(mat_plan)
+            else:
+                changed.append(mat_plan)
+    return changed, unchanged_ls
+
+def shadeMaterials(mat_ls: List[bpy.types.Material], node_adder_cls: NodeAdder,
+                   force: bool = False) -> Tuple[List[MaterialPlan], List[MaterialPlan]]:
+    """
+        Shade every material once: plan all of them first, then apply the plan in bulk.
+        Materials that can't be planned (e.g. no image texture) are left untouched, and so are
+        materials whose textures didn't change since they were shaded, unless `force`.
+
+        Returns (plans of materials that can't be shaded, plans of unchanged materials).
+    """
+    plan = planMaterials(mat_ls, node_adder_cls)
+    logger.summary('    Plan: %s', plan.summary())
+    unchanged_ls = []
+    if not force:
+        plan, unchanged_ls = splitUnchanged(plan, node_adder_cls)
+    return applyShadingPlan(plan, {mat.name: mat for mat in mat_ls}), unchanged_ls
+
+def shadeObjects(objs: List[bpy.types.Object], node_adder_cls: NodeAdder, force: bool = False) -> Dict[str, Any]:
+    """
+        Shade all materials used by the given meshes / armatures, each material exactly once
+        even if it is shared by multiple meshes, LODs or armatures.
+
+        Materials already shaded from the same textures are skipped unless `force`
+        (ref. `shadeMaterials`).
+
+        Returns counts for reporting: shaded materials, rebuilds skipped because the material
+        was already shaded by another slot, materials skipped because nothing changed, and
+        materials skipped because they can't be shaded (with the reason in `errors`).
+    """
+    title = objs[0].name if len(objs) == 1 else f'{len(objs)} objects'
+    with profiler.scope('batch', title):
+        mat_ls, slot_count = collectMaterials(objs)
+        # names for the report after shading (ref. the RSAStruct bug in TODO.md)
+        mat_names = [mat.name for mat in mat_ls]
+        failed_ls, unchanged_ls = shadeMaterials(mat_ls, node_adder_cls, force)
+        dir_index.save()
+
+    report = BatchReport(f'Shade {title}')
+    errors = {mat_plan.material: mat_plan.error for mat_plan in failed_ls}
+    for mat_name in mat_names:
+        if mat_name in errors:
+            report.fail(mat_name, errors[mat_name])
+        else:
+            report.success(mat_name)
+    logger.summary('    %d shared material rebuilds skipped, %d unchanged materials skipped',
+                   slot_count - len(mat_ls), len(unchanged_ls))
+    report.log()
+    return {
+        'shaded': len(mat_ls) - len(failed_ls) - len(unchanged_ls),
+        'duplicate': slot_count - len(mat_ls),
+        'unchanged': len(unchanged_ls),
+        'failed': len(failed_ls),
+        'errors': {mat_plan.material: mat_plan.error for mat_plan in failed_ls},
+    }
 
 def shadeMesh(mesh: bpy.types.Object, node_adder_cls: NodeAdder):
     """
-        Shade mesh's active material with information from Image Texture
-        within the active material of mesh. Assumes there is at least one
-        image texture in this material
+        Shade every material of the mesh with information from Image Texture
+        within that material. Materials that can't be shaded are skipped.
         
         Will delete all existing nodes first!
     """
 
-    print(f"[*] shadeMesh({mesh})")
-    mat = mesh.active_material
-
-    shadeMaterial(mat, node_adder_cls)
+    logger.summary('[*] shadeMesh(%s)', mesh)
+    return shadeObjects([mesh], node_adder_cls)
 
 def shadeArmature(armature: bpy.types.Object, node_adder_cls=NodeAdder):
     """
-        Shade all given armature's mesh by shadeMesh.
-    """
-
-    print(f'[*] shadeArmature({armature})')
-    meshes = [obj for obj in armature.children if obj.type == 'MESH']
-    success_ls = []
-    failed_ls = []
-
-    # for i, mesh in enumerate(meshes):
-    #     try:
-    #         print(f'[Armature-Mesh {i}/{len(meshes)}] shading mesh {mesh}...')
-    #         shadeMesh(mesh, do_check, node_adder_cls)
-    #         success_ls.append(mesh)
-    #     except Exception as e:
-    #         print(e)
-    #         failed_ls.append((mesh, e))
-
-    # print(f'Success: ')
-    # for i in success_ls:
-    #     print("    ", i)
-    # print(f'Failed: ')
-    # for i in failed_ls:
-    #     print("    ", i)
-    
-    # if len(failed_ls) != 0:
-    #     raise Exception(f"Exception occured when shading those meshes: {failed_ls}")
-    # return
-    for i, mesh in enumerate(meshes):
-        print(f'[Armature-Mesh {i}/{len(meshes)}] shading mesh {mesh}...')
-        shadeMesh(mesh, node_adder_cls)
+        Shade all materials of given armature's meshes, each shared material only once.
+    """
+
+    logger.summary('[*] shadeArmature(%s)', armature)
+    # materials of all meshes are shaded together (shared ones once), shadeObjects()
+    # reports success / failure of each, one failing material doesn't stop the others
+    with profiler.scope('armature', armature.name):
+        result = shadeObjects([armature], node_adder_cls)
+    return result
+
+def convertMaterial(mat: bpy.types.Material, node_adder_cls: NodeAdder) -> int:
+    """
+        Switch a shaded material to another shader without shading it again: image nodes are
+        kept with their images, everything else is replaced by the node adder's node group,
+        and each image node is linked to it by its role. Nothing is loaded.
+
+        Image nodes the node adder has no role for stay in the material unlinked, so converting
+        back links them again. Like shading, other nodes (e.g. added by hand) are removed.
+        Returns the number of image nodes linked.
+    """
+    if mat.node_tree is None:
+        raise Exception(f'{mat.name} has no nodes')
+    nodes = mat.node_tree.nodes
+    img_nodes = [node for node in nodes if node.type == 'TEX_IMAGE' and node.image is not None]
+    if not img_nodes or not any(node.type == 'GROUP' for node in nodes):
+        raise Exception(f'{mat.name} is not shaded')
+    shader_node_tree = node_adder_cls.getShaderNodeGroup()
+
+    with profiler.stage('convert_shader'):
+        other_nodes = [node for node in nodes if node.type != 'TEX_IMAGE']
+        for node in other_nodes:
+            nodes.remove(node)
+        profiler.count('nodes.remove', len(other_nodes))
+        mat.blend_method = 'OPAQUE'
+        cas_node_group = addShaderNodes(mat, shader_node_tree)
+        linked = 0
+        for img_node in img_nodes:
+            if node_adder_cls.relinkImageNode(img_node, getNodeRole(img_node), mat, cas_node_group):
+                linked += 1
+    # roles the node adder has but the old shader didn't aren't added, so it's not what shading would build
+    clearFingerprint(mat)
+    indexRoles(mat)
+    logger.material('    Converted %s to %s, %d/%d image nodes linked', mat.name, node_adder_cls.__name__, linked, len(img_nodes))
+    return linked
+
+def convertObjects(objs: List[bpy.types.Object], node_adder_cls: NodeAdder) -> BatchReport:
+    """
+        Convert the materials of the given meshes / armatures to another shader (ref. convertMaterial),
+        each shared material once. A material that can't be converted is reported and skipped.
+    """
+    title = objs[0].name if len(objs) == 1 else f'{len(objs)} objects'
+    logger.summary('[*] convertObjects(%s, %s)', title, node_adder_cls.__name__)
+    mat_ls, _ = collectMaterials(objs)
+    report = BatchReport(f'Convert {title} to {node_adder_cls.__name__}')
+    with profiler.scope('batch', title):
+        for mat in mat_ls:
+            report.run(mat.name, convertMaterial, mat, node_adder_cls)
+    report.log()
+    return report
+
+def removeRoles(mat: bpy.types.Material, roles: Iterable[str]) -> List[str]:
+    """
+        Remove the image nodes of the given texture roles (e.g. `scatterThicknessTexture`)
+        from the material, found by its role index. Packed roles are unlinked from their
+        channel, the other channels of the image stay. Other nodes of the role (sub-graphs)
+        are left, they are no-op without the image (ref. `NodeAdder`). Returns the roles removed.
+    """
+    if mat.node_tree is None:
+        return []
+    roles = set(roles)
+    index = getRoleIndex(mat)
+    nodes = mat.node_tree.nodes
+    removed = []
+    for role, names in list(index.items()):
+        layout = parsePackedRole(role)
+        if layout is not None:
+            for packed_role in roles.intersection(layout.values()):
+                for name in names:
+                    if removePackedRole(mat.node_tree, nodes[name], packed_role):
+                        logger.texture('    unlinked %s from packed image %s', packed_role, name)
+                        removed.append(packed_role)
+        elif role in roles:
+            for name in names:
+                logger.texture('    removed %s', name)
+                nodes.remove(nodes[name])
+            profiler.count('nodes.remove', len(names))
+            del index[role]
+            removed.append(role)
+    if removed:
+        mat[ROLE_INDEX_PROP] = index
+        # not what shading it would build anymore, so shading it again restores the texture
+        clearFingerprint(mat)
+    return removed
+
+def removeTextures(objs: List[bpy.types.Object], roles: Iterable[str]) -> BatchReport:
+    """
+        Remove textures of the given roles from the materials of the given meshes / armatures,
+        in one pass over the materials (each shared material once, ref. removeRoles).
+        A material that fails is reported and skipped, the others are still done.
+    """
+    roles = sorted(set(roles))
+    title = objs[0].name if len(objs) == 1 else f'{len(objs)} objects'
+    logger.summary('[*] removeTextures(%s, %s)', title, roles)
+    mat_ls, _ = collectMaterials(objs)
+    report = BatchReport(f"Remove {', '.join(roles)} from {title}")
+    with profiler.scope('batch', title):
+        for mat in mat_ls:
+            report.run(mat.name, removeRoles, mat, roles)
+    report.log()
+    return report
 
 def removeTextureMesh(mesh: bpy.types.Object, texture_type: str):
     """
@@ -156,153 +548,105 @@ def removeTextureMesh(mesh: bpy.types.Object, texture_type: str):
         e.g. if you want to remove `octane_base_body_scatterThicknessTexture`,
         then texture_type = 'scatterThicknessTexture'
     """
-    print(f'[*] removeTextureMesh({mesh}, {texture_type})')
-    mat = mesh.active_material
-    nodes = mat.node_tree.nodes
+    logger.material('[*] removeTextureMesh(%s, %s)', mesh, texture_type)
+    removeRoles(mesh.active_material, [texture_type])
 
-    img_textures = [node for node in nodes.values() if node.type == 'TEX_IMAGE']
-
-    for img_texture in img_textures:
-        img_path = Path(bpy.path.abspath(img_texture.image.filepath))
-        if img_path.stem[img_path.stem.rindex('_')+1:] == texture_type:
-            print(f'    removed {str(img_path.stem)}')
-            nodes.remove(img_texture)
-
-def removeTextureArmature(armature: bpy.types.Object, texture_type: str):
-    """
-        Remove armature's mesh's texture with removeTextureMesh
-    """
-    print(f'[*] removeTextureArmature({armature}, {texture_type})')
-    meshes = [obj for obj in armature.children if obj.type == 'MESH']
-    success_ls = []
-    failed_ls = []
-
-    # for i, mesh in enumerate(meshes):
-    #     try:
-    #         print(f"[Armature-Mesh {i}/{len(meshes)}] removing texture '{texture_type}' from mesh {mesh}...")
-    #         removeTextureMesh(mesh, texture_type)
-    #         success_ls.append(mesh)
-    #     except Exception as e:
-    #         print(e)
-    #         failed_ls.append((mesh, e))
-
-    # print(f'Shade Success: ')
-    # for i in success_ls:
-    #     print("    ", i)
-    # print(f'Shade Failed: ')
-    # for i in failed_ls:
-    #     print("    ", i)
-    
-    # if len(failed_ls) != 0:
-    #     raise Exception(f"Exception occured when removing textures '{texture_type}' from those meshes: {failed_ls}")
-    for i, mesh in enumerate(meshes):
-        print(f"[Armature-Mesh {i}/{len(meshes)}] removing texture '{texture_type}' from mesh {mesh}...")
-        removeTextureMesh(mesh, texture_type)
-        success_ls.append(mesh)
-    return
+def removeTextureArmature(armature: bpy.types.Object, texture_type: str) -> BatchReport:
+    """
+        Remove texture from all materials of the armature's meshes (ref. removeTextures).
+    """
+    return removeTextures([armature], [texture_type])
 
-def recolorMesh(mesh: bpy.types.Object, dir_path: Path, node_adder_cls: NodeAdder):
+def recolorMesh(mesh: bpy.types.Object, dir_path: Path, node_adder_cls: NodeAdder) -> bpy.types.Material:
     """
         make a recolor material for the mesh, using the materials from `dir_path`
         Note that this will create a new material for this specific recolor 
         (material name derived from dir_path)
 
         dir_path: the directory where the textures of this material is stored
+        Returns the material the mesh got.
     """
-    print(f'[*] recolorMesh({mesh}, {dir_path.stem} ({str(dir_path)}))')
+    logger.material('[*] recolorMesh(%s, %s (%s))', mesh, dir_path.stem, dir_path)
+
+    # plan first, so no empty material is made if this directory can't be used
+    mat_plan = planMaterialFromDirectory(f"{dir_path.stem}_material", dir_path,
+                                         node_adder_cls.__name__, node_adder_cls.roles.keys())
 
     # see if this texture is loaded already
-    mat = bpy.data.materials.get(f"{dir_path.stem}_material")
+    mat = bpy.data.materials.get(mat_plan.material)
     if mat is not None:
+        if mat_plan.ok and not isUpToDate(mat, mat_plan, node_adder_cls, node_adder_cls.getShaderNodeGroup()):
+            # textures changed since, shade it again
+            mat = applyMaterialPlan(mat, mat_plan, node_adder_cls)
         # already have this texture, reuse it
-        if mesh.data.materials:
-            mesh.data.materials[0] = mat
-        else:
-            mesh.data.materials.append(mat)
-        mesh.active_material = mat
-        return
-    
+        assignMaterial(mesh, mat)
+        return mat
+
+    if not mat_plan.ok:
+        raise Exception(f'Cannot recolor {mesh} with {dir_path}: {mat_plan.error}')
+
     # add new material for this recolor's mesh
-    mat = bpy.data.materials.new(name=f"{dir_path.stem}_material")
+    mat = bpy.data.materials.new(name=mat_plan.material)
+    assignMaterial(mesh, mat)
+    return applyMaterialPlan(mat, mat_plan, node_adder_cls)
+
+def recolorMeshByName(mesh_name: str, dir_path: Path, node_adder_cls: NodeAdder):
+    """
+        `recolorMesh()` of the object named `mesh_name`, for steps run later (e.g. from a modal
+        operator), the object may be gone by then.
+    """
+    mesh = bpy.data.objects.get(mesh_name)
+    if mesh is None:
+        raise Exception(f'No object {mesh_name}')
+    return recolorMesh(mesh, dir_path, node_adder_cls)
+
+def assignMaterial(mesh: bpy.types.Object, mat: bpy.types.Material):
+    """
+        Use `mat` as the mesh's first (active) material.
+    """
     if mesh.data.materials:
         mesh.data.materials[0] = mat
     else:
         mesh.data.materials.append(mat)
     mesh.active_material = mat
-    mat.use_nodes = True   # to make node tree, or else mat.node_tree is None
-    nodes = mat.node_tree.nodes
 
-    # pick whatever image and use it as image node
-    img_path = next(dir_path.iterdir())
-    nodes.clear()
-    img_node = mat.node_tree.nodes.new(type='ShaderNodeTexImage')
-    img_node.image = bpy.data.images.load(str(img_path))
+def getMeshTexturePath(mesh: bpy.types.Object) -> Path:
+    """
+        Path of the first Image Texture of the mesh's active material.
+    """
+    nodes = mesh.active_material.node_tree.nodes
+    img_texture = [node for node in nodes.values() if node.type == 'TEX_IMAGE'][0]
+    return getNodeTexturePath(img_texture)
 
-    # shadeMesh will use that image node and import other things
-    shadeMesh(mesh, node_adder_cls)
+def getMeshNameMap(armature: bpy.types.Object) -> Dict[str, List[bpy.types.Object]]:
+    """
+        Mapping from name of mesh to the armature's meshes, name is derived from image texture path
+        e.g. mesh with "bloodhound_lgnd_v21_chinatown_body_aoTexture.png" -> mesh name = "body"
 
-def recolorArmature(armature: bpy.types.Object, dir_path: Path, node_adder_cls: NodeAdder):
+        Note that one name may map to multiple mesh
+        e.g. in pilot_heavy_revenant_legendary_02, mesh `hand` and `body` both uses `body` texture...
     """
-        Recolor given armature's meshes with directories named similarly to dir_path
+    mesh_name_map = defaultdict(list)
+    for mesh in [obj for obj in armature.children if obj.type == 'MESH']:
+        name = getMeshTexturePath(mesh).stem.split('_')[-2]
+        mesh_name_map[name].append(mesh)
+    return mesh_name_map
+
+def getRecolorJobs(armature: bpy.types.Object, dir_path: Path) -> List[Tuple[bpy.types.Object, Path]]:
+    """
+        Find directories named similarly to dir_path for given armature's meshes.
+        Returns (mesh, directory) pairs, each should be recolored with recolorMesh.
 
         e.g. given dir_path "<parent>/bloodhound_base_body/", will find directories such as
         "<parent>/bloodhound_base_fur/" and others matching "<parent>/bloodhound_base_*/"
     """
-    print(f'[*] recolorArmature({armature}, {dir_path})')
-    meshes = [obj for obj in armature.children if obj.type == 'MESH']
-
-    # make mapping from name of mesh to mesh, name is derived from image texture path
-    # e.g. mesh with "bloodhound_lgnd_v21_chinatown_body_aoTexture.png" -> mesh name = "body"
-    # note that one name may map to multiple mesh
-    # e.g. in pilot_heavy_revenant_legendary_02, mesh `hand` and `body` both uses `body` texture...
-    mesh_name_map = defaultdict(list)
-    for mesh in meshes:
-        mat = mesh.active_material
-        nodes = mat.node_tree.nodes
-        img_texture = [node for node in nodes.values() if node.type == 'TEX_IMAGE'][0]
-        img_path = Path(bpy.path.abspath(img_texture.image.filepath))
+    mesh_name_map = getMeshNameMap(armature)
 
-        # e.g. "bloodhound_lgnd_v21_chinatown_body_aoTexture.png" -> name = "body"
-        name = img_path.stem.split('_')[-2]
-        mesh_name_map[name].append(mesh)
-    
     # find all similarly named directory and use them to recolor
-    # success_ls = []
-    # failed_ls = []
-    # dir_name = dir_path.stem                        # e.g. "bloodhound_base_body"
-    # recolor_name = dir_name[:dir_name.rindex('_')]  # e.g. "bloodhound_base"
-    # for subdir_path in dir_path.parent.glob(recolor_name + '*'):
-    #     if not subdir_path.is_dir():
-    #         continue
-    #     if subdir_path.stem.count('_') != dir_name.count('_'):
-    #         # e.g. when choosing "bloodhound_lgnd_v21_heroknight_gear",
-    #         # cannot import "bloodhound_lgnd_v21_heroknight_rt01_body"
-    #         continue
-    #     name = subdir_path.stem.split('_')[-1]  # e.g. "bloodhound_base_fur" -> "fur"
-    #     if name in mesh_name_map:
-    #         try:
-    #             for mesh in mesh_name_map[name]:
-    #                 recolorMesh(mesh, subdir_path)
-    #                 success_ls.append(mesh)
-    #         except Exception as e:
-    #             print(e)
-    #             failed_ls.append((mesh, e))
-    
-    # print(f'Recolor Success: ')
-    # for i in success_ls:
-    #     print("    ", i)
-    # print(f'Recolor Failed: ')
-    # for i in failed_ls:
-    #     print("    ", i)
-    
-    # if len(failed_ls) != 0:
-    #     raise Exception(f"Exception occured when recoloring those meshes: {failed_ls}")
-
+    job_ls = []
     dir_name = dir_path.stem                        # e.g. "bloodhound_base_body"
     recolor_name = dir_name[:dir_name.rindex('_')]  # e.g. "bloodhound_base"
-    for subdir_path in dir_path.parent.glob(recolor_name + '*'):
-        if not subdir_path.is_dir():
-            continue
+    for subdir_path in dir_index.getSubdirs(dir_path.parent, recolor_name):
         if subdir_path.stem.count('_') != dir_name.count('_'):
             # e.g. when choosing "bloodhound_lgnd_v21_heroknight_gear",
             # cannot import "bloodhound_lgnd_v21_heroknight_rt01_body"
@@ -310,62 +654,181 @@ def recolorArmature(armature: bpy.types.Object, dir_path: Path, node_adder_cls:
         name = subdir_path.stem.split('_')[-1]  # e.g. "bloodhound_base_fur" -> "fur"
         if name in mesh_name_map:
             for mesh in mesh_name_map[name]:
-                recolorMesh(mesh, subdir_path, node_adder_cls)
-    return
+                job_ls.append((mesh, subdir_path))
+    return job_ls
 
-def matchString(from_ls: List[str], to_ls: List[str]) -> Dict[str, str]:
-    # match string from `from_ls` to `to_ls`, returns a mapping
-    # I don't really wanna install additional module in blender python...
-    # should be O(distance) * O(len(from_ls) * len(to_ls))
+def recolorArmature(armature: bpy.types.Object, dir_path: Path, node_adder_cls: NodeAdder) -> BatchReport:
+    """
+        Recolor given armature's meshes with directories named similarly to dir_path
+        (ref. getRecolorJobs). A mesh that fails is reported and skipped.
+    """
+    logger.summary('[*] recolorArmature(%s, %s)', armature, dir_path)
+    report = BatchReport(f'Recolor {armature.name}')
+    with profiler.scope('armature', armature.name):
+        recordBaseSkin(armature)
+        recolored_ls = []
+        for mesh, subdir_path in getRecolorJobs(armature, dir_path):
+            job_name = f'{mesh.name} <- {subdir_path.name}'
+            if report.run(job_name, recolorMesh, mesh, subdir_path, node_adder_cls) is not None:
+                recolored_ls.append(mesh.name)
+        dir_index.save()
+    recordRecolorSkinSet(armature, dir_path, recolored_ls)
+    report.log()
+    return report
+
+def recordRecolorSkinSet(armature: bpy.types.Object, dir_path: Path, mesh_names: List[str]):
+    """
+        Record the materials the meshes got from recolorMesh() with dir_path (ref. getRecolorJobs)
+        as a skin set of the armature, and make it the active one.
+    """
+    parsed = parseMaterialFolder(dir_path.name, config.RECOLOR_IGNORED_PASSES)
+    materials = {}
+    for mesh_name in mesh_names:
+        mesh = bpy.data.objects.get(mesh_name)
+        if mesh is not None and mesh.data.materials and mesh.data.materials[0] is not None:
+            materials[mesh_name] = mesh.data.materials[0].name
+    recordSkinSet(armature, skinSetName(parsed[1]) if parsed is not None else dir_path.name, materials, active=True)
+
+def getRecolorVariantJobs(armature: bpy.types.Object, dir_path: Path) -> Tuple[Optional[str], Dict[str, List[Tuple[bpy.types.Object, Path]]]]:
+    """
+        Every recolor of the armature's skin (ref. `recolor_index`), from one listing of the Legion+
+        `materials/` folder. Render pass folders (`config.RECOLOR_IGNORED_PASSES`) are skipped.
 
-    def distance(s: str, t: str) -> int:
-        # directly copied from https://machinelearningknowledge.ai/ways-to-calculate-levenshtein-distance-edit-distance-in-python/
-        m = len(s)
-        n = len(t)
-        d = [[0] * (n + 1) for i in range(m + 1)]  
+        dir_path: either the `materials/` folder, the skin is then the one of the armature's textures,
+                  or any material folder of a recolor, whose skin is used
 
-        for i in range(1, m + 1):
-            d[i][0] = i
+        Returns (recolor id of dir_path or None, recolor id -> (mesh, directory) pairs).
+    """
+    ignored_passes = set(config.RECOLOR_IGNORED_PASSES)
+    selected = parseMaterialFolder(dir_path.name, ignored_passes) if dir_index.getAnyFile(dir_path) is not None else None
+    if selected is not None:
+        materials_dir = dir_path.parent
+        skin, selected_recolor, _ = selected
+    else:
+        materials_dir = dir_path
+        selected_recolor = None
+        # e.g. "bloodhound_lgnd_v21_heroknight_rt01_body_albedoTexture.png" -> "bloodhound_lgnd_v21_heroknight"
+        skin_ls = [parseMaterialFolder(splitTextureName(getMeshTexturePath(mesh).name)[0], ignored_passes)
+                   for mesh in armature.children if mesh.type == 'MESH']
+        skin_ls = [parsed[0] for parsed in skin_ls if parsed is not None]
+        if not skin_ls:
+            raise Exception(f'Cannot tell the skin of {armature.name} from its textures')
+        skin = max(set(skin_ls), key=skin_ls.count)
+
+    recolors = indexRecolors(materials_dir, ignored_passes).get(skin)
+    if recolors is None:
+        raise Exception(f'No material folder of {skin} in {materials_dir}')
+    mesh_name_map = getMeshNameMap(armature)
+    variants = {}
+    for recolor, folders in recolors.items():
+        variants[recolor] = [(mesh, subdir_path) for name, subdir_path in folders.items()
+                             for mesh in mesh_name_map.get(name, [])]
+    return selected_recolor, variants
+
+def recolorArmatureVariants(armature: bpy.types.Object, dir_path: Path, node_adder_cls: NodeAdder) -> BatchReport:
+    """
+        Make the materials of every recolor of the armature's skin in one batch
+        (ref. getRecolorVariantJobs), planned first and applied together like `shadeMaterials`.
+        Recolor materials made before are reused, or shaded again if their textures changed.
 
-        for j in range(1, n + 1):
-            d[0][j] = j
-        
-        for j in range(1, n + 1):
-            for i in range(1, m + 1):
-                if s[i - 1] == t[j - 1]:
-                    cost = 0
-                else:
-                    cost = 1
-                d[i][j] = min(d[i - 1][j] + 1,      # deletion
-                            d[i][j - 1] + 1,      # insertion
-                            d[i - 1][j - 1] + cost) # substitution   
-
-        return d[m][n]
-    
-    def argmin(array):
-        return min(range(len(array)), key=lambda x: array[x])
-    
-    d = {}
-    for f_s in from_ls:
-        d_ls = [distance(f_s, t_s) for t_s in to_ls]
-        d[f_s] = to_ls[argmin(d_ls)]
-    return d
+        Each recolor is recorded as a skin set of the armature (ref. `skin_set`), the meshes get the
+        recolor of dir_path if it's a recolor folder. The base skin is the materials the model was
+        imported with, so the skin's own folders are only made into materials if it has none.
+    """
+    logger.summary('[*] recolorArmatureVariants(%s, %s)', armature, dir_path)
+    report = BatchReport(f'Recolor variants of {armature.name}')
+    with profiler.scope('armature', armature.name):
+        selected_recolor, variants = getRecolorVariantJobs(armature, dir_path)
+        logger.summary('    %d recolors: %s', len(variants), ', '.join(recolor or 'base' for recolor in variants))
+        recordBaseSkin(armature)
+        if getSkinSets(armature).get(BASE_SKIN):
+            # keep the materials the model was imported with
+            variants = {recolor: job_ls for recolor, job_ls in variants.items() if skinSetName(recolor) != BASE_SKIN}
+
+        # plan each material folder once, meshes sharing a folder share the material
+        with profiler.stage('plan'):
+            plan = ShadingPlan()
+            planned = set()
+            for job_ls in variants.values():
+                for _, subdir_path in job_ls:
+                    mat_name = f"{subdir_path.stem}_material"
+                    if mat_name in planned:
+                        continue
+                    planned.add(mat_name)
+                    plan.append(planMaterialFromDirectory(mat_name, subdir_path,
+                                                          node_adder_cls.__name__, node_adder_cls.roles.keys()))
+        plan, unchanged_ls = splitUnchanged(plan, node_adder_cls)
+        materials = {}
+        new_materials = set()
+        for mat_plan in plan:
+            mat = bpy.data.materials.get(mat_plan.material)
+            if mat is None and mat_plan.ok:
+                mat = bpy.data.materials.new(name=mat_plan.material)
+                new_materials.add(mat_plan.material)
+            if mat is not None:
+                materials[mat_plan.material] = mat
+
+        failed_ls = applyShadingPlan(plan, materials)
+        for mat_plan in failed_ls:
+            # don't leave empty materials behind
+            mat = bpy.data.materials.get(mat_plan.material)
+            if mat is not None and mat_plan.material in new_materials:
+                bpy.data.materials.remove(mat)
+            report.fail(mat_plan.material, mat_plan.error)
+        logger.summary('    %d unchanged recolor materials skipped', len(unchanged_ls))
+        failed_names = set(mat_plan.material for mat_plan in failed_ls)
+        for mat_plan in plan:
+            if mat_plan.material not in failed_names:
+                report.success(mat_plan.material)
+
+        # every recolor is a skin set, switched by swapping slots only (ref. `skin_set`)
+        for recolor, job_ls in variants.items():
+            recordSkinSet(armature, skinSetName(recolor), {mesh.name: f"{subdir_path.stem}_material" for mesh, subdir_path in job_ls
+                                                           if f"{subdir_path.stem}_material" in bpy.data.materials})
+        if selected_recolor is not None:
+            switchSkin(armature, skinSetName(selected_recolor))
+        dir_index.save()
+    report.log()
+    return report
 
 def shadeMaterialByDirectory(mat: bpy.types.Material, dir_path: Path, node_adder_cls: NodeAdder):
     """
         Shade a material by directory.
-        Will properly initialize the material (use_node = True, add an image for shadeMaterial)
+        Will properly initialize the material (use_node = True)
+        Returns the shaded material (ref. `applyMaterialPlan`).
     """
     # note that we don't use utils.recolorMesh because it creates new material
-    # but shadeMaterial requires the material have 1 image texture
-    # we clear material and add random image
-    mat.use_nodes = True
-    nodes = mat.node_tree.nodes
-    nodes.clear()
+    mat_plan = planMaterialFromDirectory(mat.name, dir_path, node_adder_cls.__name__, node_adder_cls.roles.keys())
+    return applyMaterialPlan(mat, mat_plan, node_adder_cls)
+
+def shadeMaterialByDirectoryName(mat_name: str, dir_path: Path, node_adder_cls: NodeAdder):
+    """
+        `shadeMaterialByDirectory()` of the material named `mat_name`, for steps run later
+        (e.g. from a modal operator), the material may be gone by then.
+    """
+    mat = bpy.data.materials.get(mat_name)
+    if mat is None:
+        raise Exception(f'No material {mat_name}')
+    return shadeMaterialByDirectory(mat, dir_path, node_adder_cls)
 
-    img_path = next(dir_path.iterdir())
-    img_node = nodes.new(type='ShaderNodeTexImage')
-    img_node.image = bpy.data.images.load(str(img_path))
+def matchMaterialDirectories(objs: List[bpy.types.Object], directory) -> List[Tuple[bpy.types.Material, Path]]:
+    """
+        Match each material of the meshes / armatures' meshes to the most similarly
+        named subfolder of `directory`. Returns (material, folder) pairs, each
+        shared material only once.
+    """
+    mat_ls, slot_count = collectMaterials(objs)
+    logger.summary('    %d materials, %d shared material rebuilds skipped', len(mat_ls), slot_count - len(mat_ls))
+
+    # match name of material to folder
+    mat_name_ls = [mat.name for mat in mat_ls]
+    folder_name_ls = [p.name for p in dir_index.getSubdirs(directory)]
+    with profiler.stage('matching'):
+        name_map = matchString(mat_name_ls, folder_name_ls,
+                               normalize=config.MATERIAL_MATCH_NORMALIZE, one_to_one=config.MATERIAL_MATCH_ONE_TO_ONE)
+    
+    logger.material('    Matching result:')
+    for mat in mat_ls:
+        logger.material('        %s -> %s', mat.name, name_map[mat.name])
 
-    # do shading
-    shadeMaterial(mat, node_adder_cls)
\ No newline at end of file
+    return [(mat, Path(directory) / name_map[mat.name]) for mat in mat_ls]